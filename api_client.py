@@ -0,0 +1,252 @@
+"""
+Shared HTTP client for the cloud analysis API.
+
+One ApiClient per API_BASE_URL is shared by every LocalWorkflowController in
+the process. It keeps a pooled keep-alive session and uses separate connect
+and read timeouts. Connection errors, timeouts and 429/502/503/504 responses
+are retried with jittered exponential backoff for calls marked idempotent
+(safe to send twice). Other calls are only retried when the server certainly
+didn't act on them: the connection was never made, or the response was 429
+or 503. A circuit breaker fails calls
+fast while the API is down, and per-endpoint latency is recorded for
+latency_stats() and the api_call_seconds metric.
+"""
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+
+from metrics import observe
+
+API_CONNECT_TIMEOUT = float(os.getenv("API_CONNECT_TIMEOUT", "5"))
+API_READ_TIMEOUT = float(os.getenv("API_READ_TIMEOUT", "60"))
+API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "2"))
+API_POOL_SIZE = int(os.getenv("API_POOL_SIZE", "10"))
+API_BREAKER_THRESHOLD = int(os.getenv("API_BREAKER_THRESHOLD", "5"))
+API_BREAKER_RESET = float(os.getenv("API_BREAKER_RESET", "30"))
+
+RETRY_STATUSES = (429, 502, 503, 504)
+# Responses that say the request was not processed, so even non-idempotent calls can be sent again
+UNPROCESSED_STATUSES = (429, 503)
+LATENCY_SAMPLES = 500
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the API while the circuit breaker is open"""
+
+
+def never_reached_server(error):
+    """Whether a requests exception happened before the request was sent (refused or timed-out connect)"""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.ConnectionError) and isinstance(reason, (NewConnectionError, ConnectTimeoutError))
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a single trial call through after reset_timeout"""
+
+    def __init__(self, failure_threshold=API_BREAKER_THRESHOLD, reset_timeout=API_BREAKER_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                # A failed trial call keeps the circuit open for another reset_timeout
+                self.opened_at = time.monotonic()
+
+
+class ApiClient:
+    def __init__(self, base_url, connect_timeout=None, read_timeout=None, max_retries=None,
+                 backoff_base=0.5, pool_size=None, breaker=None):
+        """
+        Args:
+            base_url: API base URL (API_BASE_URL)
+            connect_timeout: Seconds to establish a connection (env API_CONNECT_TIMEOUT, default 5)
+            read_timeout: Seconds to wait for a response (env API_READ_TIMEOUT, default 60)
+            max_retries: Retries after a retryable failure (env API_MAX_RETRIES, default 2)
+            backoff_base: First retry delay in seconds, doubled on each attempt
+            pool_size: Keep-alive connections kept open (env API_POOL_SIZE, default 10)
+            breaker: CircuitBreaker to use (default: a new one from API_BREAKER_* settings)
+        """
+        self.base_url = base_url.rstrip("/")
+        self.connect_timeout = connect_timeout or API_CONNECT_TIMEOUT
+        self.read_timeout = read_timeout or API_READ_TIMEOUT
+        self.max_retries = API_MAX_RETRIES if max_retries is None else max_retries
+        self.backoff_base = backoff_base
+        self.breaker = breaker or CircuitBreaker()
+
+        pool_size = pool_size or API_POOL_SIZE
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._metrics = {}
+        self._metrics_lock = threading.Lock()
+
+    # ----- metrics -----
+
+    def _record(self, path, seconds, ok, retries):
+        observe("api_call_seconds", seconds, endpoint=path, outcome="ok" if ok else "error")
+        with self._metrics_lock:
+            metric = self._metrics.setdefault(path, {
+                "calls": 0, "errors": 0, "retries": 0, "latencies": deque(maxlen=LATENCY_SAMPLES)
+            })
+            metric["calls"] += 1
+            metric["retries"] += retries
+            if not ok:
+                metric["errors"] += 1
+            metric["latencies"].append(seconds)
+
+    def latency_stats(self):
+        """Calls, errors, retries and latency percentiles (seconds) per endpoint"""
+        stats = {}
+        with self._metrics_lock:
+            for path, metric in self._metrics.items():
+                latencies = sorted(metric["latencies"])
+                stats[path] = {
+                    "calls": metric["calls"],
+                    "errors": metric["errors"],
+                    "retries": metric["retries"],
+                    "avg": round(sum(latencies) / len(latencies), 3) if latencies else None,
+                    "p50": round(latencies[len(latencies) // 2], 3) if latencies else None,
+                    "p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 3) if latencies else None,
+                    "max": round(latencies[-1], 3) if latencies else None
+                }
+        stats["circuit"] = self.breaker.state
+        return stats
+
+    # ----- requests -----
+
+    def _backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        try:
+            return min(float(retry_after), 30.0)
+        except (TypeError, ValueError):
+            # Full jitter keeps retries from many workers from arriving together
+            return random.uniform(0, self.backoff_base * (2 ** attempt))
+
+    @staticmethod
+    def _rewind(data, files):
+        """Rewind a streamed data= body and file objects in a files= list so they can be sent again"""
+        if hasattr(data, "seek"):
+            data.seek(0)
+        for _, value in files or []:
+            handle = value[1] if isinstance(value, tuple) else value
+            if hasattr(handle, "seek"):
+                handle.seek(0)
+
+    def post(self, path, json=None, data=None, files=None, headers=None, read_timeout=None, idempotent=False):
+        """
+        POST to an API endpoint.
+
+        Args:
+            path: Endpoint path, e.g. "/api/llm/analyze-sector"
+            json, data, files, headers: Passed to requests (data may be a rewindable stream)
+            read_timeout: Override of the read timeout for slow endpoints
+            idempotent: Whether the call may be retried after any retryable failure; only
+                set it when sending the request twice is harmless. Failures the server
+                never acted on (no connection, 429, 503) are retried either way.
+
+        Returns:
+            The final requests.Response (callers check status_code)
+
+        Raises:
+            CircuitOpenError: The API has been failing and the breaker is open
+            requests.RequestException: The last attempt failed at the connection level
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit open for {self.base_url}: failing fast")
+
+        url = f"{self.base_url}{path}"
+        timeout = (self.connect_timeout, read_timeout or self.read_timeout)
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            response = None
+            error = None
+            try:
+                if attempt:
+                    self._rewind(data, files)
+                response = self.session.post(url, json=json, data=data, files=files, headers=headers, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            except Exception:
+                # Not the API's fault, but a half-open trial call must not stay pending
+                self.breaker.record_failure()
+                raise
+
+            if idempotent:
+                retryable = error is not None or response.status_code in RETRY_STATUSES
+            elif error is not None:
+                retryable = never_reached_server(error)
+            else:
+                retryable = response.status_code in UNPROCESSED_STATUSES
+            if not retryable or attempt >= self.max_retries:
+                break
+            time.sleep(self._backoff(attempt, response))
+            attempt += 1
+
+        # Server errors and connection failures count against the API; client errors don't
+        failed = error is not None or response.status_code >= 500
+        if failed:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        self._record(path, time.monotonic() - started, not failed, attempt)
+
+        if error is not None:
+            raise error
+        return response
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_api_client(base_url):
+    """Return the process-wide client for base_url, creating it on first use"""
+    with _clients_lock:
+        if base_url not in _clients:
+            _clients[base_url] = ApiClient(base_url)
+        return _clients[base_url]
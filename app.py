@@ -1,21 +1,36 @@
-from fastapi import FastAPI, BackgroundTasks, HTTPException
+from fastapi import FastAPI, HTTPException, Header
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from pydantic import BaseModel
-from typing import Optional, Dict
+from typing import Optional
 import uuid
 import json
 import os
+import asyncio
 from datetime import datetime
 from local_workflow import LocalWorkflowController
-import threading
+from job_queue import get_job_queue, STATUS_PENDING, STATUS_RUNNING, STATUS_COMPLETED, STATUS_FAILED
+from worker import WorkerPool
+from metrics import render_prometheus
+from selector_registry import get_selector_registry
 
 app = FastAPI(title="Instagram Scraper API", version="1.0.0")
 
-# In-memory task storage (in production, use Redis or database)
-tasks: Dict[str, dict] = {}
+# Tasks live in the durable job queue and are run by worker processes, not by the web process
+START_WORKERS = os.getenv("START_WORKERS", "true").lower() in ("1", "true", "yes")
+worker_pool: Optional[WorkerPool] = None
+
+# How often an event stream checks the job's event log, and how often it sends a keep-alive comment
+EVENT_STREAM_POLL_INTERVAL = float(os.getenv("EVENT_STREAM_POLL_INTERVAL", "0.5"))
+EVENT_STREAM_KEEPALIVE = float(os.getenv("EVENT_STREAM_KEEPALIVE", "15"))
 
 class TaskRequest(BaseModel):
     username: str
     use_saved_session: bool = True
+    max_competitors: Optional[int] = None  # Defaults to MAX_COMPETITORS
+    competitor_concurrency: Optional[int] = None  # Defaults to COMPETITOR_CONCURRENCY
+    force_refresh: bool = False  # Ignore cached profiles and scrape everything again
+    priority: int = 0  # Higher priority tasks are picked up first
+    coalesce: bool = True  # Attach to an in-flight scrape with the same username and options
 
 class TaskResponse(BaseModel):
     task_id: str
@@ -33,54 +48,21 @@ class TaskStatus(BaseModel):
     error: Optional[str] = None
     created_at: str
     completed_at: Optional[str] = None
+    leader_task_id: Optional[str] = None  # Set when attached to another task's scrape
 
-def run_scraping_task(task_id: str, username: str, use_saved_session: bool):
-    """Background task to run the scraping workflow"""
-    try:
-        # Update task status to running
-        tasks[task_id]["status"] = "running"
-        tasks[task_id]["progress"] = "Starting scraping process..."
-        
-        controller = LocalWorkflowController()
-        
-        if use_saved_session:
-            # Check if saved session exists
-            if not controller.check_saved_session():
-                tasks[task_id]["status"] = "failed"
-                tasks[task_id]["error"] = "No saved login session found. Please login first."
-                return
-            
-            tasks[task_id]["progress"] = "Using saved session to scrape profile..."
-            result = controller.run_local_workflow(username)
-        else:
-            tasks[task_id]["progress"] = "Manual login required..."
-            tasks[task_id]["status"] = "failed"
-            tasks[task_id]["error"] = "Manual login not supported in API mode. Please use saved session."
-            return
-        
-        if result:
-            # Extract queue_id from the result
-            queue_id = result.get('queue_id', None)
-            tasks[task_id]["queue_id"] = queue_id  # Store queue_id in task
-            
-            tasks[task_id]["status"] = "completed"
-            tasks[task_id]["result"] = {
-                "username": username,
-                "queue_id": queue_id,
-                "analysis_complete": True,
-                "sector": result.get('sector_analysis', {}).get('sector', 'Unknown'),
-                "competitors_found": len(result.get('competitors', [])),
-                "timestamp": result.get('timestamp')
-            }
-            tasks[task_id]["completed_at"] = datetime.now().isoformat()
-            tasks[task_id]["progress"] = f"Scraping completed successfully - Queue ID: {queue_id}"
-        else:
-            tasks[task_id]["status"] = "failed"
-            tasks[task_id]["error"] = "Scraping failed - check logs for details"
-            
-    except Exception as e:
-        tasks[task_id]["status"] = "failed"
-        tasks[task_id]["error"] = str(e)
+@app.on_event("startup")
+async def start_workers():
+    """Start the worker process pool unless workers are run separately (python worker.py)"""
+    global worker_pool
+    if START_WORKERS:
+        worker_pool = WorkerPool()
+        await asyncio.to_thread(worker_pool.start)
+
+@app.on_event("shutdown")
+async def stop_workers():
+    """Let the workers finish their current tasks and stop them"""
+    if worker_pool is not None:
+        await asyncio.to_thread(worker_pool.stop)
 
 @app.get("/")
 async def root():
@@ -89,52 +71,125 @@ async def root():
         "endpoints": {
             "create_task": "/api/scrape",
             "task_status": "/api/task/{task_id}",
+            "task_events": "/api/task/{task_id}/events",
             "login_status": "/api/login/status",
-            "health": "/health"
+            "health": "/health",
+            "metrics": "/metrics",
+            "selector_stats": "/api/selectors"
         }
     }
 
 @app.post("/api/scrape", response_model=TaskResponse)
-async def create_scraping_task(request: TaskRequest, background_tasks: BackgroundTasks):
+async def create_scraping_task(request: TaskRequest):
     """Create a new scraping task"""
     task_id = str(uuid.uuid4())[:8]  # Short task ID
+    queue = get_job_queue()
     
-    # Initialize task
-    tasks[task_id] = {
-        "task_id": task_id,
-        "queue_id": None,  # Will be populated when workflow starts
-        "username": request.username,
-        "status": "pending",
-        "progress": "Task created, waiting to start...",
-        "created_at": datetime.now().isoformat(),
-        "use_saved_session": request.use_saved_session
-    }
+    if request.use_saved_session:
+        # Queue the task for the workers
+        task = await asyncio.to_thread(
+            queue.enqueue,
+            task_id,
+            request.username,
+            payload={
+                "max_competitors": request.max_competitors,
+                "competitor_concurrency": request.competitor_concurrency,
+                "force_refresh": request.force_refresh
+            },
+            priority=request.priority,
+            progress="Task created, waiting to start...",
+            coalesce=request.coalesce
+        )
+    else:
+        task = await asyncio.to_thread(
+            queue.enqueue,
+            task_id,
+            request.username,
+            status=STATUS_FAILED,
+            progress="Manual login required...",
+            error="Manual login not supported in API mode. Please use saved session."
+        )
     
-    # Add background task
-    background_tasks.add_task(
-        run_scraping_task, 
-        task_id, 
-        request.username, 
-        request.use_saved_session
-    )
+    if task.get("leader_task_id"):
+        message = f"Scrape of @{request.username} already in progress - attached to task {task['leader_task_id']}"
+    else:
+        message = f"Scraping task created for @{request.username}"
     
     return TaskResponse(
         task_id=task_id,
-        queue_id=None,  # Queue ID not available yet
-        status="pending",
-        message=f"Scraping task created for @{request.username}",
-        created_at=tasks[task_id]["created_at"]
+        queue_id=task.get("queue_id"),  # Only known yet if attached to a leader that created its queue
+        status=task["status"],
+        message=message,
+        created_at=task["created_at"]
     )
 
 @app.get("/api/task/{task_id}", response_model=TaskStatus)
 async def get_task_status(task_id: str):
     """Get task status and results"""
-    if task_id not in tasks:
+    task = await asyncio.to_thread(get_job_queue().get, task_id)
+    if task is None:
         raise HTTPException(status_code=404, detail="Task not found")
     
-    task = tasks[task_id]
     return TaskStatus(**task)
 
+@app.get("/api/task/{task_id}/events")
+async def stream_task_events(task_id: str, after: int = 0, last_event_id: Optional[str] = Header(None)):
+    """
+    Stream a task's progress events as Server-Sent Events
+    
+    Each event carries its log id, so a client that reconnects (EventSource sends
+    Last-Event-ID) resumes where it left off. A final "done" event with the task
+    status is sent once the task has finished and its log is drained.
+    """
+    queue = get_job_queue()
+    if await asyncio.to_thread(queue.get, task_id) is None:
+        raise HTTPException(status_code=404, detail="Task not found")
+    
+    try:
+        after = max(after, int(last_event_id)) if last_event_id else after
+    except ValueError:
+        pass
+    
+    async def event_stream():
+        last_id = after
+        idle = 0.0
+        while True:
+            events = await asyncio.to_thread(queue.events, task_id, last_id)
+            for event in events:
+                last_id = event.pop("id")
+                yield f"id: {last_id}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+            if events:
+                idle = 0.0
+                continue
+            
+            task = await asyncio.to_thread(queue.get, task_id)
+            if task is None or task["status"] in (STATUS_COMPLETED, STATUS_FAILED):
+                # Workers write their last events before finishing the task; pick up any that
+                # landed between the two reads
+                for event in await asyncio.to_thread(queue.events, task_id, last_id, 100000):
+                    last_id = event.pop("id")
+                    yield f"id: {last_id}\nevent: {event['type']}\ndata: {json.dumps(event, default=str)}\n\n"
+                done = {
+                    "status": task["status"] if task else "deleted",
+                    "queue_id": task.get("queue_id") if task else None,
+                    "error": task.get("error") if task else None
+                }
+                yield f"event: done\ndata: {json.dumps(done)}\n\n"
+                return
+            
+            await asyncio.sleep(EVENT_STREAM_POLL_INTERVAL)
+            idle += EVENT_STREAM_POLL_INTERVAL
+            if idle >= EVENT_STREAM_KEEPALIVE:
+                # Keeps proxies from closing a quiet stream
+                idle = 0.0
+                yield ": keep-alive\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/login/status")
 async def check_login_status():
     """Check if Instagram login session exists"""
@@ -173,31 +228,61 @@ async def create_login_session():
     }
 
 @app.get("/api/tasks")
-async def list_all_tasks():
+async def list_all_tasks(status: Optional[str] = None):
     """List all tasks with their current status"""
+    task_list = await asyncio.to_thread(get_job_queue().list, status)
     return {
-        "tasks": list(tasks.values()),
-        "total_tasks": len(tasks)
+        "tasks": task_list,
+        "total_tasks": len(task_list)
     }
 
 @app.delete("/api/task/{task_id}")
 async def delete_task(task_id: str):
-    """Delete a task from memory"""
-    if task_id not in tasks:
+    """Delete a task from the queue"""
+    if not await asyncio.to_thread(get_job_queue().delete, task_id):
         raise HTTPException(status_code=404, detail="Task not found")
     
-    del tasks[task_id]
     return {"message": f"Task {task_id} deleted successfully"}
 
+@app.get("/api/selectors")
+async def selector_stats(field: Optional[str] = None):
+    """Hit rates of the fallback selectors per extracted field, best first, as learned by the workers"""
+    fields = await asyncio.to_thread(get_selector_registry().stats, field)
+    if field and not fields:
+        raise HTTPException(status_code=404, detail="No stats recorded for this field")
+    return {"fields": fields}
+
+@app.delete("/api/selectors")
+async def reset_selector_stats(field: Optional[str] = None):
+    """Forget learned selector stats (of one field, or all) so every selector is tried in its default order again"""
+    reset = await asyncio.to_thread(get_selector_registry().reset, field)
+    return {"message": f"Reset stats of {reset} selectors"}
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
+    queue = get_job_queue()
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "active_tasks": len([t for t in tasks.values() if t["status"] == "running"])
+        "active_tasks": await asyncio.to_thread(queue.count, STATUS_RUNNING),
+        "pending_tasks": await asyncio.to_thread(queue.count, STATUS_PENDING),
+        "workers_alive": worker_pool.alive() if worker_pool is not None else None
     }
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus metrics of the web process and every worker, plus task counts"""
+    queue = get_job_queue()
+    statuses = (STATUS_PENDING, STATUS_RUNNING, STATUS_COMPLETED, STATUS_FAILED)
+    counts = [await asyncio.to_thread(queue.count, status) for status in statuses]
+    gauges = {"tasks": ("Tasks in the job queue by status",
+                        [({"status": status}, count) for status, count in zip(statuses, counts)])}
+    if worker_pool is not None:
+        gauges["workers_alive"] = ("Worker processes currently alive", [({}, worker_pool.alive())])
+    return PlainTextResponse(await asyncio.to_thread(render_prometheus, gauges),
+                             media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,176 @@
+"""
+Compare browser profiles on real profile scrapes.
+
+Each profile runs in its own process with a fresh browser pool, scraping the
+same usernames with the saved login session. Reported per profile: wall time,
+bytes received by the browser, requests made and blocked, peak resident memory
+of the browser processes and their CPU time.
+
+Usage:
+    python benchmarks/compare_profiles.py nike natgeo --profiles interactive production --runs 2
+
+Results are printed as a table and written to output/benchmarks/browser_profiles.json.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_PATH = os.path.join("output", "benchmarks", "browser_profiles.json")
+
+
+def _descendants(pid):
+    """Process ids below pid (Linux /proc only)"""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "r") as f:
+                # The command name may contain spaces; fields after it are fixed
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    found, stack = [], [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            found.append(child)
+            stack.append(child)
+    return found
+
+
+def _rss_bytes(pids):
+    total = 0
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/statm", "r") as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+
+class MemorySampler(threading.Thread):
+    """Samples the summed RSS of this process's descendants (the browsers) until stopped"""
+
+    def __init__(self, interval=0.5):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = None if not os.path.isdir("/proc") else 0
+        self._done = threading.Event()
+
+    def run(self):
+        while self.peak is not None and not self._done.wait(self.interval):
+            self.peak = max(self.peak, _rss_bytes(_descendants(os.getpid())))
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def run_profile(profile, usernames, runs):
+    """Child process: scrape usernames under one browser profile and return its measurements"""
+    os.environ["BROWSER_PROFILE"] = profile
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    from browser_pool import get_browser_pool, close_browser_pool
+    from image_downloader import close_image_downloader
+    from insta_scraper_playwright import scrape_profile_async
+
+    traffic = {"requests": 0, "bytes": 0}
+
+    async def scrape_job(context, username):
+        async def on_finished(request):
+            traffic["requests"] += 1
+            try:
+                sizes = await request.sizes()
+                traffic["bytes"] += sizes["responseBodySize"] + sizes["responseHeadersSize"]
+            except Exception:
+                pass
+
+        context.on("requestfinished", on_finished)
+        page = await context.new_page()
+        return await scrape_profile_async(page, username,
+                                          image_dir_override=os.path.join("output", "benchmarks", "images", profile))
+
+    pool = get_browser_pool()
+    pool.start().result()
+    sampler = MemorySampler()
+    sampler.start()
+    scraped = 0
+    started = time.monotonic()
+    for _ in range(runs):
+        for username in usernames:
+            if pool.run(lambda context, username=username: scrape_job(context, username)):
+                scraped += 1
+    wall = time.monotonic() - started
+    sampler.stop()
+    result = {
+        "profile": profile,
+        "headless": pool.headless,
+        "scrapes": runs * len(usernames),
+        "succeeded": scraped,
+        "wall_seconds": round(wall, 2),
+        "seconds_per_scrape": round(wall / max(1, runs * len(usernames)), 2),
+        "requests_finished": traffic["requests"],
+        "requests_blocked": pool.requests_blocked,
+        "browser_mb_received": round(traffic["bytes"] / 1024 / 1024, 2),
+        "browser_peak_rss_mb": round(sampler.peak / 1024 / 1024, 1) if sampler.peak is not None else None
+    }
+    close_browser_pool()
+    close_image_downloader()
+    # Browsers have exited and been reaped, so their CPU time is in RUSAGE_CHILDREN
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    result["browser_cpu_seconds"] = round(usage.ru_utime + usage.ru_stime, 2)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare browser profiles on real profile scrapes")
+    parser.add_argument("usernames", nargs="+", help="Instagram usernames to scrape")
+    parser.add_argument("--profiles", nargs="+", default=["interactive", "production"])
+    parser.add_argument("--runs", type=int, default=1, help="Scrapes of each username per profile")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print("BENCHMARK_RESULT " + json.dumps(run_profile(args.child, args.usernames, args.runs)))
+        return
+
+    results = []
+    for profile in args.profiles:
+        print(f"⏱️  Benchmarking browser profile '{profile}'...")
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), *args.usernames, "--runs", str(args.runs), "--child", profile],
+            capture_output=True, text=True, cwd=ROOT
+        )
+        lines = [line for line in completed.stdout.splitlines() if line.startswith("BENCHMARK_RESULT ")]
+        if completed.returncode != 0 or not lines:
+            print(f"❌ Profile '{profile}' failed:\n{completed.stderr[-2000:]}")
+            continue
+        results.append(json.loads(lines[-1][len("BENCHMARK_RESULT "):]))
+
+    if not results:
+        return
+    columns = ["profile", "succeeded", "seconds_per_scrape", "requests_finished", "requests_blocked",
+               "browser_mb_received", "browser_peak_rss_mb", "browser_cpu_seconds"]
+    widths = [max(len(column), *(len(str(result[column])) for result in results)) for column in columns]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for result in results:
+        print("  ".join(str(result[column]).ljust(width) for column, width in zip(columns, widths)))
+
+    os.makedirs(os.path.dirname(os.path.join(ROOT, RESULTS_PATH)), exist_ok=True)
+    with open(os.path.join(ROOT, RESULTS_PATH), "w", encoding="utf-8") as f:
+        json.dump({"usernames": args.usernames, "runs": args.runs, "results": results}, f, indent=2)
+    print(f"📄 Results saved to {RESULTS_PATH}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,336 @@
+"""
+Synthetic Instagram fixtures for offline benchmarks.
+
+FixtureSite generates deterministic profiles - header, a lazily growing post
+grid, post pages, and the web_profile_info / feed JSON the response capture
+reads - and serves them to the browser through a Playwright context route,
+so the scraper runs unchanged against https://www.instagram.com URLs without
+touching the network. Post images point at the local StubServer, because the
+image downloader fetches them with requests rather than through the browser.
+
+Two page flavours exercise the two extraction paths:
+    network - the profile page fetches web_profile_info and feed pages, as Instagram does
+    dom     - no API traffic, so posts are found in the grid and opened in tabs
+"""
+import hashlib
+import html
+import json
+import random
+import re
+import struct
+import zlib
+from urllib.parse import urlparse, parse_qs
+
+MEDIA_TYPE_CODES = {"image": 1, "video": 2, "carousel": 8}
+GRID_PAGE_SIZE = 12
+
+
+def fixture_image(seed, size=60 * 1024, dimension=96):
+    """
+    A valid PNG of roughly `size` bytes with a pattern that differs per seed
+
+    The pixels are a seeded gradient; an ancillary chunk of random bytes pads the
+    file, so byte counts are realistic while any image library can still decode it.
+    """
+    rng = random.Random(seed)
+    a, b, c = (rng.randint(1, 7) for _ in range(3))
+    rows = []
+    for y in range(dimension):
+        row = bytearray([0])  # filter type 0 for every scanline
+        for x in range(dimension):
+            row += bytes(((x * a) % 256, (y * b) % 256, ((x + y) * c) % 256))
+        rows.append(bytes(row))
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    header = chunk(b"IHDR", struct.pack(">IIBBBBB", dimension, dimension, 8, 2, 0, 0, 0))
+    pixels = chunk(b"IDAT", zlib.compress(b"".join(rows), 6))
+    png = b"\x89PNG\r\n\x1a\n" + header + pixels
+    padding = max(0, size - len(png) - 12 - 12)
+    if padding:
+        png += chunk(b"bnCh", rng.randbytes(padding))
+    return png + chunk(b"IEND", b"")
+
+
+class FixtureProfile:
+    def __init__(self, username, posts=48, video_every=4, carousel_every=5, followers=125400, following=310,
+                 private=False):
+        """
+        Args:
+            username: Profile username
+            posts: Number of posts in the grid
+            video_every: Every nth post is a reel (0 for none)
+            carousel_every: Every nth post is a carousel (0 for none)
+            followers, following: Header counts
+            private: Serve the private-account page with no grid
+        """
+        self.username = username
+        self.full_name = f"{username.replace('_', ' ').title()} Official"
+        self.bio = f"Benchmark fixture for @{username} #bench #offline"
+        self.website = f"https://{username}.example.com/"
+        self.followers = followers
+        self.following = following
+        self.private = private
+        prefix = re.sub(r"[^A-Za-z0-9]", "", username)[:4].upper() or "BNCH"
+        self.posts = []
+        for index in range(posts):
+            if video_every and index % video_every == video_every - 1:
+                media_type = "video"
+            elif carousel_every and index % carousel_every == carousel_every - 1:
+                media_type = "carousel"
+            else:
+                media_type = "image"
+            self.posts.append({
+                "index": index,
+                "shortcode": f"{prefix}{index:05d}",
+                "media_id": str(int(hashlib.sha1(f"{username}:{index}".encode()).hexdigest()[:12], 16)),
+                "media_type": media_type,
+                "taken_at": 1760000000 - index * 86400,
+                "likes": 1000 + index * 37,
+                "comments": 20 + index,
+                "caption": f"Post {index} from {username} #bench #fixture{index % 3}"
+            })
+
+
+class FixtureSite:
+    def __init__(self, profiles, media_base_url, mode="network", image_size=60 * 1024):
+        """
+        Args:
+            profiles: List of FixtureProfile
+            media_base_url: Base URL of the StubServer serving /media/<name>.png
+            mode: "network" or "dom" (see module docstring)
+            image_size: Approximate bytes per fixture image
+        """
+        self.profiles = {profile.username.lower(): profile for profile in profiles}
+        self.media_base_url = media_base_url.rstrip("/")
+        self.mode = mode
+        self.image_size = image_size
+        self.blocker = None  # ResourceBlocker of the browser profile under test, if any
+        self.bytes_served = 0
+        self.requests_served = 0
+        self.requests_blocked = 0
+        self._images = {}
+
+    # ----- content -----
+
+    def image_url(self, profile, post):
+        return f"{self.media_base_url}/media/{profile.username}_{post['shortcode']}.png"
+
+    def image_bytes(self, name):
+        if name not in self._images:
+            self._images[name] = fixture_image(name, self.image_size)
+        return self._images[name]
+
+    def _graphql_node(self, profile, post):
+        node = {
+            "__typename": {"image": "GraphImage", "video": "GraphVideo", "carousel": "GraphSidecar"}[post["media_type"]],
+            "id": post["media_id"],
+            "shortcode": post["shortcode"],
+            "display_url": self.image_url(profile, post),
+            "is_video": post["media_type"] == "video",
+            "taken_at_timestamp": post["taken_at"],
+            "edge_liked_by": {"count": post["likes"]},
+            "edge_media_to_comment": {"count": post["comments"]},
+            "edge_media_to_caption": {"edges": [{"node": {"text": post["caption"]}}]},
+            "owner": {"username": profile.username}
+        }
+        if post["media_type"] == "carousel":
+            node["edge_sidecar_to_children"] = {"edges": [{"node": {"__typename": "GraphImage"}}]}
+        return node
+
+    def _v1_item(self, profile, post):
+        return {
+            "pk": post["media_id"],
+            "code": post["shortcode"],
+            "media_type": MEDIA_TYPE_CODES[post["media_type"]],
+            "product_type": "clips" if post["media_type"] == "video" else "feed",
+            "taken_at": post["taken_at"],
+            "like_count": post["likes"],
+            "comment_count": post["comments"],
+            "caption": {"text": post["caption"]},
+            "image_versions2": {"candidates": [{"url": self.image_url(profile, post), "width": 1080, "height": 1080}]},
+            "user": {"username": profile.username}
+        }
+
+    def profile_info(self, profile):
+        return {"data": {"user": {
+            "username": profile.username,
+            "full_name": profile.full_name,
+            "biography": profile.bio,
+            "external_url": profile.website,
+            "is_verified": True,
+            "is_private": profile.private,
+            "edge_followed_by": {"count": profile.followers},
+            "edge_follow": {"count": profile.following},
+            "edge_owner_to_timeline_media": {
+                "count": len(profile.posts),
+                "edges": [] if profile.private else [
+                    {"node": self._graphql_node(profile, post)} for post in profile.posts[:GRID_PAGE_SIZE]
+                ]
+            }
+        }}, "status": "ok"}
+
+    def feed_page(self, profile, max_id):
+        start = int(max_id or GRID_PAGE_SIZE)
+        items = profile.posts[start:start + GRID_PAGE_SIZE]
+        more = start + GRID_PAGE_SIZE < len(profile.posts)
+        return {
+            "items": [self._v1_item(profile, post) for post in items],
+            "more_available": more,
+            "next_max_id": str(start + GRID_PAGE_SIZE) if more else None,
+            "status": "ok"
+        }
+
+    def profile_html(self, profile):
+        name = html.escape(profile.username)
+        tiles = [] if profile.private else [{
+            "href": f"/{'reel' if post['media_type'] == 'video' else 'p'}/{post['shortcode']}/",
+            "src": self.image_url(profile, post),
+            "type": post["media_type"]
+        } for post in profile.posts]
+        private_block = "<h2>This Account is Private</h2>" if profile.private else ""
+        network = "true" if self.mode == "network" else "false"
+        return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{html.escape(profile.full_name)} (@{name}) &bull; Instagram photos and videos</title>
+<style>#grid {{ display: grid; grid-template-columns: repeat(3, 300px); gap: 4px; }} #grid a {{ display: block; height: 300px; }}
+#grid img {{ width: 300px; height: 300px; object-fit: cover; }}</style></head>
+<body><main>
+<header><section>
+<h2>{name}</h2>
+<ul><li><span>{len(profile.posts)} posts</span></li>
+<li><a href="/{name}/followers/"><span>{profile.followers}</span> followers</a></li>
+<li><a href="/{name}/following/"><span>{profile.following}</span> following</a></li></ul>
+<div class="_aa_c"><span>{html.escape(profile.full_name)}</span><h1>{html.escape(profile.bio)}</h1>
+<a rel="me nofollow" href="{html.escape(profile.website)}">{html.escape(profile.website)}</a>
+<span aria-label="Verified"></span></div>
+</section></header>
+{private_block}
+<article><div id="grid"></div></article>
+</main>
+<script>
+const USERNAME = {json.dumps(profile.username)};
+const TILES = {json.dumps(tiles)};
+const NETWORK = {network};
+const PAGE_SIZE = {GRID_PAGE_SIZE};
+const grid = document.getElementById('grid');
+let shown = 0, nextMaxId = String(PAGE_SIZE), loading = false;
+function showMore() {{
+    for (const tile of TILES.slice(shown, shown + PAGE_SIZE)) {{
+        const a = document.createElement('a');
+        a.href = tile.href;
+        let icon = '';
+        if (tile.type === 'video') icon = '<svg aria-label="Clip"></svg>';
+        if (tile.type === 'carousel') icon = '<svg aria-label="Carousel"></svg>';
+        a.innerHTML = '<div class="_aagv"><img alt="Photo by ' + USERNAME + '" src="' + tile.src + '"></div>' + icon;
+        grid.appendChild(a);
+    }}
+    shown = Math.min(TILES.length, shown + PAGE_SIZE);
+}}
+async function fetchMore() {{
+    if (!NETWORK || loading || !nextMaxId) return;
+    loading = true;
+    const response = await fetch('/api/v1/feed/user/' + USERNAME + '/?count=12&max_id=' + nextMaxId);
+    nextMaxId = (await response.json()).next_max_id;
+    loading = false;
+}}
+showMore();
+if (NETWORK) fetch('/api/v1/users/web_profile_info/?username=' + USERNAME);
+window.addEventListener('scroll', () => {{
+    if (window.innerHeight + window.scrollY >= document.body.scrollHeight - 400) {{
+        showMore();
+        fetchMore();
+    }}
+}});
+</script></body></html>"""
+
+    def post_html(self, profile, post):
+        date = post["taken_at"]
+        return f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>{html.escape(profile.username)} on Instagram</title></head>
+<body><main><article>
+<div role="button"><img alt="Photo by {html.escape(profile.username)}" src="{self.image_url(profile, post)}" sizes="600px"></div>
+{'<video src="' + self.image_url(profile, post) + '"></video>' if post['media_type'] == 'video' else ''}
+<div class="_a9zs"><h1>{html.escape(post['caption'])}</h1></div>
+<section><span aria-label="like"></span><span class="_aap9">{post['likes']} likes</span></section>
+<ul><li><span class="_acbn">View all {post['comments']} comments</span></li></ul>
+<time datetime="{_iso(date)}">{_iso(date)}</time>
+</article></main></body></html>"""
+
+    def not_found_html(self):
+        return ("<!DOCTYPE html><html><head><title>Page Not Found &bull; Instagram</title></head>"
+                "<body><main><header></header><span>Sorry, this page isn't available.</span></main></body></html>")
+
+    # ----- routing -----
+
+    def _find_post(self, shortcode):
+        for profile in self.profiles.values():
+            for post in profile.posts:
+                if post["shortcode"] == shortcode:
+                    return profile, post
+        return None, None
+
+    def respond(self, url):
+        """Return (status, content_type, body bytes) for a browser request"""
+        parsed = urlparse(url)
+        path = parsed.path
+        query = parse_qs(parsed.query)
+        if parsed.netloc.split(":")[0] in ("127.0.0.1", "localhost") and path.startswith("/media/"):
+            name = path[len("/media/"):].rsplit(".", 1)[0]
+            return 200, "image/png", self.image_bytes(name)
+        if not parsed.netloc.endswith("instagram.com"):
+            return 404, "text/plain", b""
+
+        if path.startswith("/api/v1/users/web_profile_info"):
+            profile = self.profiles.get((query.get("username") or [""])[0].lower())
+            if profile is None:
+                return 404, "application/json", b'{"status": "fail"}'
+            return 200, "application/json; charset=utf-8", json.dumps(self.profile_info(profile)).encode()
+        match = re.match(r"^/api/v1/feed/user/([^/]+)/", path)
+        if match:
+            profile = self.profiles.get(match.group(1).lower())
+            if profile is None:
+                return 404, "application/json", b'{"status": "fail"}'
+            body = self.feed_page(profile, (query.get("max_id") or [None])[0])
+            return 200, "application/json; charset=utf-8", json.dumps(body).encode()
+        match = re.match(r"^/(?:p|reel|tv)/([^/]+)/?", path)
+        if match:
+            profile, post = self._find_post(match.group(1))
+            if post is None:
+                return 404, "text/html; charset=utf-8", self.not_found_html().encode()
+            return 200, "text/html; charset=utf-8", self.post_html(profile, post).encode()
+        match = re.match(r"^/([^/]+)/?$", path)
+        if match and match.group(1).lower() in self.profiles:
+            return 200, "text/html; charset=utf-8", self.profile_html(self.profiles[match.group(1).lower()]).encode()
+        if path in ("", "/"):
+            return 200, "text/html; charset=utf-8", b"<!DOCTYPE html><html><body><main>Home</main></body></html>"
+        return 404, "text/html; charset=utf-8", self.not_found_html().encode()
+
+    async def handle_route(self, route):
+        """Playwright route handler: fulfil every request from the fixtures"""
+        request = route.request
+        try:
+            if self.blocker is not None and self.blocker.should_block(request):
+                self.requests_blocked += 1
+                await route.abort("blockedbyclient")
+                return
+            status, content_type, body = self.respond(request.url)
+            self.requests_served += 1
+            self.bytes_served += len(body)
+            await route.fulfill(status=status, content_type=content_type, body=body)
+        except Exception:
+            # The page closed while the request was being answered
+            pass
+
+
+def _iso(unix_ts):
+    from datetime import datetime, timezone
+    return datetime.fromtimestamp(unix_ts, tz=timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def default_profiles(count=3, posts=48):
+    """A product profile plus competitors, named bench_brand, bench_rival1, ..."""
+    profiles = [FixtureProfile("bench_brand", posts=posts)]
+    for index in range(1, count):
+        profiles.append(FixtureProfile(f"bench_rival{index}", posts=posts, video_every=3 + index % 2))
+    return profiles
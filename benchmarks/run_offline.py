@@ -0,0 +1,266 @@
+"""
+Offline benchmark: scrape fixture profiles end to end without Instagram or the cloud API.
+
+Every browser context is routed to a FixtureSite (synthetic profile pages,
+post pages and the web_profile_info/feed JSON), images come from a local
+StubServer, and the workflow's cloud endpoints are answered by the same stub.
+Recorded HAR files can be replayed instead of, or on top of, the synthetic
+pages with --har; anything not in the recording falls back to the fixtures.
+Record one with: playwright open --save-har=nike.har https://www.instagram.com/nike/
+
+Scenarios:
+    scrape   - scrape_profile_pooled() of every username
+    workflow - run_local_workflow() of the first username, with the others as competitors
+
+Each scenario, browser profile and page mode runs in its own process in a
+scratch directory, so caches, sessions and queue directories never leak
+between runs. Reported per run: wall time, page opens, navigations, locator
+calls, other DOM round trips, bytes the browser loaded, image bytes
+downloaded, cloud requests, and the peak RSS of the browsers and of Python.
+
+Usage:
+    python benchmarks/run_offline.py
+    python benchmarks/run_offline.py --scenarios scrape --profiles interactive production --modes dom --runs 3
+    python benchmarks/run_offline.py --har nike.har --usernames nike --scenarios scrape
+
+Results are printed as a table and written to output/benchmarks/offline.json.
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from compare_profiles import MemorySampler
+from fixtures import FixtureSite, FixtureProfile, default_profiles
+from stub_server import StubServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_PATH = os.path.join("output", "benchmarks", "offline.json")
+
+# Playwright calls counted per run: (class name, method, counter)
+INSTRUMENTED_CALLS = [
+    ("BrowserContext", "new_page", "page_opens"),
+    ("Page", "goto", "navigations"),
+    ("Page", "locator", "locator_calls"),
+    ("Locator", "locator", "locator_calls"),
+    ("Page", "query_selector", "locator_calls"),
+    ("Page", "query_selector_all", "locator_calls"),
+    ("Page", "evaluate", "dom_round_trips"),
+    ("Page", "wait_for_selector", "dom_round_trips"),
+    ("Locator", "count", "dom_round_trips"),
+    ("Locator", "all", "dom_round_trips"),
+    ("Locator", "get_attribute", "dom_round_trips"),
+    ("Locator", "text_content", "dom_round_trips"),
+    ("Locator", "inner_text", "dom_round_trips"),
+    ("Locator", "evaluate", "dom_round_trips"),
+    ("Locator", "evaluate_all", "dom_round_trips"),
+    ("Locator", "is_visible", "dom_round_trips"),
+]
+
+
+def instrument_playwright(counters, site, har_path=None):
+    """
+    Count Playwright calls and route every new browser context to the fixtures
+
+    The wrappers are installed on the playwright.async_api classes, so the
+    scraper code runs unmodified.
+    """
+    import playwright.async_api as api
+
+    def counting(cls, name, counter):
+        original = getattr(cls, name)
+        counters.setdefault(counter, 0)
+        if asyncio.iscoroutinefunction(original):
+            async def wrapper(self, *args, **kwargs):
+                counters[counter] += 1
+                return await original(self, *args, **kwargs)
+        else:
+            def wrapper(self, *args, **kwargs):
+                counters[counter] += 1
+                return original(self, *args, **kwargs)
+        setattr(cls, name, functools.wraps(original)(wrapper))
+
+    for class_name, method, counter in INSTRUMENTED_CALLS:
+        counting(getattr(api, class_name), method, counter)
+
+    new_context = api.Browser.new_context
+
+    @functools.wraps(new_context)
+    async def routed_new_context(self, *args, **kwargs):
+        context = await new_context(self, *args, **kwargs)
+        # Registered before the pool installs its blocker, so the blocker's narrower route still wins
+        await context.route("**/*", site.handle_route)
+        if har_path:
+            await context.route_from_har(har_path, not_found="fallback")
+        return context
+
+    api.Browser.new_context = routed_new_context
+
+
+def run_child(scenario, profile, mode, usernames, runs, har_path=None, incremental=False, image_kb=60,
+              cloud_latency=0.0, keep=False):
+    """Child process: run one scenario in a scratch directory and return its measurements"""
+    workdir = tempfile.mkdtemp(prefix="insta-offline-bench-")
+    try:
+        os.chdir(workdir)
+        # A stand-in session, so the scraper never tries to log in
+        os.makedirs("playwright_profile", exist_ok=True)
+        with open(os.path.join("playwright_profile", "state.json"), "w", encoding="utf-8") as f:
+            json.dump({"cookies": [], "origins": []}, f)
+
+        stub = StubServer(competitors=usernames[1:], latency=cloud_latency).start()
+        fixture_profiles = [p for p in default_profiles(len(usernames)) if p.username in usernames]
+        fixture_profiles += [FixtureProfile(u) for u in usernames if u not in {p.username for p in fixture_profiles}]
+        site = FixtureSite(fixture_profiles, stub.base_url, mode=mode, image_size=image_kb * 1024)
+        stub.site = site
+
+        os.environ["BROWSER_PROFILE"] = profile
+        os.environ["API_BASE_URL"] = stub.base_url
+        sys.path.insert(0, ROOT)
+        from browser_profiles import get_browser_profile, ResourceBlocker
+        from browser_pool import get_browser_pool, close_browser_pool
+        from image_downloader import close_image_downloader
+        from insta_scraper_playwright import scrape_profile_pooled
+        from local_workflow import LocalWorkflowController
+
+        browser_profile = get_browser_profile(profile)
+        if browser_profile["block_resource_types"] or browser_profile["block_tracking"]:
+            # The fixture route sees every request, including the local images the pool's blocker never matches
+            site.blocker = ResourceBlocker(browser_profile["block_resource_types"], browser_profile["block_tracking"])
+        counters = {}
+        instrument_playwright(counters, site, har_path)
+
+        pool = get_browser_pool()
+        pool.start().result()
+        sampler = MemorySampler(interval=0.2)
+        sampler.start()
+        succeeded, posts = 0, 0
+        started = time.monotonic()
+        for run in range(runs):
+            if scenario == "scrape":
+                for username in usernames:
+                    profile_data = scrape_profile_pooled(username, incremental=incremental and run > 0)
+                    if profile_data:
+                        succeeded += 1
+                        posts += len(profile_data.get("posts", []))
+            else:
+                result = LocalWorkflowController().run_local_workflow(
+                    usernames[0], upload_to_s3=True, force_refresh=not (incremental and run > 0)
+                )
+                if result:
+                    succeeded += 1
+                    posts += len(result.get("competitors", []))
+        wall = time.monotonic() - started
+        sampler.stop()
+        close_browser_pool()
+        close_image_downloader()
+        stub.stop()
+
+        cloud = stub.summary()
+        result = {
+            "scenario": scenario,
+            "profile": profile,
+            "mode": "har" if har_path else mode,
+            "runs": runs,
+            "succeeded": succeeded,
+            # Posts scraped (scrape) or competitors analysed (workflow)
+            "items": posts,
+            "wall_seconds": round(wall, 2),
+            "seconds_per_run": round(wall / max(1, runs), 2),
+            "page_opens": counters["page_opens"],
+            "navigations": counters["navigations"],
+            "locator_calls": counters["locator_calls"],
+            "dom_round_trips": counters["dom_round_trips"],
+            "browser_requests": site.requests_served,
+            "browser_requests_blocked": site.requests_blocked + pool.requests_blocked,
+            "browser_kb": round(site.bytes_served / 1024, 1),
+            "images_downloaded_kb": round(cloud["bytes_by_path"].get("/media/", 0) / 1024, 1),
+            "cloud_requests": sum(count for path, count in cloud["requests"].items() if path.startswith("/api/")),
+            "uploaded_kb": round(cloud["bytes_received"] / 1024, 1),
+            "browser_peak_rss_mb": round(sampler.peak / 1024 / 1024, 1) if sampler.peak is not None else None,
+            # ru_maxrss is in kilobytes on Linux
+            "python_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+        }
+        if keep:
+            result["workdir"] = workdir
+        return result
+    finally:
+        os.chdir(ROOT)
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scraper offline against fixture pages")
+    parser.add_argument("--scenarios", nargs="+", default=["scrape", "workflow"], choices=["scrape", "workflow"])
+    parser.add_argument("--profiles", nargs="+", default=["production"], help="Browser profiles to compare")
+    parser.add_argument("--modes", nargs="+", default=["network", "dom"], choices=["network", "dom"],
+                        help="Fixture page flavour: with API traffic for the response capture, or DOM only")
+    parser.add_argument("--usernames", nargs="+", default=[p.username for p in default_profiles()],
+                        help="Profiles to scrape; the first is the workflow's product, the rest its competitors")
+    parser.add_argument("--runs", type=int, default=1)
+    parser.add_argument("--incremental", action="store_true", help="Scrape incrementally after the first run")
+    parser.add_argument("--har", help="Replay this HAR recording, falling back to the fixtures")
+    parser.add_argument("--image-kb", type=int, default=60, help="Size of each fixture image")
+    parser.add_argument("--cloud-latency", type=float, default=0.0, help="Seconds the stub cloud API waits per call")
+    parser.add_argument("--keep", action="store_true", help="Keep each run's scratch directory")
+    parser.add_argument("--child", nargs=3, metavar=("SCENARIO", "PROFILE", "MODE"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    har_path = os.path.abspath(args.har) if args.har else None
+
+    if args.child:
+        scenario, profile, mode = args.child
+        print("BENCHMARK_RESULT " + json.dumps(run_child(
+            scenario, profile, mode, args.usernames, args.runs, har_path=har_path, incremental=args.incremental,
+            image_kb=args.image_kb, cloud_latency=args.cloud_latency, keep=args.keep
+        )))
+        return
+
+    results = []
+    modes = ["har"] if har_path else args.modes
+    for scenario in args.scenarios:
+        for profile in args.profiles:
+            for mode in modes:
+                print(f"⏱️  Benchmarking {scenario} with browser profile '{profile}' ({mode} fixtures)...")
+                command = [sys.executable, os.path.abspath(__file__), "--usernames", *args.usernames,
+                           "--runs", str(args.runs), "--image-kb", str(args.image_kb),
+                           "--cloud-latency", str(args.cloud_latency), "--child", scenario, profile,
+                           "network" if mode == "har" else mode]
+                if har_path:
+                    command += ["--har", har_path]
+                if args.incremental:
+                    command.append("--incremental")
+                if args.keep:
+                    command.append("--keep")
+                completed = subprocess.run(command, capture_output=True, text=True, cwd=ROOT)
+                lines = [line for line in completed.stdout.splitlines() if line.startswith("BENCHMARK_RESULT ")]
+                if completed.returncode != 0 or not lines:
+                    print(f"❌ {scenario}/{profile}/{mode} failed:\n{completed.stderr[-2000:]}")
+                    continue
+                results.append(json.loads(lines[-1][len("BENCHMARK_RESULT "):]))
+
+    if not results:
+        return
+    columns = ["scenario", "profile", "mode", "succeeded", "items", "seconds_per_run", "page_opens", "locator_calls",
+               "dom_round_trips", "browser_kb", "images_downloaded_kb", "cloud_requests", "browser_peak_rss_mb",
+               "python_peak_rss_mb"]
+    widths = [max(len(column), *(len(str(result[column])) for result in results)) for column in columns]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for result in results:
+        print("  ".join(str(result[column]).ljust(width) for column, width in zip(columns, widths)))
+
+    os.makedirs(os.path.dirname(os.path.join(ROOT, RESULTS_PATH)), exist_ok=True)
+    with open(os.path.join(ROOT, RESULTS_PATH), "w", encoding="utf-8") as f:
+        json.dump({"usernames": args.usernames, "runs": args.runs, "results": results}, f, indent=2)
+    print(f"📄 Results saved to {RESULTS_PATH}")
+
+
+if __name__ == "__main__":
+    main()
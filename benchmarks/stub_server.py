@@ -0,0 +1,137 @@
+"""
+Local stand-in for the cloud API and the Instagram image CDN.
+
+StubServer runs a threaded HTTP server on 127.0.0.1 that answers the four
+cloud endpoints the workflow calls with canned responses, and serves the
+fixture images the downloader fetches. Request and byte counts are kept per
+path so a benchmark can report what a run sent and received.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubServer:
+    def __init__(self, site=None, competitors=None, sector="Benchmark Apparel", latency=0.0):
+        """
+        Args:
+            site: FixtureSite whose images are served under /media/
+            competitors: Usernames returned by /api/search-competitors
+            sector: Sector returned by /api/llm/analyze-sector
+            latency: Seconds each cloud call waits before answering, to mimic the real service
+        """
+        self.site = site
+        self.competitors = list(competitors or [])
+        self.sector = sector
+        self.latency = latency
+        self.counts = {}  # requests per path; all images count under /media/
+        self.bytes_by_path = {}  # response bytes per path
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, content_type, body):
+                # Counted before the body goes out, so a client never sees a response that isn't counted yet
+                stub._record(self.path.split("?")[0], 0, len(body))
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                path = self.path.split("?")[0]
+                if path.startswith("/media/") and stub.site is not None:
+                    self._reply(200, "image/png", stub.site.image_bytes(path[len("/media/"):].rsplit(".", 1)[0]))
+                else:
+                    self._reply(404, "application/json", b'{"detail": "Not Found"}')
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                remaining = length
+                payload = b""
+                while remaining > 0:
+                    chunk = self.rfile.read(min(remaining, 64 * 1024))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    if self.headers.get("Content-Type", "").startswith("application/json"):
+                        payload += chunk
+                stub._record(None, length, 0)
+                if stub.latency:
+                    threading.Event().wait(stub.latency)
+                body = stub.respond(self.path.split("?")[0], payload)
+                if body is None:
+                    self._reply(404, "application/json", b'{"detail": "Not Found"}')
+                else:
+                    self._reply(200, "application/json", json.dumps(body).encode())
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="stub-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def _record(self, path, received, sent):
+        with self._lock:
+            if path is not None:
+                path = "/media/" if path.startswith("/media/") else path
+                self.counts[path] = self.counts.get(path, 0) + 1
+                self.bytes_by_path[path] = self.bytes_by_path.get(path, 0) + sent
+            self.bytes_received += received
+            self.bytes_sent += sent
+
+    def respond(self, path, payload):
+        """Canned response body of a cloud endpoint (None for an unknown path)"""
+        try:
+            request = json.loads(payload) if payload else {}
+        except ValueError:
+            request = {}
+        if path == "/api/llm/analyze-sector":
+            return {"sector": self.sector, "keywords": ["benchmark", "fixture", "apparel"], "confidence": 0.9}
+        if path == "/api/search-competitors":
+            exclude = request.get("exclude_username", "")
+            usernames = [username for username in self.competitors if username != exclude]
+            return {
+                "instagram_usernames": usernames,
+                "results": [{"title": username, "link": f"https://www.instagram.com/{username}/"}
+                            for username in usernames]
+            }
+        if path == "/api/description/analyze-descriptions":
+            competitors = request.get("competitor_profiles") or []
+            return {"summary": f"Compared against {len(competitors)} competitors", "insights": []}
+        if path == "/api/s3/upload-files":
+            return {"status": "success", "message": "Stored by the benchmark stub"}
+        return None
+
+    def summary(self):
+        with self._lock:
+            return {
+                "requests": dict(self.counts),
+                "bytes_by_path": dict(self.bytes_by_path),
+                "bytes_sent": self.bytes_sent,
+                "bytes_received": self.bytes_received
+            }
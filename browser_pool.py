@@ -0,0 +1,292 @@
+"""
+Process-wide pool of warm Chromium browsers.
+
+The pool owns a dedicated event loop thread running the async Playwright API,
+so it can be shared by sync callers (CLI, FastAPI worker threads) and by
+coroutines running on other event loops. Jobs are coroutine functions that
+receive a fresh BrowserContext with the saved Instagram login state preloaded;
+several jobs run concurrently on the pool's loop, spread across the browsers.
+Browsers are relaunched after a configurable number of uses or when they crash.
+
+How browsers are launched and what contexts load is set by a browser profile
+(see browser_profiles): the headed "interactive" profile or the headless,
+resource-blocking "production" profile.
+"""
+import asyncio
+import atexit
+import json
+import os
+import threading
+from contextlib import asynccontextmanager
+
+from playwright.async_api import async_playwright
+
+from browser_profiles import get_browser_profile, apply_browser_profile
+from metrics import timer
+
+STATE_PATH = "playwright_profile/state.json"
+
+
+class _PooledBrowser:
+    def __init__(self, slot_id):
+        self.slot_id = slot_id
+        self.browser = None
+        self.uses = 0
+        self.active = 0
+        self.launch_lock = asyncio.Lock()
+
+    def is_alive(self):
+        return self.browser is not None and self.browser.is_connected()
+
+
+class BrowserPool:
+    def __init__(self, size=None, max_uses=None, contexts_per_browser=None, headless=None,
+                 storage_state=STATE_PATH, launch_options=None, context_options=None, profile=None):
+        """
+        Args:
+            size: Number of warm browsers (env BROWSER_POOL_SIZE, default 2)
+            max_uses: Contexts served by a browser before it is relaunched (env BROWSER_MAX_USES, default 25)
+            contexts_per_browser: Concurrent contexts per browser (env BROWSER_CONTEXTS_PER_BROWSER, default 2)
+            headless: Launch headless browsers (default: the profile's setting)
+            storage_state: Path of the saved login state loaded into every context
+            launch_options: Extra keyword arguments for chromium.launch()
+            context_options: Default keyword arguments for browser.new_context()
+            profile: Browser profile name (env BROWSER_PROFILE, default "interactive")
+        """
+        self.size = size or int(os.getenv("BROWSER_POOL_SIZE", "2"))
+        self.max_uses = max_uses or int(os.getenv("BROWSER_MAX_USES", "25"))
+        self.contexts_per_browser = contexts_per_browser or int(os.getenv("BROWSER_CONTEXTS_PER_BROWSER", "2"))
+        self.profile = get_browser_profile(profile)
+        self.headless = self.profile["headless"] if headless is None else headless
+        self.storage_state = storage_state
+        self.launch_options = dict(launch_options or {})
+        if self.profile["launch_args"]:
+            self.launch_options["args"] = self.profile["launch_args"] + list(self.launch_options.get("args", []))
+        self.context_options = dict(self.profile["context_options"])
+        self.context_options.update(context_options or {})
+
+        # Requests aborted/let through by the profile's resource blocker, over all contexts
+        self.requests_blocked = 0
+        self.requests_allowed = 0
+
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._closed = False
+
+        # Created lazily on the pool's loop
+        self._playwright = None
+        self._browsers = []
+        self._slots = None
+        self._start_lock = None
+
+        # Parsed storage state, reloaded whenever the file on disk changes
+        self._state_cache = None
+        self._state_mtime = None
+
+    # ----- lifecycle -----
+
+    def start(self):
+        """
+        Start the pool's loop thread and launch the browsers.
+
+        Returns:
+            concurrent.futures.Future that resolves once the browsers are up
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Browser pool has been closed")
+            if self._thread is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name="browser-pool", daemon=True)
+                self._thread.start()
+        return asyncio.run_coroutine_threadsafe(self._ensure_started(), self._loop)
+
+    def close(self):
+        """Close all browsers and stop the pool's loop thread"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            loop, thread = self._loop, self._thread
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), loop).result(timeout=30)
+        except Exception as e:
+            print(f"⚠️  Browser pool: error during shutdown: {str(e)}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout=30)
+
+    async def _ensure_started(self):
+        if self._start_lock is None:
+            self._start_lock = asyncio.Lock()
+        async with self._start_lock:
+            if self._playwright is not None:
+                return
+            self._playwright = await async_playwright().start()
+            self._slots = asyncio.Semaphore(self.size * self.contexts_per_browser)
+            self._browsers = [_PooledBrowser(slot_id) for slot_id in range(self.size)]
+            results = await asyncio.gather(
+                *(self._ensure_browser(slot) for slot in self._browsers),
+                return_exceptions=True
+            )
+            for slot, result in zip(self._browsers, results):
+                if isinstance(result, Exception):
+                    print(f"❌ Browser pool: launch failed for browser #{slot.slot_id}: {str(result)}")
+
+    async def _shutdown(self):
+        for slot in self._browsers:
+            if slot.browser is not None:
+                try:
+                    await slot.browser.close()
+                except Exception:
+                    pass
+                slot.browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    # ----- contexts -----
+
+    def _load_storage_state(self):
+        """Return the saved login state, re-reading the file only when it changes"""
+        if not self.storage_state or not os.path.exists(self.storage_state):
+            return None
+        try:
+            mtime = os.path.getmtime(self.storage_state)
+            if self._state_cache is None or mtime != self._state_mtime:
+                with open(self.storage_state, "r", encoding="utf-8") as f:
+                    self._state_cache = json.load(f)
+                self._state_mtime = mtime
+        except Exception as e:
+            print(f"⚠️  Could not load storage state: {str(e)}")
+            return None
+        return self._state_cache
+
+    def _context_kwargs(self, overrides):
+        kwargs = dict(self.context_options)
+        kwargs.update(overrides)
+        if self.profile["pin_context_options"]:
+            kwargs.update(self.profile["context_options"])
+        if "storage_state" not in kwargs:
+            state = self._load_storage_state()
+            if state is not None:
+                kwargs["storage_state"] = state
+        return kwargs
+
+    async def _ensure_browser(self, slot):
+        """Launch or recycle the browser in a slot when it is missing, crashed or worn out"""
+        async with slot.launch_lock:
+            worn_out = slot.uses >= self.max_uses and slot.active == 0
+            if slot.is_alive() and not worn_out:
+                return slot.browser
+            if slot.browser is not None:
+                if not slot.browser.is_connected():
+                    print(f"⚠️  Browser pool: browser #{slot.slot_id} crashed, relaunching")
+                try:
+                    await slot.browser.close()
+                except Exception:
+                    pass
+            print(f"🌐 Browser pool: launching browser #{slot.slot_id}")
+            with timer("browser_launch_seconds"):
+                slot.browser = await self._playwright.chromium.launch(headless=self.headless, **self.launch_options)
+            slot.uses = 0
+            return slot.browser
+
+    @asynccontextmanager
+    async def checkout(self, **context_overrides):
+        """
+        Check out a fresh browser context; must be used on the pool's event loop.
+
+        Args:
+            **context_overrides: Keyword arguments merged into browser.new_context()
+        """
+        await self._ensure_started()
+        async with self._slots:
+            slot = min(self._browsers, key=lambda s: (not s.is_alive(), s.active))
+            browser = await self._ensure_browser(slot)
+            slot.active += 1
+            slot.uses += 1
+            context = None
+            blocker = None
+            try:
+                context = await browser.new_context(**self._context_kwargs(context_overrides))
+                blocker = await apply_browser_profile(context, self.profile)
+                yield context
+            finally:
+                slot.active -= 1
+                if context is not None:
+                    try:
+                        await context.close()
+                    except Exception:
+                        pass
+                if blocker is not None:
+                    self.requests_blocked += blocker.blocked
+                    self.requests_allowed += blocker.allowed
+
+    # ----- running jobs -----
+
+    def _on_pool_loop(self):
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    async def _run_job(self, job, context_overrides):
+        async with self.checkout(**context_overrides) as context:
+            return await job(context)
+
+    def submit(self, job, **context_overrides):
+        """
+        Schedule a job on the pool's loop.
+
+        Args:
+            job: Coroutine function taking a BrowserContext
+            **context_overrides: Keyword arguments merged into browser.new_context()
+
+        Returns:
+            concurrent.futures.Future for the job's result
+        """
+        self.start()
+        return asyncio.run_coroutine_threadsafe(self._run_job(job, context_overrides), self._loop)
+
+    def run(self, job, timeout=None, **context_overrides):
+        """Run a job on the pool and block until it finishes (for sync callers)"""
+        if self._on_pool_loop():
+            raise RuntimeError("BrowserPool.run() would block the pool loop; use run_async()")
+        return self.submit(job, **context_overrides).result(timeout=timeout)
+
+    async def run_async(self, job, **context_overrides):
+        """Run a job on the pool from any event loop"""
+        if self._on_pool_loop():
+            return await self._run_job(job, context_overrides)
+        return await asyncio.wrap_future(self.submit(job, **context_overrides))
+
+    def run_coroutine(self, coro, timeout=None):
+        """Run an arbitrary coroutine on the pool's loop and block until it finishes"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(timeout=timeout)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool():
+    """Return the process-wide browser pool, creating it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+            atexit.register(_pool.close)
+        return _pool
+
+
+def close_browser_pool():
+    """Close the process-wide browser pool if it was created"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
@@ -0,0 +1,150 @@
+"""
+Browser profiles for the browser pool.
+
+"interactive" is the original setup: a headed browser that loads everything,
+handy when watching a scrape locally. "production" is meant for servers:
+headless Chromium, a smaller viewport, reduced motion with CSS animations and
+transitions switched off, and request routing that aborts what the
+extractors never look at - fonts, video, image bytes and analytics/logging
+beacons. Documents, scripts, stylesheets and the XHR/GraphQL traffic read by
+the response capture still go through. Image URLs are read from the DOM and
+fetched by the image downloader, so the browser never needs the image bytes.
+
+BROWSER_PROFILE selects the profile (default "interactive"). BROWSER_HEADLESS
+still overrides the profile's headless setting, and BROWSER_BLOCK_RESOURCES
+(comma separated resource types) its blocked resource types.
+"""
+import os
+import re
+
+BROWSER_PROFILE = os.getenv("BROWSER_PROFILE", "interactive")
+
+# Hosts of the requests a profile may block. Only these are routed through the
+# blocker, so first-party documents and API calls never pay for a route round-trip.
+BLOCKABLE_URL_PATTERN = re.compile(
+    r"^https?://([^/]*\.)?(cdninstagram\.com|fbcdn\.net|google-analytics\.com|googletagmanager\.com"
+    r"|doubleclick\.net|connect\.facebook\.net|facebook\.com|instagram\.com/(logging|ajax/bz|api/v1/web/logging))"
+)
+# Analytics and logging beacons, blocked whatever their resource type
+TRACKING_URL_MARKERS = (
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "connect.facebook.net",
+    "facebook.com/tr", "/logging_client_events", "/ajax/bz", "/ajax/logging", "/api/v1/web/logging"
+)
+
+DISABLE_ANIMATIONS_SCRIPT = """
+(() => {
+    const css = '*, *::before, *::after { animation: none !important; transition: none !important; ' +
+                'scroll-behavior: auto !important; caret-color: transparent !important; }';
+    const install = () => {
+        const style = document.createElement('style');
+        style.textContent = css;
+        (document.head || document.documentElement).appendChild(style);
+    };
+    if (document.documentElement) {
+        install();
+    } else {
+        document.addEventListener('DOMContentLoaded', install, {once: true});
+    }
+})();
+"""
+
+PROFILES = {
+    "interactive": {
+        "headless": False,
+        "launch_args": [],
+        "context_options": {},
+        "pin_context_options": False,
+        "block_resource_types": (),
+        "block_tracking": False,
+        "disable_animations": False
+    },
+    "production": {
+        "headless": True,
+        "launch_args": [
+            "--disable-gpu", "--disable-dev-shm-usage", "--disable-extensions", "--mute-audio",
+            "--disable-background-networking", "--disable-renderer-backgrounding"
+        ],
+        "context_options": {
+            "viewport": {"width": 1024, "height": 768},
+            "device_scale_factor": 1,
+            "reduced_motion": "reduce",
+            # Headless Chromium otherwise announces itself as HeadlessChrome
+            "user_agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+                          "Chrome/124.0.0.0 Safari/537.36"
+        },
+        # Per-call viewport/user agent overrides (main, prod_profile_scrape) don't apply on servers
+        "pin_context_options": True,
+        "block_resource_types": ("font", "media", "image"),
+        "block_tracking": True,
+        "disable_animations": True
+    }
+}
+
+
+def get_browser_profile(name=None):
+    """
+    Settings of a browser profile, with environment overrides applied
+
+    Args:
+        name: Profile name (default BROWSER_PROFILE)
+
+    Returns:
+        Dictionary with name, headless, launch_args, context_options, pin_context_options,
+        block_resource_types, block_tracking and disable_animations
+    """
+    name = name or BROWSER_PROFILE
+    if name not in PROFILES:
+        raise ValueError(f"Unknown browser profile '{name}' (available: {', '.join(sorted(PROFILES))})")
+    profile = dict(PROFILES[name])
+    profile["name"] = name
+    profile["context_options"] = dict(profile["context_options"])
+    headless = os.getenv("BROWSER_HEADLESS")
+    if headless is not None:
+        profile["headless"] = headless.lower() in ("1", "true", "yes")
+    blocked = os.getenv("BROWSER_BLOCK_RESOURCES")
+    if blocked is not None:
+        profile["block_resource_types"] = tuple(t.strip() for t in blocked.split(",") if t.strip())
+    return profile
+
+
+class ResourceBlocker:
+    """Route handler that aborts unneeded requests and counts what it blocked"""
+
+    def __init__(self, resource_types=(), block_tracking=True):
+        self.resource_types = set(resource_types)
+        self.block_tracking = block_tracking
+        self.blocked = 0
+        self.allowed = 0
+
+    def should_block(self, request):
+        if request.resource_type in self.resource_types:
+            return True
+        return self.block_tracking and any(marker in request.url for marker in TRACKING_URL_MARKERS)
+
+    async def handle(self, route):
+        try:
+            if self.should_block(route.request):
+                self.blocked += 1
+                await route.abort("blockedbyclient")
+            else:
+                self.allowed += 1
+                await route.continue_()
+        except Exception:
+            # The page or context went away while the request was in flight
+            pass
+
+
+async def apply_browser_profile(context, profile):
+    """
+    Install a profile's request blocking and init scripts on a new browser context
+
+    Returns:
+        The context's ResourceBlocker, or None if the profile blocks nothing
+    """
+    if profile.get("disable_animations"):
+        await context.add_init_script(DISABLE_ANIMATIONS_SCRIPT)
+    if not profile.get("block_resource_types") and not profile.get("block_tracking"):
+        return None
+    blocker = ResourceBlocker(profile["block_resource_types"], profile["block_tracking"])
+    await context.route(BLOCKABLE_URL_PATTERN, blocker.handle)
+    return blocker
@@ -0,0 +1,262 @@
+"""
+Pooled image downloader for scraped post media.
+
+ImageDownloader is shared process-wide: it keeps one requests.Session with a
+connection pool, limits how many downloads hit the same host at once, streams
+each response to a temporary file that is atomically renamed into place, and
+retries 429/5xx responses with backoff (honouring Retry-After).
+
+DownloadQueue decouples downloads from page scraping: the scraper puts
+(url, path) jobs on an asyncio queue and carries on, worker tasks feed them to
+the downloader's thread pool, and join() waits for whatever is still pending
+before the profile is saved.
+
+Downloads go through the content-addressed MediaStore when it is enabled, so
+media fetched by an earlier scrape is linked from the store instead.
+"""
+import asyncio
+import contextvars
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from media_store import get_media_store, media_key
+from metrics import timer
+
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "8"))
+DOWNLOAD_PER_HOST = int(os.getenv("DOWNLOAD_PER_HOST", "4"))
+DOWNLOAD_MAX_RETRIES = int(os.getenv("DOWNLOAD_MAX_RETRIES", "3"))
+DOWNLOAD_CONNECT_TIMEOUT = float(os.getenv("DOWNLOAD_CONNECT_TIMEOUT", "5"))
+DOWNLOAD_READ_TIMEOUT = float(os.getenv("DOWNLOAD_READ_TIMEOUT", "30"))
+MEDIA_STORE_ENABLED = os.getenv("MEDIA_STORE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+CHUNK_SIZE = 64 * 1024
+MAX_BACKOFF = 30.0
+
+
+def _retry_after(response):
+    """Seconds to wait from a Retry-After header, or None"""
+    value = response.headers.get("Retry-After") if response is not None else None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class ImageDownloader:
+    def __init__(self, concurrency=None, per_host=None, max_retries=None, timeout=None,
+                 headers=None, backoff_base=0.5, store=None):
+        """
+        Args:
+            concurrency: Downloads running at once (env DOWNLOAD_CONCURRENCY, default 8)
+            per_host: Downloads running at once against one host (env DOWNLOAD_PER_HOST, default 4)
+            max_retries: Retries after a 429/5xx or connection error (env DOWNLOAD_MAX_RETRIES, default 3)
+            timeout: (connect, read) timeout in seconds
+            headers: Headers sent with every request
+            backoff_base: First retry delay in seconds, doubled on each attempt
+            store: MediaStore to reuse media from (default: the shared store if MEDIA_STORE_ENABLED)
+        """
+        self.concurrency = concurrency or DOWNLOAD_CONCURRENCY
+        self.per_host = per_host or DOWNLOAD_PER_HOST
+        self.max_retries = DOWNLOAD_MAX_RETRIES if max_retries is None else max_retries
+        self.timeout = timeout or (DOWNLOAD_CONNECT_TIMEOUT, DOWNLOAD_READ_TIMEOUT)
+        self.backoff_base = backoff_base
+        if store is None and MEDIA_STORE_ENABLED:
+            store = get_media_store()
+        self.store = store
+
+        self.session = requests.Session()
+        self.session.headers.update(headers or {"User-Agent": "Mozilla/5.0"})
+        adapter = HTTPAdapter(pool_connections=self.concurrency, pool_maxsize=self.concurrency, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="image-download")
+        self._host_limits = {}
+        self._host_lock = threading.Lock()
+
+    def _host_limit(self, url):
+        host = urlparse(url).netloc
+        with self._host_lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_limits[host]
+
+    def _backoff(self, attempt, response=None):
+        delay = _retry_after(response)
+        if delay is None:
+            delay = self.backoff_base * (2 ** attempt) * random.uniform(0.8, 1.2)
+        return min(delay, MAX_BACKOFF)
+
+    def _fetch_to_file(self, url, img_path):
+        """Stream one response to img_path (only written on a 200); returns the response"""
+        response = self.session.get(url, stream=True, timeout=self.timeout)
+        try:
+            if response.status_code != 200:
+                return response
+            directory = os.path.dirname(img_path) or "."
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(prefix=".download-", suffix=".part", dir=directory)
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        if chunk:
+                            f.write(chunk)
+                os.replace(tmp_path, img_path)
+            except BaseException:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                raise
+            return response
+        finally:
+            response.close()
+
+    def download(self, url, img_path, media_id=None, variant=None):
+        """
+        Download url to img_path, retrying on 429/5xx and connection errors.
+
+        Args:
+            url: Image URL
+            img_path: Destination path
+            media_id: Instagram media ID used as the media store key, if known
+            variant: Size variant (e.g. "320w") stored apart from the default size
+
+        Returns:
+            True if the file was written (or linked from the media store)
+        """
+        with timer("image_download_seconds", outcome="failed") as labels:
+            key = media_key(url, media_id, variant) if self.store else None
+            if key and self.store.fetch(key, img_path):
+                labels["outcome"] = "stored"
+                return True
+            if self._download(url, img_path):
+                labels["outcome"] = "ok"
+                if key:
+                    try:
+                        self.store.add(key, img_path)
+                    except Exception as e:
+                        print(f"⚠️  Media store: could not add {key}: {str(e)}")
+                return True
+            return False
+
+    def _download(self, url, img_path):
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                with self._host_limit(url):
+                    response = self._fetch_to_file(url, img_path)
+                if response.status_code == 200:
+                    return True
+                if response.status_code not in RETRY_STATUSES:
+                    print(f"Image download failed with status {response.status_code}: {url[:80]}")
+                    return False
+            except (requests.ConnectionError, requests.Timeout) as e:
+                print(f"Image download error (attempt {attempt + 1}): {str(e)}")
+            if attempt < self.max_retries:
+                time.sleep(self._backoff(attempt, response))
+        print(f"Giving up on image download after {self.max_retries + 1} attempts: {url[:80]}")
+        return False
+
+    def submit(self, url, img_path, media_id=None, variant=None):
+        """Schedule a download on the downloader's threads; returns a concurrent Future"""
+        # Run in a copy of the caller's context so the download's metrics reach its task's collector
+        return self._executor.submit(contextvars.copy_context().run, self.download, url, img_path, media_id,
+                                     variant)
+
+    async def download_async(self, url, img_path, media_id=None, variant=None):
+        """Download from a coroutine without blocking its event loop"""
+        return await asyncio.wrap_future(self.submit(url, img_path, media_id, variant))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+
+class DownloadQueue:
+    """Per-scrape queue of downloads served by worker tasks on the current event loop"""
+
+    def __init__(self, downloader=None, workers=None):
+        self.downloader = downloader or get_image_downloader()
+        self.workers = workers or self.downloader.concurrency
+        self.queue = asyncio.Queue()
+        self.completed = 0
+        self.failed = 0
+        self._tasks = []
+
+    def _start_workers(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def _worker(self):
+        while True:
+            url, img_path, media_id, variant, on_done = await self.queue.get()
+            try:
+                ok = await self.downloader.download_async(url, img_path, media_id, variant)
+            except Exception as e:
+                print(f"Error downloading image: {str(e)}")
+                ok = False
+            try:
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                if on_done:
+                    on_done(ok)
+            finally:
+                self.queue.task_done()
+
+    def put(self, url, img_path, on_done=None, media_id=None, variant=None):
+        """
+        Queue a download without waiting for it.
+
+        Args:
+            url: Image URL
+            img_path: Destination path
+            on_done: Optional callback receiving True/False once the download finishes
+            media_id: Instagram media ID used as the media store key, if known
+            variant: Size variant (e.g. "320w") stored apart from the default size
+        """
+        self._start_workers()
+        self.queue.put_nowait((url, img_path, media_id, variant, on_done))
+
+    async def join(self):
+        """Wait for all queued downloads and stop the workers"""
+        try:
+            if self._tasks:
+                await self.queue.join()
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            self._tasks = []
+
+
+_downloader = None
+_downloader_lock = threading.Lock()
+
+
+def get_image_downloader():
+    """Return the process-wide image downloader, creating it on first use"""
+    global _downloader
+    with _downloader_lock:
+        if _downloader is None:
+            _downloader = ImageDownloader()
+        return _downloader
+
+
+def close_image_downloader():
+    """Close the process-wide image downloader if it was created"""
+    global _downloader
+    with _downloader_lock:
+        downloader, _downloader = _downloader, None
+    if downloader is not None:
+        downloader.close()
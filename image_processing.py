@@ -0,0 +1,333 @@
+"""
+Optional post-processing of downloaded post images before they are uploaded.
+
+Images are saved as whatever bytes the CDN returned, and screenshots taken as
+a last resort are PNG data behind a .jpg name. When IMAGE_PROCESSING is on
+(and Pillow is installed), every image of a workflow run is:
+
+- re-encoded as WebP or JPEG (IMAGE_FORMAT) at IMAGE_QUALITY, replacing the
+  original when that is smaller or the original isn't in the format its name says
+- thumbnailed to fit IMAGE_THUMBNAIL_PX into a thumbnails/ directory beside it
+- hashed with a 64-bit difference hash, so near-duplicates (Hamming distance up
+  to IMAGE_DEDUPE_DISTANCE) across the product and competitor profiles can be
+  dropped; the first image in profile order is kept
+
+The Pillow work runs in a process pool of IMAGE_PROCESS_WORKERS processes
+(worker.py starts its workers non-daemonic for this). A daemonic process can't
+start children, so one that uses the processor gets a thread pool instead;
+Pillow releases the GIL while decoding, resizing and encoding.
+
+Re-encoding and dedupe are separate steps. process_profiles() records its
+results on each post ("image_processing": path, format, size, bytes
+before/after, thumbnail, hash); they belong to the image, so the workflow
+writes them back to the profile cache. An image that already carries them
+(a cached profile used again) is only hashed and thumbnailed, never re-encoded
+a second time. dedupe_profiles() then compares one job's product and
+competitors; its results ("duplicate_of" on dropped posts, per-profile
+"image_processing" totals from summarize()) only go into that job's queue
+directory. Files are replaced by writing a new file and renaming it, so images
+hardlinked from the media store stay intact in the store.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from metrics import timer, inc
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    ImageOps = None
+
+IMAGE_PROCESSING = os.getenv("IMAGE_PROCESSING", "false").lower() in ("1", "true", "yes")
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "webp").lower()  # webp or jpeg
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", "80"))
+IMAGE_THUMBNAIL_PX = int(os.getenv("IMAGE_THUMBNAIL_PX", "320"))
+IMAGE_DEDUPE_DISTANCE = int(os.getenv("IMAGE_DEDUPE_DISTANCE", "5"))
+IMAGE_PROCESS_WORKERS = int(os.getenv("IMAGE_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+THUMBNAIL_DIR = "thumbnails"
+# Pillow format name and file extension per IMAGE_FORMAT
+FORMATS = {"webp": ("WEBP", ".webp"), "jpeg": ("JPEG", ".jpg"), "jpg": ("JPEG", ".jpg")}
+# Pillow format a file's extension promises
+EXTENSION_FORMATS = {".jpg": "JPEG", ".jpeg": "JPEG", ".webp": "WEBP", ".png": "PNG"}
+
+
+def pillow_available():
+    return Image is not None
+
+
+def _encode(image, path, pil_format, quality):
+    options = {"quality": quality}
+    if pil_format == "WEBP":
+        options["method"] = 4
+    else:
+        options.update(optimize=True, progressive=True)
+    image.save(path, format=pil_format, **options)
+
+
+def difference_hash(image):
+    """64-bit difference hash of an image as 16 hex digits"""
+    pixels = list(image.convert("L").resize((9, 8), Image.LANCZOS).getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = (bits << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f"{bits:016x}"
+
+
+def hash_distance(a, b):
+    """Number of differing bits between two hashes from difference_hash()"""
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def process_image(path, image_format=IMAGE_FORMAT, quality=IMAGE_QUALITY, thumbnail_px=IMAGE_THUMBNAIL_PX,
+                  reencode=True):
+    """
+    Re-encode, thumbnail and hash one image (runs in a pool worker)
+
+    Args:
+        path: Image file; replaced by the re-encode when that wins
+        image_format: "webp" or "jpeg"
+        quality: Encoder quality (1-100)
+        thumbnail_px: Longest side of the thumbnail (0 for none)
+        reencode: False for an image that was already re-encoded (only hash and thumbnail it)
+
+    Returns:
+        Dict with path, format, width, height, bytes, original_bytes, phash and,
+        with a thumbnail, thumbnail_path/thumbnail_width/thumbnail_height
+    """
+    pil_format, extension = FORMATS.get(image_format, FORMATS["webp"])
+    original_bytes = os.path.getsize(path)
+    directory, filename = os.path.split(path)
+    stem = os.path.splitext(filename)[0]
+
+    with Image.open(path) as source:
+        source_format = source.format
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        result = {
+            "path": path,
+            "format": (source_format or "").lower(),
+            "width": image.width,
+            "height": image.height,
+            "bytes": original_bytes,
+            "original_bytes": original_bytes,
+            "phash": difference_hash(image)
+        }
+
+        encoded_path = os.path.join(directory, stem + extension)
+        tmp_path = f"{encoded_path}.tmp"
+        try:
+            if reencode:
+                _encode(image, tmp_path, pil_format, quality)
+                encoded_bytes = os.path.getsize(tmp_path)
+                # The re-encode wins when smaller, or when the file isn't what its name says (screenshots)
+                mislabeled = EXTENSION_FORMATS.get(os.path.splitext(filename)[1].lower()) != source_format
+                if encoded_bytes < original_bytes or mislabeled:
+                    os.replace(tmp_path, encoded_path)
+                    if encoded_path != path:
+                        os.remove(path)
+                    result.update(path=encoded_path, format=image_format, bytes=encoded_bytes)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        if thumbnail_px:
+            thumbnail = image.copy()
+            thumbnail.thumbnail((thumbnail_px, thumbnail_px), Image.LANCZOS)
+            os.makedirs(os.path.join(directory, THUMBNAIL_DIR), exist_ok=True)
+            thumbnail_path = os.path.join(directory, THUMBNAIL_DIR, f"{stem}_thumb{extension}")
+            _encode(thumbnail, thumbnail_path, pil_format, quality)
+            result.update(thumbnail_path=thumbnail_path, thumbnail_width=thumbnail.width,
+                          thumbnail_height=thumbnail.height)
+    return result
+
+
+class ImageProcessor:
+    def __init__(self, workers=None, image_format=None, quality=None, thumbnail_px=None, dedupe_distance=None):
+        """
+        Args:
+            workers: Pool size (env IMAGE_PROCESS_WORKERS, default min(4, CPUs))
+            image_format: "webp" or "jpeg" (env IMAGE_FORMAT, default webp)
+            quality: Encoder quality (env IMAGE_QUALITY, default 80)
+            thumbnail_px: Longest thumbnail side (env IMAGE_THUMBNAIL_PX, default 320; 0 for none)
+            dedupe_distance: Hash distance counted as a duplicate (env IMAGE_DEDUPE_DISTANCE,
+                default 5; negative to keep duplicates)
+        """
+        self.workers = max(1, workers or IMAGE_PROCESS_WORKERS)
+        self.image_format = image_format or IMAGE_FORMAT
+        self.quality = quality or IMAGE_QUALITY
+        self.thumbnail_px = IMAGE_THUMBNAIL_PX if thumbnail_px is None else thumbnail_px
+        self.dedupe_distance = IMAGE_DEDUPE_DISTANCE if dedupe_distance is None else dedupe_distance
+        self._lock = threading.Lock()
+        self._executor = self._new_executor()
+
+    def _new_executor(self):
+        if multiprocessing.current_process().daemon:
+            return ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="image-process")
+        # Spawned, not forked: the parent runs browser and downloader threads
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def _replace_broken(self, executor):
+        # A pool whose worker died refuses all further work; start a fresh one for the next images
+        with self._lock:
+            if self._executor is executor:
+                self._executor = self._new_executor()
+        executor.shutdown(wait=False)
+
+    async def _process(self, path, previous=None):
+        with timer("image_processing_seconds", outcome="failed") as labels:
+            executor = self._executor
+            try:
+                result = await asyncio.wrap_future(executor.submit(
+                    process_image, path, self.image_format, self.quality, self.thumbnail_px, previous is None
+                ))
+            except BrokenProcessPool as e:
+                print(f"⚠️  Image processing pool failed on {path}: {str(e)}")
+                self._replace_broken(executor)
+                return None
+            except Exception as e:
+                print(f"⚠️  Could not process image {path}: {str(e)}")
+                return None
+            if previous is not None:
+                # Keep what the first processing recorded about the original download
+                result.update(format=previous.get("format", result["format"]),
+                              original_bytes=previous.get("original_bytes", result["original_bytes"]))
+                labels["outcome"] = "reused"
+            else:
+                labels["outcome"] = "reencoded" if result["path"] != path or result["bytes"] != \
+                    result["original_bytes"] else "kept"
+            return result
+
+    async def process_profiles(self, profiles):
+        """
+        Re-encode, thumbnail and hash the image of every post of the given profiles, in place
+
+        Sets each post's local_image_path to the processed file and records the result
+        in its "image_processing". Posts that already carry a result for the same file
+        (e.g. from a cached profile) are not re-encoded again.
+
+        Args:
+            profiles: Profile dictionaries
+        """
+        posts = [post for profile in profiles for post in profile.get("posts", [])
+                 if post.get("local_image_path") and os.path.exists(post["local_image_path"])]
+
+        def previous_result(post):
+            previous = post.get("image_processing")
+            path = post["local_image_path"]
+            if previous and previous.get("path") and os.path.basename(previous["path"]) == os.path.basename(path) \
+                    and previous.get("bytes") == os.path.getsize(path):
+                return previous
+            return None
+
+        results = await asyncio.gather(*(self._process(post["local_image_path"], previous_result(post))
+                                         for post in posts))
+        for post, result in zip(posts, results):
+            if result is None:
+                continue
+            post["local_image_path"] = result["path"]
+            post["image_processing"] = result
+
+    def dedupe_profiles(self, profiles):
+        """
+        Drop near-duplicate images across the profiles of one job, in place
+
+        The first image in profile order is kept; a later one within dedupe_distance is
+        deleted, and its post loses local_image_path and records "duplicate_of".
+
+        Args:
+            profiles: Processed profile dictionaries, in priority order (product first)
+
+        Returns:
+            Number of images dropped
+        """
+        if self.dedupe_distance < 0:
+            return 0
+        dropped = 0
+        kept = []  # (phash, profile username, post) of images kept so far
+        for profile in profiles:
+            for post in profile.get("posts", []):
+                result = post.get("image_processing")
+                if not result or not result.get("phash") or not post.get("local_image_path"):
+                    continue
+                original = next((entry for entry in kept
+                                 if hash_distance(entry[0], result["phash"]) <= self.dedupe_distance), None)
+                if original is None:
+                    kept.append((result["phash"], profile.get("username"), post))
+                    continue
+
+                # Near-duplicate of an image kept earlier: drop the file and point at the kept one
+                _, username, kept_post = original
+                post["duplicate_of"] = {
+                    "username": username,
+                    "shortcode": kept_post.get("shortcode"),
+                    "path": kept_post["local_image_path"]
+                }
+                post.pop("local_image_path", None)
+                for key in ("path", "thumbnail_path"):
+                    path = result.pop(key, None)
+                    if path and os.path.exists(path):
+                        os.remove(path)
+                dropped += 1
+                inc("images_deduplicated_total")
+        return dropped
+
+    @staticmethod
+    def summarize(profiles):
+        """
+        Record per-profile processing totals in each profile's "image_processing"
+
+        Returns:
+            Totals over all profiles: {"images", "processed", "duplicates", "bytes_before", "bytes_after"}
+        """
+        totals = {"images": 0, "processed": 0, "duplicates": 0, "bytes_before": 0, "bytes_after": 0}
+        for profile in profiles:
+            counts = {"processed": 0, "duplicates": 0, "bytes_before": 0, "bytes_after": 0}
+            for post in profile.get("posts", []):
+                result = post.get("image_processing")
+                if not result:
+                    continue
+                counts["processed"] += 1
+                counts["bytes_before"] += result.get("original_bytes", 0)
+                if post.get("duplicate_of"):
+                    counts["duplicates"] += 1
+                else:
+                    counts["bytes_after"] += result.get("bytes", 0)
+            profile["image_processing"] = counts
+            totals["images"] += sum(1 for post in profile.get("posts", [])
+                                    if post.get("local_image_path") or post.get("duplicate_of"))
+            for key, value in counts.items():
+                totals[key] += value
+        return totals
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+_processor = None
+_processor_lock = threading.Lock()
+
+
+def get_image_processor():
+    """Return the process-wide image processor, creating it on first use"""
+    global _processor
+    with _processor_lock:
+        if _processor is None:
+            _processor = ImageProcessor()
+        return _processor
+
+
+def close_image_processor():
+    """Shut down the process-wide image processor if it was created"""
+    global _processor
+    with _processor_lock:
+        processor, _processor = _processor, None
+    if processor is not None:
+        processor.close()
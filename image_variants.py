@@ -0,0 +1,127 @@
+"""
+Choosing which size of a post image to download.
+
+Instagram serves every image in several sizes. The post page's img tag lists
+them in srcset ("url 640w, url 1080w"), and the API payloads in
+display_resources / thumbnail_resources (GraphQL) or image_versions2.candidates
+(v1). Both are turned into the same candidate list, {"url", "width", "height"},
+and pick_image() takes the smallest candidate at least as wide as the target
+width, or the largest one when none is wide enough or no target is set.
+
+A small target (e.g. 320 for LLM analysis) then downloads a small file in the
+first place, while the default keeps fetching full-size images for archives.
+"""
+import os
+import re
+
+# Preferred image width in pixels; 0 picks the largest variant available
+IMAGE_TARGET_WIDTH = int(os.getenv("IMAGE_TARGET_WIDTH", "0"))
+
+# "url 640w" / "url 2x" entries of a srcset attribute
+_SRCSET_ENTRY_RE = re.compile(r"(\S+)\s+(\d+(?:\.\d+)?)([wx])")
+
+
+def _candidate(url, width=None, height=None):
+    try:
+        width = int(width) if width else None
+        height = int(height) if height else None
+    except (TypeError, ValueError):
+        width, height = None, None
+    return {"url": url, "width": width, "height": height}
+
+
+def parse_srcset(srcset, natural_width=None, natural_height=None):
+    """
+    Candidates listed in an img srcset attribute
+
+    Args:
+        srcset: The srcset attribute value
+        natural_width: Width of the image the browser loaded, used for "2x"-style entries
+            and, with natural_height, to derive each candidate's height
+        natural_height: Height of the image the browser loaded
+
+    Returns:
+        List of {"url", "width", "height"} dicts; width/height are None when unknown
+    """
+    aspect = natural_height / natural_width if natural_width and natural_height else None
+    candidates = []
+    for url, size, unit in _SRCSET_ENTRY_RE.findall(srcset or ""):
+        url = url.lstrip(",")
+        width = float(size) if unit == "w" else (float(size) * natural_width if natural_width else None)
+        height = round(width * aspect) if width and aspect else None
+        candidates.append(_candidate(url, round(width) if width else None, height))
+    return candidates
+
+
+def candidates_from_media(node):
+    """
+    Image candidates of a GraphQL or v1 media node (the first slide of a carousel)
+
+    Returns:
+        List of {"url", "width", "height"} dicts, possibly empty
+    """
+    candidates = []
+    for resource in (node.get("display_resources") or []) + (node.get("thumbnail_resources") or []):
+        if resource.get("src"):
+            candidates.append(_candidate(resource["src"], resource.get("config_width"), resource.get("config_height")))
+    for version in (node.get("image_versions2") or {}).get("candidates") or []:
+        if version.get("url"):
+            candidates.append(_candidate(version["url"], version.get("width"), version.get("height")))
+    if node.get("display_url"):
+        dimensions = node.get("dimensions") or {}
+        candidates.append(_candidate(node["display_url"], dimensions.get("width"), dimensions.get("height")))
+    if not candidates:
+        children = node.get("carousel_media") or [
+            edge.get("node") or {} for edge in (node.get("edge_sidecar_to_children") or {}).get("edges") or []
+        ]
+        if children:
+            return candidates_from_media(children[0])
+        if node.get("thumbnail_src"):
+            candidates.append(_candidate(node["thumbnail_src"]))
+    return candidates
+
+
+def pick_image(candidates, target_width=None):
+    """
+    Best candidate for a target width
+
+    Args:
+        candidates: List of {"url", "width", "height"} dicts
+        target_width: Preferred width in pixels (default IMAGE_TARGET_WIDTH; 0 for the largest)
+
+    Returns:
+        The smallest candidate at least target_width wide, else the largest one;
+        the first candidate if no widths are known, or None if there are none
+    """
+    if not candidates:
+        return None
+    target_width = IMAGE_TARGET_WIDTH if target_width is None else target_width
+    sized = sorted((c for c in candidates if c.get("width")), key=lambda c: c["width"])
+    if not sized:
+        return candidates[0]
+    if target_width:
+        for candidate in sized:
+            if candidate["width"] >= target_width:
+                return candidate
+    return sized[-1]
+
+
+def apply_image_choice(post_data, target_width=None):
+    """
+    Points a post's thumbnail_url at the best of its image_candidates and records its size
+
+    The candidates are removed from the post, so they don't end up in the saved profile.
+
+    Args:
+        post_data: Post dictionary, optionally with an "image_candidates" list
+        target_width: Preferred width in pixels (default IMAGE_TARGET_WIDTH)
+
+    Returns:
+        The chosen candidate, or None if the post had none
+    """
+    chosen = pick_image(post_data.pop("image_candidates", None) or [], target_width)
+    if chosen:
+        post_data["thumbnail_url"] = chosen["url"]
+        post_data["image_width"] = chosen["width"]
+        post_data["image_height"] = chosen["height"]
+    return chosen
@@ -1,11 +1,22 @@
-from playwright.sync_api import sync_playwright
 import json
 import os
 import time
-import requests
 from datetime import datetime
 import urllib.parse
+import asyncio
 from dotenv import load_dotenv
+from browser_pool import get_browser_pool, close_browser_pool, STATE_PATH
+from readiness import wait_for_selector, wait_for_hidden, wait_until, scroll_grid, NetworkActivityTracker
+from image_downloader import DownloadQueue, get_image_downloader, close_image_downloader
+from response_capture import (
+    ProfileResponseCapture, shortcode_from_url, MEDIA_TYPE_IMAGE, MEDIA_TYPE_CAROUSEL, MEDIA_TYPE_VIDEO
+)
+from media_store import link_or_copy
+from profile_cache import get_profile_cache
+from scrape_events import emit
+from metrics import timer, inc
+from selector_registry import get_selector_registry
+from image_variants import IMAGE_TARGET_WIDTH, parse_srcset, apply_image_choice
 
 # Setup directories
 output_dir = "output/product_data"
@@ -14,17 +25,24 @@ os.makedirs(output_dir, exist_ok=True)
 image_dir = f"{output_dir}/profile_images"
 os.makedirs(image_dir, exist_ok=True)
 
+# Selectors that are only present once a session is logged in
+LOGGED_IN_SELECTOR = "div[role='button'][aria-label*='Profile'], span[aria-label*='Profile'], a[href*='/direct/inbox/']"
+
 # Function to handle login
-def login_to_instagram(page):
-    page.goto("https://www.instagram.com/")
-    time.sleep(3)
+async def login_to_instagram_async(page, username=None, password=None):
+    load_dotenv()
+    username = username or os.getenv("INSTAGRAM_USERNAME")
+    password = password or os.getenv("INSTAGRAM_PASSWORD")
+    
+    with timer("page_goto_seconds", kind="home"):
+        await page.goto("https://www.instagram.com/", wait_until="domcontentloaded")
+    
+    # Wait until either the logged-in UI or the login form has rendered
+    await wait_for_selector(page, f"{LOGGED_IN_SELECTOR}, input[name='username']", timeout=10000)
     
     # Check if already logged in by looking for profile icon or other elements present after login
     try:
-        logged_in_check = page.wait_for_selector(
-            "div[role='button'][aria-label*='Profile'], span[aria-label*='Profile'], a[href*='/direct/inbox/']",
-            timeout=5000
-        )
+        logged_in_check = await page.wait_for_selector(LOGGED_IN_SELECTOR, timeout=1000)
         print("### Already logged in! Session loaded successfully.")
         return True
     except:
@@ -32,52 +50,258 @@ def login_to_instagram(page):
     
     # Handle cookies popup if it appears
     try:
-        cookie_button = page.wait_for_selector(
+        cookie_button = await page.wait_for_selector(
             "button:has-text('Accept'), button:has-text('Allow')",
             timeout=5000
         )
-        cookie_button.click()
+        await cookie_button.click()
         print("### Cookies: Accept [x]")
-        time.sleep(2)
+        await wait_for_hidden(page, "button:has-text('Accept'), button:has-text('Allow')")
     except:
         print("### Cookies window not found. Skipping to login..")
     
     # Enter username and password
     print("### Entering in Instagram Username and Password..")
     try:
-        username_field = page.wait_for_selector("input[name='username']", timeout=10000)
+        username_field = await page.wait_for_selector("input[name='username']", timeout=10000)
         password_field = page.locator("input[name='password']")
         
-        username_field.fill(username)
-        password_field.fill(password)
+        await username_field.fill(username)
+        await password_field.fill(password)
         
         login_button = page.locator("button[type='submit']")
-        login_button.click()
-        time.sleep(5)
+        await login_button.click()
+        
+        # Wait for the post-login UI (popup or logged-in navigation) instead of a fixed delay
+        await wait_for_selector(page, f"button:has-text('Not Now'), {LOGGED_IN_SELECTOR}", timeout=15000)
     except Exception as e:
         print(f"Error during login: {str(e)}")
         return False
     
     # Handle "Save Login Info" popup
     try:
-        not_now_button = page.wait_for_selector("button:has-text('Not Now')", timeout=5000)
-        not_now_button.click()
+        not_now_button = await page.wait_for_selector("button:has-text('Not Now')", timeout=5000)
+        await not_now_button.click()
         print("### Save Login Info: Not Now [x]")
-        time.sleep(2)
+        await wait_for_hidden(page, "button:has-text('Not Now')")
     except:
         print("Save Login Info popup not found. Skipping..")
     
     # Handle "Notifications" popup
     try:
-        not_now_button = page.wait_for_selector("button:has-text('Not Now')", timeout=5000)
-        not_now_button.click()
+        not_now_button = await page.wait_for_selector("button:has-text('Not Now')", timeout=5000)
+        await not_now_button.click()
         print("### Notifications: Not Now [x]")
-        time.sleep(2)
+        await wait_for_hidden(page, "button:has-text('Not Now')")
     except:
         print("Notifications popup not found. Skipping..")
     
     return True
 
+# Readiness timeouts (upper bounds - each wait returns as soon as its condition holds)
+READY_TIMEOUT_MS = 10000
+POST_READY_TIMEOUT_MS = 5000
+NETWORK_IDLE_TIMEOUT = 5.0
+
+# Number of post tabs loaded in parallel while extracting post details
+POST_TAB_CONCURRENCY = int(os.getenv("POST_TAB_CONCURRENCY", "4"))
+
+# Image posts collected per profile, and grid tiles considered at least while looking for them
+PROFILE_POST_TARGET = int(os.getenv("PROFILE_POST_TARGET", "6"))
+MAX_POST_CANDIDATES = int(os.getenv("MAX_POST_CANDIDATES", "50"))
+
+PROFILE_NOT_FOUND_SELECTOR = "span:has-text(\"Sorry, this page isn't available.\")"
+POST_LINK_SELECTOR = "a[href*='/p/']"
+POST_MEDIA_SELECTOR = "article img, article video, div[role='dialog'] img, div[role='dialog'] video, main img, main video"
+GRID_TILE_SELECTOR = "a[href*='/p/'], a[href*='/reel/']"
+
+# Classifies every grid tile in one round-trip from its icon labels and URL shape.
+# Video/reel tiles carry a "Clip"/"Reel"/"Video" icon, carousels a "Carousel" icon;
+# a tile with an image and neither icon is a single image post.
+GRID_CLASSIFY_SCRIPT = """
+(selector) => Array.from(document.querySelectorAll(selector)).map(a => {
+    const href = a.getAttribute('href') || '';
+    const labels = Array.from(a.querySelectorAll('[aria-label]'))
+        .map(el => (el.getAttribute('aria-label') || '').toLowerCase());
+    let mediaType = null;
+    if (href.includes('/reel/') || labels.some(l => l.includes('clip') || l.includes('reel') || l.includes('video'))) {
+        mediaType = 'video';
+    } else if (labels.some(l => l.includes('carousel'))) {
+        mediaType = 'carousel';
+    } else if (a.querySelector('img')) {
+        mediaType = 'image';
+    }
+    return {href: href, media_type: mediaType};
+})
+"""
+
+# Candidate selectors per field, in their default order (the registry reorders them)
+POST_IMAGE_SELECTORS = [
+    "article div[role='button'] img",
+    "article img:not([alt*='profile picture'])",
+    "div[role='dialog'] article img",
+    "div[role='dialog'] img:not([alt*='profile picture'])",
+    "img[alt*='Photo by']",  # Common alt text format
+    "img[sizes*='px']",      # Images typically have sizes attribute
+    "img[src*='instagram']"  # Any Instagram-hosted image
+]
+POST_CAPTION_SELECTORS = [
+    "div.C7I1f, div._a9zr, div[role='menuitem'] span, div._a9zs",
+    "h1+span, div[role='dialog'] span:has-text(' ')",
+    "article div > span > div > span"
+]
+POST_TIME_SELECTORS = [
+    "time[datetime]",
+    "div._aaqe, div._aaqf, div[class*='timestamp']"
+]
+POST_LIKE_SELECTORS = [
+    "section:has(span[aria-label*='like']), div._aacl:has-text('likes'), div[role='dialog'] span:has-text('likes')",
+    "span[class*='like'], span.zV_eT, span._aap9"
+]
+POST_COMMENT_SELECTORS = [
+    "div[role='dialog'] span:has-text('comments'), span:has-text('View all')",
+    "ul > li:has-text('comments'), span[class*='comment'], span._acbn"
+]
+POST_VIDEO_SELECTORS = [
+    "video",
+    "span[aria-label*='Video'], span[class*='video']",  # Video indicators in the UI
+    "div._abpo, div[aria-label*='Play'], div[aria-label*='Pause']"  # Video player UI elements
+]
+PROFILE_BIO_SELECTORS = [
+    "div.-vDIg, div.QGPIr, div.xqs5bz0, div._aa_c",
+    "header section > div > span, section h1 ~ span"
+]
+PROFILE_WEBSITE_SELECTORS = [
+    "a[rel*='me'], a[rel*='nofollow']",
+    "a:not([href*='instagram.com']):not([href*='/explore/'])"
+]
+PROFILE_NAME_SELECTOR = "section h2, header h2, h2._aacl"
+PROFILE_COUNTS_SELECTOR = "header ul li, section ul li, li._aa_5"
+VERIFIED_BADGE_SELECTOR = "header span[aria-label*='Verified']"
+
+# Selector matching shared by the in-page extraction scripts. The candidate selectors are
+# Playwright selectors: :has-text() is not CSS, so it is matched like Playwright does it
+# (case-insensitive substring of the element's text) and every other part is left to
+# querySelectorAll. Matches of a selector list come back in document order.
+PAGE_QUERY_HELPERS = """
+    const splitSelector = (selector) => {
+        const parts = [];
+        let depth = 0, quote = null, current = '';
+        for (const ch of selector) {
+            if (quote) {
+                if (ch === quote) quote = null;
+            } else if (ch === '"' || ch === "'") {
+                quote = ch;
+            } else if (ch === '(' || ch === '[') {
+                depth++;
+            } else if (ch === ')' || ch === ']') {
+                depth--;
+            } else if (ch === ',' && depth === 0) {
+                parts.push(current.trim());
+                current = '';
+                continue;
+            }
+            current += ch;
+        }
+        parts.push(current.trim());
+        return parts.filter(part => part);
+    };
+    const normalize = (text) => (text || '').replace(/\\s+/g, ' ').trim().toLowerCase();
+    const queryAll = (selector) => {
+        const found = new Set();
+        for (const part of splitSelector(selector)) {
+            const hasText = part.match(/^(.*?):has-text\\((['"])(.*)\\2\\)$/);
+            if (hasText) {
+                const text = normalize(hasText[3]);
+                for (const el of document.querySelectorAll(hasText[1] || '*')) {
+                    if (normalize(el.textContent).includes(text)) found.add(el);
+                }
+            } else {
+                for (const el of document.querySelectorAll(part)) found.add(el);
+            }
+        }
+        return Array.from(found).sort((a, b) =>
+            a === b ? 0 : (a.compareDocumentPosition(b) & Node.DOCUMENT_POSITION_FOLLOWING ? -1 : 1));
+    };
+    // First selector of a field whose elements read() accepts (a non-null value).
+    // Returns {index, value} with index null when every selector missed, or null when
+    // a selector could not be evaluated here, so the caller falls back to its locators.
+    const firstMatch = (selectors, read) => {
+        try {
+            for (let index = 0; index < selectors.length; index++) {
+                const elements = queryAll(selectors[index]);
+                const value = elements.length ? read(elements, selectors[index]) : null;
+                if (value !== null && value !== undefined) return {index: index, value: value};
+            }
+            return {index: null, value: null};
+        } catch (e) {
+            return null;
+        }
+    };
+    const text = (el) => (el.textContent || '').trim();
+"""
+
+# Reads every field of a post page in one round-trip instead of a locator call per
+# selector and attribute. Takes the registry-ordered candidates per field; the video
+# check is only meaningful for posts the grid could not classify.
+POST_EXTRACT_SCRIPT = """
+(fields) => {
+""" + PAGE_QUERY_HELPERS + """
+    let isVideo = null;
+    try {
+        isVideo = fields.video.some(selector => queryAll(selector).length > 0);
+    } catch (e) {}
+    const image = firstMatch(fields.image, els => els[0].getAttribute('src') || null);
+    if (image && image.index !== null) {
+        const img = queryAll(fields.image[image.index])[0];
+        image.srcset = img.getAttribute('srcset') || '';
+        image.natural_width = img.naturalWidth || null;
+        image.natural_height = img.naturalHeight || null;
+    }
+    return {
+        is_video: isVideo,
+        image: image,
+        caption: firstMatch(fields.caption, els => text(els[0])),
+        timestamp: firstMatch(fields.timestamp, els => els[0].getAttribute('datetime') || text(els[0]) || null),
+        likes: firstMatch(fields.likes, els => text(els[0])),
+        comments: firstMatch(fields.comments, els => text(els[0]).toLowerCase().includes('comments') ? text(els[0]) : null)
+    };
+}
+"""
+
+# The profile header counterpart of POST_EXTRACT_SCRIPT: verified badge, bio, name,
+# website and the posts/followers/following texts in one round-trip.
+PROFILE_HEADER_SCRIPT = """
+(fields) => {
+""" + PAGE_QUERY_HELPERS + """
+    const link = (els) => {
+        for (const el of els) {
+            const href = el.getAttribute('href');
+            if (href && !['instagram.com', '/explore/', '/followers/', '/following/'].some(part => href.includes(part))) {
+                return href;
+            }
+        }
+        return null;
+    };
+    const safe = (read) => {
+        try {
+            return read();
+        } catch (e) {
+            return null;
+        }
+    };
+    return {
+        verified: safe(() => queryAll(fields.verified).length > 0),
+        // The bio container is read as one block, the span fallback line by line
+        bio: firstMatch(fields.bio, (els, selector) =>
+            (selector === fields.bio_container ? text(els[0]) : els.map(el => el.textContent || '').join('\\n').trim()) || null),
+        real_name: firstMatch([fields.name], els => text(els[0])),
+        website: firstMatch(fields.website, link),
+        counts: safe(() => queryAll(fields.counts).slice(0, 3).map(el => el.textContent || ''))
+    };
+}
+"""
+
 # Helper function to parse counts like "1k", "2.5M", etc.
 def parse_count(count_text):
     try:
@@ -91,19 +315,995 @@ def parse_count(count_text):
     except:
         return 0
 
+def record_page_match(field, selectors, match, fallback_field):
+    """
+    Records the selector tries of a field resolved by an in-page extraction script
+    
+    Args:
+        field: Registry field, e.g. "post.caption"
+        selectors: The ordered candidates the script was given
+        match: The script's {"index", "value"} for the field; index is None when no selector matched
+        fallback_field: Label counted in selector_fallbacks_total when a later candidate matched
+    
+    Returns:
+        The matched value, or None
+    """
+    selector_registry = get_selector_registry()
+    index = match.get("index")
+    for selector in selectors[:len(selectors) if index is None else index]:
+        selector_registry.miss(field, selector)
+    if index is None:
+        return None
+    selector_registry.hit(field, selectors[index])
+    if index:
+        inc("selector_fallbacks_total", field=fallback_field)
+    return match.get("value")
+
+async def extract_post(post_page, post_url, post_idx, max_attempts, image_posts_count, username, current_image_dir,
+                       media_type=None, force_use_video=False, downloads=None, image_width=None):
+    """
+    Extracts a single post from an already opened post page
+    
+    Args:
+        post_page: Playwright page navigated to the post
+        post_url: Full URL of the post
+        post_idx: Index of the post in the profile grid
+        max_attempts: Number of grid candidates being considered
+        image_posts_count: Number of image posts collected so far
+        username: Instagram username being scraped
+        current_image_dir: Directory for downloaded images
+        media_type: Media type classified from the grid, or None if unknown
+        force_use_video: Use the thumbnail even if the post is a video
+        downloads: Optional DownloadQueue the image download is handed to
+        image_width: Preferred image width for the srcset choice (default IMAGE_TARGET_WIDTH)
+    
+    Returns:
+        Post data dictionary, or None if the post should be skipped
+    """
+    await wait_for_selector(post_page, POST_MEDIA_SELECTOR, timeout=POST_READY_TIMEOUT_MS)
+    
+    # Fallback selectors are tried in the order learned from earlier scrapes.
+    # The last two image selectors match any image and are never promoted ahead of the specific ones.
+    selector_registry = get_selector_registry()
+    image_selectors = selector_registry.order("post.image", POST_IMAGE_SELECTORS, fixed_tail=2)
+    caption_selectors = selector_registry.order("post.caption", POST_CAPTION_SELECTORS, fixed_tail=1)
+    time_selectors = selector_registry.order("post.timestamp", POST_TIME_SELECTORS)
+    like_selectors = selector_registry.order("post.likes", POST_LIKE_SELECTORS)
+    comment_selectors = selector_registry.order("post.comments", POST_COMMENT_SELECTORS)
+    
+    # Read every field in one round-trip; a field the page script couldn't evaluate
+    # (or all of them, if the script fails) falls back to the per-field locators below
+    page_fields = {}
+    try:
+        page_fields = await post_page.evaluate(POST_EXTRACT_SCRIPT, {
+            "video": POST_VIDEO_SELECTORS,
+            "image": image_selectors,
+            "caption": caption_selectors,
+            "timestamp": time_selectors,
+            "likes": like_selectors,
+            "comments": comment_selectors
+        }) or {}
+    except Exception as e:
+        print(f"In-page extraction failed, using per-field lookups: {str(e)}")
+        inc("selector_fallbacks_total", field="page_script")
+    
+    # Check if it's really an image post (not a video, carousel with videos, or reel).
+    # Posts classified from the grid don't need the in-page checks.
+    is_video = media_type == MEDIA_TYPE_VIDEO
+
+    if media_type is None and page_fields.get("is_video") is not None:
+        is_video = page_fields["is_video"]
+    elif media_type is None:
+        # Check for video elements, video indicators in the UI and video player UI elements
+        for selector in POST_VIDEO_SELECTORS:
+            if await post_page.locator(selector).count() > 0:
+                is_video = True
+                break
+
+    # If it's a video, try to get the thumbnail anyway if we're running low on posts
+    if is_video and not force_use_video and (post_idx >= max_attempts - 12) and image_posts_count < 4:
+        force_use_video = True
+    if is_video and force_use_video:
+        print(f"Running low on posts, using video thumbnail as fallback for post #{image_posts_count+1}")
+
+    if is_video and not force_use_video:
+        # Skip this post
+        inc("videos_skipped_total", where="post_page")
+        return None
+
+    # Create post data
+    post_data = {
+        "url": post_url,
+        "shortcode": shortcode_from_url(post_url),
+        "thumbnail_url": "",
+        "timestamp": "",
+        "caption": "",
+        "likes": 0,
+        "comments": [],
+        "comments_count": 0
+    }
+
+    # Get the image, with every size its srcset offers; the download picks one for the target width
+    try:
+        srcset, natural_size = None, (None, None)
+        image_match = page_fields.get("image")
+        if image_match is not None:
+            post_data["thumbnail_url"] = record_page_match("post.image", image_selectors, image_match, "image") or ""
+            srcset = image_match.get("srcset")
+            natural_size = (image_match.get("natural_width"), image_match.get("natural_height"))
+        else:
+            # Try multiple selectors for finding the image
+            for selector_idx, selector in enumerate(image_selectors):
+                try:
+                    img_element = post_page.locator(selector).first
+                    if img_element:
+                        post_data["thumbnail_url"] = await img_element.get_attribute("src")
+                    if post_data["thumbnail_url"]:
+                        srcset = await img_element.get_attribute("srcset")
+                        selector_registry.hit("post.image", selector)
+                        if selector_idx:
+                            inc("selector_fallbacks_total", field="image")
+                        break
+                except:
+                    pass
+                selector_registry.miss("post.image", selector)
+
+        if post_data["thumbnail_url"]:
+            candidates = parse_srcset(srcset, *natural_size)
+            if post_data["thumbnail_url"] not in [candidate["url"] for candidate in candidates]:
+                candidates.append({"url": post_data["thumbnail_url"], "width": natural_size[0],
+                                   "height": natural_size[1]})
+            post_data["image_candidates"] = candidates
+            print(f"Found image for post {image_posts_count+1} ({len(candidates)} sizes)")
+
+        # If we couldn't find an image, try taking a screenshot as last resort
+        if not post_data["thumbnail_url"] and image_posts_count < 5:
+            try:
+                print(f"No image found, taking screenshot for post {image_posts_count+1}")
+                screenshot_path = os.path.join(current_image_dir, f"{username}_post_{post_idx+1}_screenshot.jpg")
+                await post_page.screenshot(path=screenshot_path)
+                post_data["thumbnail_url"] = f"file://{screenshot_path}"  # Local file URL
+                post_data["is_screenshot"] = True
+                inc("selector_fallbacks_total", field="screenshot")
+            except Exception as ss_error:
+                print(f"Error taking screenshot: {str(ss_error)}")
+
+        if not post_data["thumbnail_url"]:
+            return None
+    except Exception as e:
+        print(f"Error getting image: {str(e)}")
+        return None
+
+    # Get post caption
+    try:
+        caption_match = page_fields.get("caption")
+        if caption_match is not None:
+            post_data["caption"] = record_page_match("post.caption", caption_selectors, caption_match, "caption") or ""
+        else:
+            for selector_idx, selector in enumerate(caption_selectors):
+                caption_elements = await post_page.locator(selector).all()
+                if caption_elements and len(caption_elements) > 0:
+                    post_data["caption"] = (await caption_elements[0].text_content()).strip()
+                    selector_registry.hit("post.caption", selector)
+                    if selector_idx:
+                        inc("selector_fallbacks_total", field="caption")
+                    break
+                selector_registry.miss("post.caption", selector)
+
+        # Extract hashtags from caption
+        if post_data["caption"]:
+            # Continue with existing code by adding the rest of the function
+            hashtags = []
+            words = post_data["caption"].split()
+            for word in words:
+                if word.startswith("#"):
+                    hashtags.append(word)
+
+            post_data["hashtags"] = hashtags
+    except Exception as e:
+        print(f"Error extracting caption: {str(e)}")
+
+    # Get post timestamp
+    try:
+        time_match = page_fields.get("timestamp")
+        if time_match is not None:
+            post_data["timestamp"] = record_page_match("post.timestamp", time_selectors, time_match, "timestamp") or ""
+        else:
+            for selector_idx, selector in enumerate(time_selectors):
+                time_elements = await post_page.locator(selector).all()
+                if time_elements and len(time_elements) > 0:
+                    timestamp = await time_elements[0].get_attribute("datetime")
+                    if not timestamp:
+                        timestamp = (await time_elements[0].text_content()).strip()
+                    if timestamp:
+                        post_data["timestamp"] = timestamp
+                        selector_registry.hit("post.timestamp", selector)
+                        if selector_idx:
+                            inc("selector_fallbacks_total", field="timestamp")
+                        break
+                selector_registry.miss("post.timestamp", selector)
+    except Exception as e:
+        print(f"Error extracting timestamp: {str(e)}")
+
+    # Get post likes/views
+    try:
+        like_text = None
+        like_match = page_fields.get("likes")
+        if like_match is not None:
+            like_text = record_page_match("post.likes", like_selectors, like_match, "likes")
+        else:
+            for selector_idx, selector in enumerate(like_selectors):
+                like_elements = await post_page.locator(selector).all()
+                if like_elements and len(like_elements) > 0:
+                    selector_registry.hit("post.likes", selector)
+                    if selector_idx:
+                        inc("selector_fallbacks_total", field="likes")
+                    like_text = (await like_elements[0].text_content()).strip()
+                    break
+                selector_registry.miss("post.likes", selector)
+
+        if like_text is not None:
+            # Extract just the number from text like "123 likes"
+            like_text = ''.join(filter(lambda x: x.isdigit() or x in 'km,.', like_text.lower()))
+            post_data["likes"] = parse_count(like_text)
+    except Exception as e:
+        print(f"Error extracting likes: {str(e)}")
+
+    # Get comments count
+    try:
+        comment_text = None
+        comment_match = page_fields.get("comments")
+        if comment_match is not None:
+            comment_text = record_page_match("post.comments", comment_selectors, comment_match, "comments")
+        else:
+            for selector_idx, selector in enumerate(comment_selectors):
+                comment_elements = await post_page.locator(selector).all()
+                if comment_elements and len(comment_elements) > 0:
+                    text = (await comment_elements[0].text_content()).strip()
+                    if "comments" in text.lower():
+                        comment_text = text
+                        selector_registry.hit("post.comments", selector)
+                        if selector_idx:
+                            inc("selector_fallbacks_total", field="comments")
+                        break
+                selector_registry.miss("post.comments", selector)
+
+        if comment_text is not None:
+            # Extract just the number from text like "View all 123 comments"
+            comment_text = comment_text.lower().replace("comments", "").replace("view all", "").strip()
+            post_data["comments_count"] = parse_count(comment_text)
+    except Exception as e:
+        print(f"Error extracting comments count: {str(e)}")
+
+    # Download the image if we have a URL
+    await save_post_image(post_data, post_idx, image_posts_count, username, current_image_dir, downloads,
+                          image_width=image_width)
+    
+    return post_data
+
+async def iter_post_tabs(context, candidates, username, current_image_dir, max_attempts, limit=None,
+                         concurrency=None, force_use_video=False, collected=0, downloads=None, known_posts=None,
+                         image_width=None):
+    """
+    Opens candidate posts in a bounded pool of tabs and yields them in grid order
+    
+    Up to `concurrency` post tabs are processed at the same time, and each post
+    is yielded as soon as every post before it in the grid is done. Once `limit`
+    posts are known, no new tabs are opened and in-flight tabs for posts further
+    down the grid are cancelled, while earlier ones are allowed to finish.
+    
+    Args:
+        context: Browser context to open post tabs in
+        candidates: List of (post_idx, post_url, media_type) tuples in grid order;
+            media_type is None for posts the grid could not classify
+        username: Instagram username being scraped
+        current_image_dir: Directory for downloaded images
+        max_attempts: Number of grid candidates being considered
+        limit: Maximum number of posts to yield (None for all)
+        concurrency: Maximum number of open post tabs (default POST_TAB_CONCURRENCY)
+        force_use_video: Use video thumbnails instead of skipping video posts
+        collected: Number of posts collected before these candidates
+        downloads: Optional DownloadQueue image downloads are handed to
+        known_posts: Optional {shortcode: post} from a previous scrape; these posts
+            are reused without opening a tab while their image file still exists
+            (incremental mode)
+        image_width: Preferred image width (default IMAGE_TARGET_WIDTH)
+    """
+    if limit is not None and limit <= 0:
+        return
+    
+    concurrency = max(1, concurrency or POST_TAB_CONCURRENCY)
+    results = {}  # post_idx -> post data, or None for skipped posts
+    in_flight = {}  # task -> post_idx
+    order = [candidate[0] for candidate in candidates]
+    pending = iter(candidates)
+    next_pos = 0
+    yielded = 0
+    cutoff = None
+    
+    async def process(post_idx, post_url, media_type):
+        known = (known_posts or {}).get(shortcode_from_url(post_url))
+        if known:
+            reused = reuse_known_post(known, current_image_dir)
+            if reused.get("local_image_path"):
+                return reused
+            # The old image file is gone: open the post for a fresh image URL instead
+        
+        post_page = None
+        try:
+            post_page = await context.new_page()
+            with timer("page_goto_seconds", kind="post"):
+                await post_page.goto(post_url, wait_until="domcontentloaded")
+            found = sum(1 for post in results.values() if post)
+            with timer("post_extraction_seconds"):
+                return await extract_post(post_page, post_url, post_idx, max_attempts, collected + found,
+                                          username, current_image_dir, media_type=media_type,
+                                          force_use_video=force_use_video, downloads=downloads,
+                                          image_width=image_width)
+        finally:
+            await _close_quietly(post_page)
+    
+    def issue():
+        while cutoff is None and len(in_flight) < concurrency:
+            candidate = next(pending, None)
+            if candidate is None:
+                return
+            in_flight[asyncio.create_task(process(*candidate))] = candidate[0]
+    
+    issue()
+    try:
+        while in_flight:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                post_idx = in_flight.pop(task)
+                if task.cancelled():
+                    results[post_idx] = None
+                    continue
+                try:
+                    results[post_idx] = task.result()
+                except Exception as e:
+                    print(f"Error processing post {post_idx}: {str(e)}")
+                    results[post_idx] = None
+            
+            # Stop issuing work once the first `limit` posts in grid order are known
+            found = sorted(post_idx for post_idx, post in results.items() if post)
+            if limit is not None and len(found) >= limit:
+                cutoff = found[limit - 1]
+                for task, post_idx in in_flight.items():
+                    if post_idx > cutoff:
+                        task.cancel()
+            issue()
+            
+            # Hand out every post whose predecessors in the grid are all done
+            while next_pos < len(order) and order[next_pos] in results:
+                post_data = results[order[next_pos]]
+                next_pos += 1
+                if not post_data:
+                    continue
+                yield post_data
+                yielded += 1
+                if limit is not None and yielded >= limit:
+                    return
+    finally:
+        # Never leave post tabs running once the caller stops iterating
+        for task in in_flight:
+            task.cancel()
+
+async def _close_quietly(post_page):
+    if post_page is None:
+        return
+    try:
+        await post_page.close()
+    except:
+        pass
+
+def download_image(url, img_path):
+    """Downloads an image to img_path with the shared pooled downloader; returns True on success"""
+    return get_image_downloader().download(url, img_path)
+
+async def save_post_image(post_data, post_idx, image_posts_count, username, current_image_dir, downloads=None,
+                          image_width=None):
+    """
+    Downloads a post's image into current_image_dir and records local_image_path
+    
+    With a DownloadQueue the download is only queued, and local_image_path is set
+    once it completes; otherwise the download is awaited. A post with image_candidates
+    gets the size closest to image_width, recorded in image_width/image_height.
+    
+    Args:
+        post_data: Post dictionary with thumbnail_url and timestamp
+        post_idx: Index of the post in the profile grid (used for fallback filenames)
+        image_posts_count: Number of image posts collected before this one
+        username: Instagram username being scraped
+        current_image_dir: Directory for downloaded images
+        downloads: Optional DownloadQueue to hand the download to
+        image_width: Preferred image width (default IMAGE_TARGET_WIDTH; 0 for the largest)
+    """
+    image_width = IMAGE_TARGET_WIDTH if image_width is None else image_width
+    chosen = apply_image_choice(post_data, image_width)
+    # Sizes other than the largest are kept apart from it in the media store
+    if chosen:
+        variant = f"{chosen['width']}w" if chosen["width"] and image_width else None
+    else:
+        # No candidates (reused or cached posts): thumbnail_url is the size recorded when it was
+        # chosen, which may not be the largest
+        variant = f"{post_data['image_width']}w" if post_data.get("image_width") else None
+    
+    # Download the image if we have a URL
+    if post_data["thumbnail_url"]:
+        try:
+            # Create a sanitized filename
+            date_part = ""
+            if post_data["timestamp"]:
+                try:
+                    if "T" in post_data["timestamp"]:
+                        # ISO format: YYYY-MM-DDTHH:MM:SS
+                        dt = datetime.fromisoformat(post_data["timestamp"].replace("Z", "+00:00"))
+                        date_part = dt.strftime("%Y%m%d_%H%M%S")
+                    else:
+                        # Just use timestamp as is
+                        date_part = post_data["timestamp"].replace(" ", "_").replace(":", "").replace("/", "")
+                except:
+                    date_part = f"post_{post_idx}"
+            else:
+                date_part = f"post_{post_idx}"
+
+            # Generate filename
+            img_filename = f"{username}_{date_part}.jpg"
+            safe_filename = "".join([c for c in img_filename if c.isalpha() or c.isdigit() or c in "._- "]).strip()
+            img_path = os.path.join(current_image_dir, safe_filename)
+
+            # If this is not a screenshot we already saved
+            if not post_data.get("is_screenshot", False):
+                def on_downloaded(ok):
+                    emit("image_downloaded", username=username, path=img_path, ok=ok)
+                    if ok:
+                        # Update post data with local image path
+                        post_data["local_image_path"] = img_path
+                        print(f"Downloaded image for post {image_posts_count+1}")
+                
+                if downloads is not None:
+                    # Let the download overlap with the rest of the scrape
+                    downloads.put(post_data["thumbnail_url"], img_path, on_done=on_downloaded,
+                                  media_id=post_data.get("media_id"), variant=variant)
+                else:
+                    on_downloaded(await get_image_downloader().download_async(
+                        post_data["thumbnail_url"], img_path, post_data.get("media_id"), variant))
+            else:
+                # Already saved as screenshot
+                post_data["local_image_path"] = post_data["thumbnail_url"].replace("file://", "")
+        except Exception as e:
+            print(f"Error downloading image: {str(e)}")
+
+async def extract_profile_header_dom(page, profile_data):
+    """
+    Reads verification, bio, name, website and counts from the profile header DOM
+    
+    Fallback for when no profile info was captured from Instagram's API responses.
+    """
+    selector_registry = get_selector_registry()
+    bio_selectors = selector_registry.order("profile.bio", PROFILE_BIO_SELECTORS)
+    website_selectors = selector_registry.order("profile.website", PROFILE_WEBSITE_SELECTORS, fixed_tail=1)
+
+    # Read the whole header in one round-trip; anything the page script couldn't
+    # evaluate falls back to the per-field locators below
+    header = {}
+    try:
+        header = await page.evaluate(PROFILE_HEADER_SCRIPT, {
+            "verified": VERIFIED_BADGE_SELECTOR,
+            "bio": bio_selectors,
+            "bio_container": PROFILE_BIO_SELECTORS[0],
+            "name": PROFILE_NAME_SELECTOR,
+            "website": website_selectors,
+            "counts": PROFILE_COUNTS_SELECTOR
+        }) or {}
+    except Exception as e:
+        print(f"In-page header extraction failed, using per-field lookups: {str(e)}")
+        inc("selector_fallbacks_total", field="page_script")
+
+    # Check verification status
+    if header.get("verified") is not None:
+        profile_data["verified"] = header["verified"]
+    else:
+        try:
+            verified_badge = await page.locator(VERIFIED_BADGE_SELECTOR).count()
+            profile_data["verified"] = verified_badge > 0
+        except:
+            pass
+
+    # Enhanced bio extraction. Waiting for the bio container costs 5 s whenever its classes
+    # have changed, so once it keeps missing the registry goes straight to the spans.
+    if header.get("bio") is not None:
+        bio_text = record_page_match("profile.bio", bio_selectors, header["bio"], "bio")
+        if bio_text:
+            profile_data["bio"] = bio_text
+    else:
+        for selector_idx, selector in enumerate(bio_selectors):
+            bio_text = ""
+            try:
+                if selector == PROFILE_BIO_SELECTORS[0]:
+                    bio_div = await page.wait_for_selector(selector, timeout=5000)
+                    if bio_div:
+                        bio_text = (await bio_div.text_content()).strip()
+                else:
+                    for span in await page.locator(selector).all():
+                        bio_text += (await span.text_content()) + "\n"
+                    bio_text = bio_text.strip()
+            except:
+                pass
+            if bio_text:
+                profile_data["bio"] = bio_text
+                selector_registry.hit("profile.bio", selector)
+                if selector_idx:
+                    inc("selector_fallbacks_total", field="bio")
+                break
+            selector_registry.miss("profile.bio", selector)
+
+    # Extract name and website
+    try:
+        if header.get("real_name") is not None:
+            if header["real_name"]["index"] is not None:
+                profile_data["real_name"] = header["real_name"]["value"]
+        else:
+            name_element = page.locator(PROFILE_NAME_SELECTOR).first
+            if name_element:
+                profile_data["real_name"] = (await name_element.text_content()).strip()
+
+        if header.get("website") is not None:
+            website = record_page_match("profile.website", website_selectors, header["website"], "website")
+            if website:
+                profile_data["website"] = website
+        else:
+            for selector_idx, selector in enumerate(website_selectors):
+                for element in await page.locator(selector).all():
+                    href = await element.get_attribute("href")
+                    if href and not ("instagram.com" in href or "/explore/" in href or "/followers/" in href or "/following/" in href):
+                        profile_data["website"] = href
+                        break
+                if profile_data["website"]:
+                    selector_registry.hit("profile.website", selector)
+                    if selector_idx:
+                        inc("selector_fallbacks_total", field="website")
+                    break
+                selector_registry.miss("profile.website", selector)
+    except Exception as e:
+        print(f"Error extracting name/website details: {str(e)}")
+
+    # Extract counts (posts, followers, following)
+    try:
+        count_texts = header.get("counts")
+        if count_texts is None:
+            counts = await page.locator(PROFILE_COUNTS_SELECTOR).all()
+            count_texts = [await count.text_content() for count in counts[:3]]
+        parse_header_counts(count_texts, profile_data)
+    except Exception as e:
+        print(f"Error extracting counts: {str(e)}")
+
+def parse_header_counts(count_texts, profile_data):
+    """
+    Sets post_count, followers and following from the texts of the header's count items
+    
+    Args:
+        count_texts: Texts like ["1,234 posts", "2.5M followers", "300 following"]
+        profile_data: Profile dictionary to update
+    """
+    if len(count_texts) < 3:
+        return
+
+    try:
+        posts_text = count_texts[0]
+        profile_data["post_count"] = int(posts_text.split()[0].replace(',', ''))
+    except:
+        pass
+
+    try:
+        profile_data["followers"] = parse_count(count_texts[1].split()[0])
+        profile_data["following"] = parse_count(count_texts[2].split()[0])
+    except:
+        pass
+
+async def discover_post_links_dom(page, target_count=12):
+    """
+    Scrolls the profile grid and returns the post link elements found in the DOM
+    
+    Used when the grid hasn't rendered on its own: scrolls, scrolls harder and
+    finally reloads the page until about target_count links are present.
+    """
+    # Scroll down to load more posts, waiting only as long as the grid needs to grow
+    await scroll_grid(page, POST_LINK_SELECTOR, target_count=target_count, max_scrolls=5,
+                      step_timeout=2000, scroll_script="window.scrollBy(0, 1500);")
+
+    # Find posts using various selectors, in the order learned from earlier scrapes
+    post_elements = []
+    selector_registry = get_selector_registry()
+    selectors = selector_registry.order("profile.post_links", [
+        "article a[href*='/p/']",
+        "div._aagv a[href*='/p/'], div[style*='grid'] a[href*='/p/']",
+        "a[href*='/p/']"
+    ], fixed_tail=1)
+
+    async def find_posts():
+        for selector in selectors:
+            try:
+                found_posts = await page.locator(selector).all()
+            except:
+                found_posts = []
+            if found_posts:
+                selector_registry.hit("profile.post_links", selector)
+                return found_posts, selector
+            selector_registry.miss("profile.post_links", selector)
+        return [], None
+
+    found_posts, selector = await find_posts()
+    if found_posts:
+        post_elements = found_posts
+        print(f"Found {len(post_elements)} posts using selector: {selector}")
+
+    # If we still don't have enough posts, try scrolling more aggressively
+    if not post_elements or len(post_elements) < target_count:  # Try to get more than we need for fallbacks
+        print("Not enough posts found, scrolling more aggressively...")
+        await scroll_grid(page, POST_LINK_SELECTOR, target_count=target_count, max_scrolls=3, step_timeout=3000)
+
+        # Try to find posts again with all selectors
+        found_posts, _ = await find_posts()
+        if found_posts:
+            post_elements = found_posts
+            print(f"After aggressive scrolling, found {len(post_elements)} posts")
+
+    # If we still don't have enough posts, try a more targeted approach
+    if not post_elements or len(post_elements) < max(1, target_count // 2):
+        print("Still not enough posts, trying alternative approach...")
+        # Try to force-load the page with a reload and wait for the grid to render
+        await page.reload(wait_until="domcontentloaded")
+        await wait_for_selector(page, POST_LINK_SELECTOR, timeout=READY_TIMEOUT_MS)
+
+        # Scroll down in smaller increments
+        await scroll_grid(page, POST_LINK_SELECTOR, target_count=max(1, target_count // 2), max_scrolls=10,
+                          step_timeout=1000, scroll_script="window.scrollBy(0, 300);", patience=3)
+
+        # Try one last time with all selectors
+        found_posts, _ = await find_posts()
+        if found_posts:
+            post_elements = found_posts
+            print(f"Final attempt found {len(post_elements)} posts")
+    
+    return post_elements
+
+async def classify_grid_tiles(page, capture=None):
+    """
+    Classifies the post tiles currently rendered in the profile grid
+    
+    Media types seen in intercepted API responses take precedence over the
+    tile icons.
+    
+    Args:
+        page: Profile page with the grid loaded
+        capture: Optional ProfileResponseCapture for the same page
+    
+    Returns:
+        List of {"href", "media_type"} dictionaries in grid order; media_type is
+        "image", "carousel", "video" or None when the tile could not be classified
+    """
+    try:
+        tiles = await page.evaluate(GRID_CLASSIFY_SCRIPT, GRID_TILE_SELECTOR)
+    except Exception as e:
+        print(f"Error classifying grid tiles: {str(e)}")
+        return []
+    
+    for tile in tiles:
+        captured = capture.media.get(shortcode_from_url(tile["href"])) if capture else None
+        if captured:
+            tile["media_type"] = captured["media_type"]
+    return tiles
+
+def load_previous_profile(username):
+    """
+    Returns the last saved profile for username, or None
+    
+    Looks at output/product_data/<username>_profile.json first, then at the
+    profile cache regardless of the entry's age.
+    """
+    profile_path = os.path.join(output_dir, f"{username}_profile.json")
+    if os.path.exists(profile_path):
+        try:
+            with open(profile_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Error reading previous profile {profile_path}: {str(e)}")
+    try:
+        profile, _ = get_profile_cache().get(username, max_age=float("inf"))
+        return profile
+    except Exception as e:
+        print(f"Error reading cached profile for {username}: {str(e)}")
+        return None
+
+def known_posts_by_shortcode(profile):
+    """Maps shortcode -> post for the real (non-placeholder) posts of a profile"""
+    known = {}
+    for post in (profile or {}).get("posts", []):
+        if post.get("is_placeholder"):
+            continue
+        shortcode = post.get("shortcode") or shortcode_from_url(post.get("url"))
+        if shortcode:
+            known[shortcode] = post
+    return known
+
+def reuse_known_post(post, current_image_dir, fresh=None):
+    """
+    Returns a copy of a previously scraped post, with its image linked into current_image_dir
+    
+    Args:
+        post: Post dictionary from the previous scrape
+        current_image_dir: Directory for this scrape's images
+        fresh: Optional post data from this scrape whose counts/caption replace the old ones
+    """
+    reused = dict(post)
+    if fresh:
+        for key in ("likes", "comments_count", "caption", "hashtags", "thumbnail_url"):
+            if fresh.get(key):
+                reused[key] = fresh[key]
+    
+    old_path = post.get("local_image_path")
+    if old_path and os.path.exists(old_path):
+        new_path = os.path.join(current_image_dir, os.path.basename(old_path))
+        try:
+            link_or_copy(old_path, new_path)
+            reused["local_image_path"] = new_path
+        except OSError:
+            pass
+    else:
+        reused.pop("local_image_path", None)
+        if fresh:
+            # The image is downloaded again, so its size is chosen again from this scrape's candidates
+            for key in ("thumbnail_url", "image_width", "image_height", "image_candidates"):
+                if key in fresh:
+                    reused[key] = fresh[key]
+    return reused
+
+def summarize_changes(previous, current):
+    """Describes what changed between two scrapes of the same profile"""
+    previous_codes = list(known_posts_by_shortcode(previous))
+    current_codes = list(known_posts_by_shortcode(current))
+    changes = {
+        "previous_scraped_at": previous.get("scraped_at"),
+        "new_posts": [code for code in current_codes if code not in previous_codes],
+        "dropped_posts": [code for code in previous_codes if code not in current_codes]
+    }
+    for key in ("followers", "following", "post_count"):
+        changes[f"{key}_change"] = (current.get(key) or 0) - (previous.get(key) or 0)
+    for key in ("bio", "website", "real_name", "verified", "private"):
+        if previous.get(key) != current.get(key):
+            changes.setdefault("changed_fields", []).append(key)
+    return changes
+
+async def open_profile_page(page, username):
+    """
+    Opens a profile and waits for its header and API traffic to settle
+    
+    Returns:
+        ProfileResponseCapture attached to the page, or None if the profile doesn't exist
+    """
+    # Track Instagram's GraphQL/XHR traffic so we can wait for it to settle,
+    # and capture the profile/timeline JSON it returns
+    network = NetworkActivityTracker(page)
+    capture = ProfileResponseCapture(page, username)
+    
+    # Go to the user's profile and wait for the header (or the not-found message) to render
+    with timer("page_goto_seconds", kind="profile"):
+        await page.goto(f"https://www.instagram.com/{username}/", wait_until="domcontentloaded")
+    await wait_for_selector(page, f"header, {PROFILE_NOT_FOUND_SELECTOR}", timeout=READY_TIMEOUT_MS)
+    await network.wait_for_idle(timeout=NETWORK_IDLE_TIMEOUT)
+    network.detach()
+    await capture.settle()
+    
+    # Check if profile exists
+    if "Page Not Found" in await page.title() or "Sorry, this page isn't available." in await page.content():
+        capture.detach()
+        return None
+    return capture
+
+async def iter_profile_posts(page, username, limit=None, media_types=None, image_dir_override=None,
+                             post_concurrency=None, downloads=None, known_posts=None, capture=None,
+                             video_fallback=True, max_candidates=None, image_width=None):
+    """
+    Yields a profile's posts one at a time, as soon as each is extracted
+    
+    Timeline media from intercepted API responses comes first; the grid is then
+    read from the DOM and posts are opened in tabs for whatever is still missing.
+    The grid is only scrolled when more posts are needed, so stopping early
+    avoids both scrolling and post tabs.
+    
+    Args:
+        page: The Playwright page object
+        username: Instagram username to scrape
+        limit: Maximum number of posts to yield (None: until the grid runs out)
+        media_types: MEDIA_TYPE_* values to yield (default image and carousel posts);
+            unclassified grid tiles are opened and checked in the post page
+        image_dir_override: Optional custom directory for saving images
+        post_concurrency: Number of post tabs loaded in parallel (default POST_TAB_CONCURRENCY)
+        downloads: Optional DownloadQueue to queue image downloads on; without one
+            each post's image is downloaded before the post is yielded
+        known_posts: Optional {shortcode: post} from a previous scrape (incremental mode)
+        capture: ProfileResponseCapture of a profile page already opened with
+            open_profile_page; without one the profile is opened here
+        video_fallback: Use video thumbnails if fewer than 4 image posts turn up
+        max_candidates: Grid tiles to consider at most (default max(MAX_POST_CANDIDATES, 8 * limit))
+        image_width: Preferred image width (default IMAGE_TARGET_WIDTH; 0 for the largest)
+    """
+    if limit is not None and limit <= 0:
+        return
+    
+    media_types = tuple(media_types or (MEDIA_TYPE_IMAGE, MEDIA_TYPE_CAROUSEL))
+    include_videos = MEDIA_TYPE_VIDEO in media_types
+    max_candidates = max_candidates or max(MAX_POST_CANDIDATES, 8 * (limit or 0))
+    known_posts = known_posts or {}
+    current_image_dir = image_dir_override if image_dir_override else image_dir
+    os.makedirs(current_image_dir, exist_ok=True)
+    
+    owns_capture = capture is None
+    if owns_capture:
+        capture = await open_profile_page(page, username)
+        if capture is None:
+            print(f"Profile not found: {username}")
+            return
+    
+    yielded = 0
+    seen_shortcodes = set()
+    
+    def remaining():
+        return None if limit is None else limit - yielded
+    
+    try:
+        # Timeline media intercepted from Instagram's API responses - no post pages needed
+        await capture.settle()
+        while capture.media:
+            for post_data in capture.posts(media_types):
+                if post_data["shortcode"] in seen_shortcodes:
+                    continue
+                known = known_posts.get(post_data["shortcode"])
+                if known and known.get("local_image_path"):
+                    post_data = reuse_known_post(known, current_image_dir, fresh=post_data)
+                if not post_data.get("local_image_path"):
+                    await save_post_image(post_data, yielded, yielded, username, current_image_dir, downloads,
+                                          image_width=image_width)
+                seen_shortcodes.add(post_data["shortcode"])
+                yield post_data
+                yielded += 1
+                if remaining() == 0:
+                    return
+            
+            # Scroll so Instagram requests the next timeline page
+            media_before = len(capture.media)
+            if media_before >= max_candidates:
+                break
+            with timer("grid_discovery_seconds", method="network"):
+                await page.evaluate("window.scrollTo(0, document.body.scrollHeight);")
+                await wait_until(lambda: len(capture.media) > media_before, timeout=3.0)
+                await capture.settle()
+            if len(capture.media) == media_before:
+                break
+        if yielded:
+            print(f"Extracted {yielded} posts from intercepted API responses")
+        
+        # Fall back to the DOM grid and post pages for whatever is still missing
+        seen_urls = set()
+        held_videos = []
+        grid_idx = 0
+        stalled = 0
+        first_pass = True
+        while grid_idx < max_candidates and stalled < 2:
+            with timer("grid_discovery_seconds", method="dom") as discovery:
+                if not first_pass:
+                    # Load the next rows of the grid only now that more posts are needed
+                    rendered = await page.locator(GRID_TILE_SELECTOR).count()
+                    await scroll_grid(page, GRID_TILE_SELECTOR, target_count=rendered + 1, max_scrolls=1,
+                                      step_timeout=2000, scroll_script="window.scrollBy(0, 1500);")
+                
+                # Classify the grid tiles so only matching posts need a tab
+                tiles = await classify_grid_tiles(page, capture)
+                if not tiles and first_pass:
+                    # The grid hasn't rendered - scroll, reload and fall back to the raw links
+                    discovery["method"] = "links"
+                    inc("selector_fallbacks_total", field="post_links")
+                    for post in await discover_post_links_dom(page, target_count=2 * limit if limit else 12):
+                        try:
+                            tiles.append({"href": await post.get_attribute("href"), "media_type": None})
+                        except Exception as e:
+                            print(f"Error reading post link: {str(e)}")
+            first_pass = False
+            
+            candidates = []
+            new_tiles = 0
+            for tile in tiles:
+                post_url = tile["href"]
+                if not post_url:
+                    continue
+                # Fix for relative URLs - ensure we have the full Instagram URL
+                if post_url.startswith('/'):
+                    post_url = f"https://www.instagram.com{post_url}"
+                if post_url in seen_urls or grid_idx >= max_candidates:
+                    continue
+                seen_urls.add(post_url)
+                new_tiles += 1
+                post_idx = grid_idx
+                grid_idx += 1
+                
+                # Skip reels unless videos were asked for, and posts already yielded
+                if shortcode_from_url(post_url) in seen_shortcodes:
+                    continue
+                if "/reel/" in post_url and not include_videos:
+                    inc("videos_skipped_total", where="grid")
+                    continue
+                if tile["media_type"] == MEDIA_TYPE_VIDEO and not include_videos:
+                    inc("videos_skipped_total", where="grid")
+                    held_videos.append((post_idx, post_url, tile["media_type"]))
+                    continue
+                if tile["media_type"] is not None and tile["media_type"] not in media_types:
+                    continue
+                candidates.append((post_idx, post_url, tile["media_type"]))
+            
+            stalled = 0 if new_tiles else stalled + 1
+            if not candidates:
+                continue
+            
+            posts = iter_post_tabs(page.context, candidates, username, current_image_dir, max_candidates,
+                                   limit=remaining(), concurrency=post_concurrency, force_use_video=include_videos,
+                                   collected=yielded, downloads=downloads, known_posts=known_posts,
+                                   image_width=image_width)
+            try:
+                async for post_data in posts:
+                    seen_shortcodes.add(post_data["shortcode"])
+                    yield post_data
+                    yielded += 1
+                    if remaining() == 0:
+                        return
+            finally:
+                await posts.aclose()
+        
+        # Running low on image posts - fall back to video thumbnails
+        wanted = 4 if limit is None else min(4, limit)
+        if video_fallback and held_videos and yielded < wanted:
+            print(f"Only {yielded} image posts found, using video thumbnails as fallback")
+            posts = iter_post_tabs(page.context, held_videos, username, current_image_dir, max_candidates,
+                                   limit=remaining(), concurrency=post_concurrency, force_use_video=True,
+                                   collected=yielded, downloads=downloads, known_posts=known_posts,
+                                   image_width=image_width)
+            try:
+                async for post_data in posts:
+                    yield post_data
+                    yielded += 1
+            finally:
+                await posts.aclose()
+    finally:
+        if owns_capture:
+            capture.detach()
+
 # Function to scrape profile data
-def scrape_profile(page, username, image_dir_override=None):
+async def scrape_profile_async(page, username, image_dir_override=None, post_concurrency=None,
+                               incremental=False, previous_profile=None, post_target=None, image_width=None):
     """
     Scrapes an Instagram profile
     
+    In incremental mode, posts already present in the previous profile are reused
+    instead of being opened and downloaded again; only new posts are fetched, the
+    counts are refreshed, and profile_data["changes"] summarizes the difference.
+    
     Args:
         page: The Playwright page object
         username: Instagram username to scrape
         image_dir_override: Optional custom directory for saving images
+        post_concurrency: Number of post tabs loaded in parallel (default POST_TAB_CONCURRENCY)
+        incremental: Reuse posts from the last saved profile (see load_previous_profile)
+        previous_profile: Previous profile to update incrementally (implies incremental)
+        post_target: Number of image posts to collect (default PROFILE_POST_TARGET);
+            missing posts are filled with placeholders
+        image_width: Preferred image width, e.g. small for LLM analysis
+            (default IMAGE_TARGET_WIDTH; 0 for the largest)
     
     Returns:
         Dictionary with profile data or None if failed
     """
+    post_target = PROFILE_POST_TARGET if post_target is None else post_target
     profile_data = {
         "username": username,
         "private": False,
@@ -114,494 +1314,90 @@ def scrape_profile(page, username, image_dir_override=None):
         "post_count": 0,
         "followers": 0,
         "following": 0,
+        "scraped_at": datetime.now().isoformat(),
         "posts": []  # Will store information about the latest posts
     }
     
+    # Incremental mode: posts we already have don't need a tab or a download
+    if previous_profile is None and incremental:
+        previous_profile = load_previous_profile(username)
+    known_posts = known_posts_by_shortcode(previous_profile)
+    if known_posts:
+        print(f"Incremental scrape of {username}: {len(known_posts)} posts known from the last run")
+    
     # Use the specified image directory if provided, otherwise use the default
     current_image_dir = image_dir_override if image_dir_override else image_dir
     
     # Ensure the image directory exists
     os.makedirs(current_image_dir, exist_ok=True)
     
+    # Image downloads run alongside the scrape and are awaited before the profile is saved
+    downloads = DownloadQueue()
+    
     try:
-        # Go to the user's profile
-        page.goto(f"https://www.instagram.com/{username}/")
-        time.sleep(5)
-        
-        # Check if profile exists
-        if "Page Not Found" in page.title() or "Sorry, this page isn't available." in page.content():
+        capture = await open_profile_page(page, username)
+        if capture is None:
             print(f"Profile not found: {username}")
             return None
         
         # Extract profile data using modern selectors
         try:
             # Find header section
-            header = page.wait_for_selector("header", timeout=10000)
+            header = await page.wait_for_selector("header", timeout=10000)
             
-            # Check verification status
-            try:
-                verified_badge = page.locator("header span[aria-label*='Verified']").count()
-                profile_data["verified"] = verified_badge > 0
-            except:
-                pass
-            
-            # Enhanced bio extraction
-            try:
-                bio_div = page.wait_for_selector(
-                    "div.-vDIg, div.QGPIr, div.xqs5bz0, div._aa_c",
-                    timeout=5000
-                )
-                if bio_div:
-                    profile_data["bio"] = bio_div.text_content().strip()
-            except:
-                # Try alternative bio selectors if the first approach fails
-                try:
-                    bio_spans = page.locator("header section > div > span, section h1 ~ span").all()
-                    if bio_spans:
-                        bio_text = ""
-                        for span in bio_spans:
-                            bio_text += span.text_content() + "\n"
-                        profile_data["bio"] = bio_text.strip()
-                except:
-                    pass
-            
-            # Extract name and website
-            try:
-                name_element = page.locator("section h2, header h2, h2._aacl").first
-                if name_element:
-                    profile_data["real_name"] = name_element.text_content().strip()
-                
-                website_elements = page.locator("a[rel*='me'], a[rel*='nofollow']").all()
-                if not website_elements:
-                    website_elements = page.locator("a:not([href*='instagram.com']):not([href*='/explore/'])").all()
-                
-                for element in website_elements:
-                    href = element.get_attribute("href")
-                    if href and not ("instagram.com" in href or "/explore/" in href or "/followers/" in href or "/following/" in href):
-                        profile_data["website"] = href
-                        break
-            except Exception as e:
-                print(f"Error extracting name/website details: {str(e)}")
-            
-            # Extract counts (posts, followers, following)
-            try:
-                counts = page.locator("header ul li, section ul li, li._aa_5").all()
-                
-                if len(counts) >= 3:
-                    try:
-                        posts_text = counts[0].text_content()
-                        profile_data["post_count"] = int(posts_text.split()[0].replace(',', ''))
-                    except:
-                        pass
-                    
-                    try:
-                        followers_text = counts[1].text_content()
-                        followers_count = followers_text.split()[0]
-                        if 'k' in followers_count.lower():
-                            profile_data["followers"] = int(float(followers_count.replace('k', '')) * 1000)
-                        elif 'm' in followers_count.lower():
-                            profile_data["followers"] = int(float(followers_count.replace('m', '')) * 1000000)
-                        else:
-                            profile_data["followers"] = int(followers_count.replace(',', ''))
-                    except:
-                        pass
-                    
-                    try:
-                        following_text = counts[2].text_content()
-                        following_count = following_text.split()[0]
-                        if 'k' in following_count.lower():
-                            profile_data["following"] = int(float(following_count.replace('k', '')) * 1000)
-                        elif 'm' in following_count.lower():
-                            profile_data["following"] = int(float(following_count.replace('m', '')) * 1000000)
-                        else:
-                            profile_data["following"] = int(following_count.replace(',', ''))
-                    except:
-                        pass
-            except Exception as e:
-                print(f"Error extracting counts: {str(e)}")
+            # Prefer the profile info Instagram fetched as JSON; read the header DOM only as a fallback
+            if capture.apply_profile(profile_data):
+                print(f"Profile info for {username} taken from intercepted API responses")
+            else:
+                inc("selector_fallbacks_total", field="header")
+                await extract_profile_header_dom(page, profile_data)
+            emit("profile_opened", username=username, followers=profile_data["followers"],
+                 following=profile_data["following"], post_count=profile_data["post_count"])
             
-            # Now extract exactly 6 image posts - this is the part we're improving
             try:
-                print(f"Extracting exactly 6 image posts for {username}...")
+                print(f"Extracting {post_target} image posts for {username}...")
                 
                 # Check if profile is private first
-                private_indicators = page.locator("h2:has-text('This Account is Private')").count()
+                private_indicators = await page.locator("h2:has-text('This Account is Private')").count()
                 if private_indicators > 0:
                     profile_data["private"] = True
                     print(f"Warning: {username} is a private account. May not be able to extract posts.")
                 
-                # Scroll down to load more posts - do this multiple times to ensure we have enough posts
-                for scroll_attempt in range(5):
-                    page.evaluate(f"window.scrollBy(0, {1000 * (scroll_attempt + 1)});")
-                    time.sleep(2)
-                
-                # Find posts using various selectors
-                post_elements = []
-                selectors = [
-                    "article a[href*='/p/']",
-                    "div._aagv a[href*='/p/'], div[style*='grid'] a[href*='/p/']",
-                    "a[href*='/p/']"
-                ]
+                # Take posts from the lazy iterator until we have enough
+                async for post_data in iter_profile_posts(
+                    page, username, limit=post_target, image_dir_override=current_image_dir,
+                    post_concurrency=post_concurrency, downloads=downloads,
+                    known_posts=known_posts, capture=capture, image_width=image_width
+                ):
+                    profile_data["posts"].append(post_data)
+                    emit("post_extracted", username=username, index=len(profile_data["posts"]),
+                         shortcode=post_data.get("shortcode"), url=post_data.get("url"),
+                         source=post_data.get("source", "page"))
+                image_posts_count = len(profile_data["posts"])
                 
-                for selector in selectors:
-                    try:
-                        found_posts = page.locator(selector).all()
-                        if found_posts and len(found_posts) > 0:
-                            post_elements = found_posts
-                            print(f"Found {len(post_elements)} posts using selector: {selector}")
-                            break
-                    except:
-                        continue
+                # Private accounts and accounts without posts get explanatory placeholders
+                placeholder_caption = ""
+                placeholder_reason = "short"
+                if image_posts_count == 0:
+                    if profile_data["private"]:
+                        print(f"WARNING: {username} is private with no visible posts. Creating placeholders.")
+                        placeholder_caption = "Private account - no visible posts"
+                        placeholder_reason = "private"
+                    else:
+                        print(f"WARNING: No posts found for {username}. Creating placeholders.")
+                        placeholder_caption = "No posts available"
+                        placeholder_reason = "no_posts"
+                if image_posts_count < post_target:
+                    inc("placeholder_posts_total", post_target - image_posts_count, reason=placeholder_reason)
                 
-                # If we still don't have enough posts, try scrolling more aggressively
-                if not post_elements or len(post_elements) < 12:  # Try to get more than we need for fallbacks
-                    print("Not enough posts found, scrolling more aggressively...")
-                    for _ in range(3):
-                        page.evaluate("window.scrollTo(0, document.body.scrollHeight);")
-                        time.sleep(3)
-                    
-                    # Try to find posts again with all selectors
-                    for selector in selectors:
-                        try:
-                            found_posts = page.locator(selector).all()
-                            if found_posts and len(found_posts) > 0:
-                                post_elements = found_posts
-                                print(f"After aggressive scrolling, found {len(post_elements)} posts")
-                                break
-                        except:
-                            continue
-                
-                # If we still don't have enough posts, try a more targeted approach
-                if not post_elements or len(post_elements) < 6:
-                    print("Still not enough posts, trying alternative approach...")
-                    # Try to force-load the page with a reload and wait longer
-                    page.reload()
-                    time.sleep(5)
-                    
-                    # Scroll down in smaller increments
-                    for i in range(10):
-                        page.evaluate(f"window.scrollBy(0, 300);")
-                        time.sleep(1)
-                    
-                    # Try one last time with all selectors
-                    for selector in selectors:
-                        try:
-                            found_posts = page.locator(selector).all()
-                            if found_posts and len(found_posts) > 0:
-                                post_elements = found_posts
-                                print(f"Final attempt found {len(post_elements)} posts")
-                                break
-                        except:
-                            continue
-                
-                # Process posts to get exactly 6 image posts
-                image_posts_count = 0
-                processed_urls = set()  # Keep track of posts we've already processed
-                
-                # If we have private account with no visible posts
-                if profile_data["private"] and (not post_elements or len(post_elements) == 0):
-                    print(f"WARNING: {username} is private with no visible posts. Creating placeholders.")
-                    # Create 6 placeholder posts
-                    for i in range(6):
-                        placeholder_post = {
-                            "url": f"https://www.instagram.com/{username}/",
-                            "thumbnail_url": "",
-                            "timestamp": datetime.now().isoformat(),
-                            "caption": "Private account - no visible posts",
-                            "likes": 0,
-                            "comments": [],
-                            "comments_count": 0,
-                            "is_placeholder": True
-                        }
-                        profile_data["posts"].append(placeholder_post)
-                        image_posts_count += 1
-                    
-                    print(f"Created {image_posts_count} placeholder posts for private account")
-                elif not post_elements or len(post_elements) == 0:
-                    print(f"WARNING: No posts found for {username}. Creating placeholders.")
-                    # Create 6 placeholder posts for accounts with no posts
-                    for i in range(6):
-                        placeholder_post = {
-                            "url": f"https://www.instagram.com/{username}/",
-                            "thumbnail_url": "",
-                            "timestamp": datetime.now().isoformat(),
-                            "caption": "No posts available",
-                            "likes": 0,
-                            "comments": [],
-                            "comments_count": 0,
-                            "is_placeholder": True
-                        }
-                        profile_data["posts"].append(placeholder_post)
-                        image_posts_count += 1
-                    
-                    print(f"Created {image_posts_count} placeholder posts for account with no posts")
-                else:
-                    # Process up to 30 posts to find 6 images - this gives us plenty of attempts
-                    # in case some posts are videos or stories
-                    print(f"Found {len(post_elements)} posts. Processing to find 6 image posts...")
-                    
-                    max_attempts = min(50, len(post_elements))  # Try up to 50 posts to find 6 images
-                    for post_idx, post in enumerate(post_elements[:max_attempts]):
-                        if image_posts_count >= 6:
-                            break
-                        
-                        try:
-                            post_url = post.get_attribute("href")
-                            
-                            # Skip if we've already processed this URL
-                            if post_url in processed_urls:
-                                continue
-                            
-                            processed_urls.add(post_url)
-                            
-                            # Skip reels
-                            if "/reel/" in post_url:
-                                continue
-                            
-                            # Fix for relative URLs - ensure we have the full Instagram URL
-                            if post_url.startswith('/'):
-                                post_url = f"https://www.instagram.com{post_url}"
-                            
-                            # Open post in a new page
-                            post_page = page.context.new_page()
-                            post_page.goto(post_url)
-                            time.sleep(3)
-                            
-                            # Check if it's really an image post (not a video, carousel with videos, or reel)
-                            is_video = False
-                            
-                            # Check for video elements
-                            video_elements = post_page.locator("video").count()
-                            if video_elements > 0:
-                                is_video = True
-                            
-                            # Also check for video indicators in the UI
-                            if not is_video:
-                                video_indicators = post_page.locator("span[aria-label*='Video'], span[class*='video']").count()
-                                if video_indicators > 0:
-                                    is_video = True
-                            
-                            # Check for special video player UI elements
-                            if not is_video:
-                                video_ui_elements = post_page.locator("div._abpo, div[aria-label*='Play'], div[aria-label*='Pause']").count()
-                                if video_ui_elements > 0:
-                                    is_video = True
-                            
-                            # If it's a video, try to get the thumbnail anyway if we're running low on posts
-                            force_use_video = False
-                            if is_video and (post_idx >= max_attempts - 12) and image_posts_count < 4:
-                                print(f"Running low on posts, using video thumbnail as fallback for post #{image_posts_count+1}")
-                                force_use_video = True
-                            
-                            if is_video and not force_use_video:
-                                # Close the post page and skip this post
-                                post_page.close()
-                                continue
-                            
-                            # Create post data
-                            post_data = {
-                                "url": post_url,
-                                "thumbnail_url": "",
-                                "timestamp": "",
-                                "caption": "",
-                                "likes": 0,
-                                "comments": [],
-                                "comments_count": 0
-                            }
-                            
-                            # Get high-resolution image
-                            try:
-                                # Try multiple selectors for finding the image
-                                selectors = [
-                                    "article div[role='button'] img",
-                                    "article img:not([alt*='profile picture'])",
-                                    "div[role='dialog'] article img",
-                                    "div[role='dialog'] img:not([alt*='profile picture'])",
-                                    "img[alt*='Photo by']",  # Common alt text format
-                                    "img[sizes*='px']",      # Images typically have sizes attribute
-                                    "img[src*='instagram']"  # Any Instagram-hosted image
-                                ]
-                                
-                                for selector in selectors:
-                                    try:
-                                        img_element = post_page.locator(selector).first
-                                        if img_element:
-                                            post_data["thumbnail_url"] = img_element.get_attribute("src")
-                                            print(f"Found high-res image for post {image_posts_count+1}")
-                                            break
-                                    except:
-                                        continue
-                                
-                                # If we couldn't find an image, try taking a screenshot as last resort
-                                if not post_data["thumbnail_url"] and image_posts_count < 5:
-                                    try:
-                                        print(f"No image found, taking screenshot for post {image_posts_count+1}")
-                                        screenshot_path = os.path.join(current_image_dir, f"{username}_post_{image_posts_count+1}_screenshot.jpg")
-                                        post_page.screenshot(path=screenshot_path)
-                                        post_data["thumbnail_url"] = f"file://{screenshot_path}"  # Local file URL
-                                        post_data["is_screenshot"] = True
-                                    except Exception as ss_error:
-                                        print(f"Error taking screenshot: {str(ss_error)}")
-                                
-                                if not post_data["thumbnail_url"]:
-                                    post_page.close()
-                                    continue
-                            except Exception as e:
-                                print(f"Error getting high-res image: {str(e)}")
-                                post_page.close()
-                                continue
-                            
-                            # Get post caption
-                            try:
-                                caption_selectors = [
-                                    "div.C7I1f, div._a9zr, div[role='menuitem'] span, div._a9zs",
-                                    "h1+span, div[role='dialog'] span:has-text(' ')",
-                                    "article div > span > div > span"
-                                ]
-                                
-                                for selector in caption_selectors:
-                                    caption_elements = post_page.locator(selector).all()
-                                    if caption_elements and len(caption_elements) > 0:
-                                        post_data["caption"] = caption_elements[0].text_content().strip()
-                                        break
-                                
-                                # Extract hashtags from caption
-                                if post_data["caption"]:
-                                    # Continue with existing code by adding the rest of the function
-                                    hashtags = []
-                                    words = post_data["caption"].split()
-                                    for word in words:
-                                        if word.startswith("#"):
-                                            hashtags.append(word)
-                                    
-                                    post_data["hashtags"] = hashtags
-                            except Exception as e:
-                                print(f"Error extracting caption: {str(e)}")
-                            
-                            # Get post timestamp
-                            try:
-                                time_selectors = [
-                                    "time[datetime]",
-                                    "div._aaqe, div._aaqf, div[class*='timestamp']"
-                                ]
-                                
-                                for selector in time_selectors:
-                                    time_elements = post_page.locator(selector).all()
-                                    if time_elements and len(time_elements) > 0:
-                                        timestamp = time_elements[0].get_attribute("datetime")
-                                        if timestamp:
-                                            post_data["timestamp"] = timestamp
-                                            break
-                                        
-                                        timestamp_text = time_elements[0].text_content().strip()
-                                        if timestamp_text:
-                                            post_data["timestamp"] = timestamp_text
-                                            break
-                            except Exception as e:
-                                print(f"Error extracting timestamp: {str(e)}")
-                            
-                            # Get post likes/views
-                            try:
-                                like_selectors = [
-                                    "section:has(span[aria-label*='like']), div._aacl:has-text('likes'), div[role='dialog'] span:has-text('likes')",
-                                    "span[class*='like'], span.zV_eT, span._aap9"
-                                ]
-                                
-                                for selector in like_selectors:
-                                    like_elements = post_page.locator(selector).all()
-                                    if like_elements and len(like_elements) > 0:
-                                        like_text = like_elements[0].text_content().strip()
-                                        
-                                        # Extract just the number from text like "123 likes"
-                                        like_text = ''.join(filter(lambda x: x.isdigit() or x in 'km,.', like_text.lower()))
-                                        post_data["likes"] = parse_count(like_text)
-                                        break
-                            except Exception as e:
-                                print(f"Error extracting likes: {str(e)}")
-                            
-                            # Get comments count
-                            try:
-                                comment_selectors = [
-                                    "div[role='dialog'] span:has-text('comments'), span:has-text('View all')",
-                                    "ul > li:has-text('comments'), span[class*='comment'], span._acbn"
-                                ]
-                                
-                                for selector in comment_selectors:
-                                    comment_elements = post_page.locator(selector).all()
-                                    if comment_elements and len(comment_elements) > 0:
-                                        comment_text = comment_elements[0].text_content().strip()
-                                        
-                                        # Extract just the number from text like "View all 123 comments"
-                                        if "comments" in comment_text.lower():
-                                            comment_text = comment_text.lower().replace("comments", "").replace("view all", "").strip()
-                                            post_data["comments_count"] = parse_count(comment_text)
-                                            break
-                            except Exception as e:
-                                print(f"Error extracting comments count: {str(e)}")
-                            
-                            # Download the image if we have a URL
-                            if post_data["thumbnail_url"]:
-                                try:
-                                    # Create a sanitized filename
-                                    date_part = ""
-                                    if post_data["timestamp"]:
-                                        try:
-                                            if "T" in post_data["timestamp"]:
-                                                # ISO format: YYYY-MM-DDTHH:MM:SS
-                                                dt = datetime.fromisoformat(post_data["timestamp"].replace("Z", "+00:00"))
-                                                date_part = dt.strftime("%Y%m%d_%H%M%S")
-                                            else:
-                                                # Just use timestamp as is
-                                                date_part = post_data["timestamp"].replace(" ", "_").replace(":", "").replace("/", "")
-                                        except:
-                                            date_part = f"post_{image_posts_count}"
-                                    else:
-                                        date_part = f"post_{image_posts_count}"
-                                    
-                                    # Generate filename
-                                    img_filename = f"{username}_{date_part}.jpg"
-                                    safe_filename = "".join([c for c in img_filename if c.isalpha() or c.isdigit() or c in "._- "]).strip()
-                                    img_path = os.path.join(current_image_dir, safe_filename)
-                                    
-                                    # If this is not a screenshot we already saved
-                                    if not post_data.get("is_screenshot", False):
-                                        # Download the image
-                                        response = requests.get(post_data["thumbnail_url"], headers={"User-Agent": "Mozilla/5.0"})
-                                        if response.status_code == 200:
-                                            with open(img_path, "wb") as f:
-                                                f.write(response.content)
-                                            
-                                            # Update post data with local image path
-                                            post_data["local_image_path"] = img_path
-                                            print(f"Downloaded image for post {image_posts_count+1}")
-                                    else:
-                                        # Already saved as screenshot
-                                        post_data["local_image_path"] = post_data["thumbnail_url"].replace("file://", "")
-                                except Exception as e:
-                                    print(f"Error downloading image: {str(e)}")
-                            
-                            # Add the post data to our list
-                            profile_data["posts"].append(post_data)
-                            image_posts_count += 1
-                            
-                            # Close the post page
-                            post_page.close()
-                            
-                        except Exception as e:
-                            print(f"Error processing post {post_idx}: {str(e)}")
-                            try:
-                                post_page.close()
-                            except:
-                                pass
-                
-                # If we still don't have enough posts, add placeholders to reach exactly 6
-                while image_posts_count < 6:
-                    print(f"Adding placeholder post #{image_posts_count+1} to reach 6 total posts")
+                # If we still don't have enough posts, add placeholders to reach the target
+                while image_posts_count < post_target:
+                    print(f"Adding placeholder post #{image_posts_count+1} to reach {post_target} total posts")
                     placeholder_post = {
                         "url": f"https://www.instagram.com/{username}/",
                         "thumbnail_url": "",
                         "timestamp": datetime.now().isoformat(),
-                        "caption": "",
+                        "caption": placeholder_caption,
                         "likes": 0,
                         "comments": [],
                         "comments_count": 0,
@@ -609,269 +1405,16 @@ def scrape_profile(page, username, image_dir_override=None):
                     }
                     profile_data["posts"].append(placeholder_post)
                     image_posts_count += 1
-                    
-                    print(f"Created {image_posts_count} placeholder posts for account with no posts")
-                else:
-                    # Process up to 30 posts to find 6 images - this gives us plenty of attempts
-                    # in case some posts are videos or stories
-                    print(f"Found {len(post_elements)} posts. Processing to find 6 image posts...")
-                    
-                    max_attempts = min(50, len(post_elements))  # Try up to 50 posts to find 6 images
-                    for post_idx, post in enumerate(post_elements[:max_attempts]):
-                        if image_posts_count >= 6:
-                            break
-                        
-                        try:
-                            post_url = post.get_attribute("href")
-                            
-                            # Skip if we've already processed this URL
-                            if post_url in processed_urls:
-                                continue
-                            
-                            processed_urls.add(post_url)
-                            
-                            # Skip reels
-                            if "/reel/" in post_url:
-                                continue
-                            
-                            # Fix for relative URLs - ensure we have the full Instagram URL
-                            if post_url.startswith('/'):
-                                post_url = f"https://www.instagram.com{post_url}"
-                            
-                            # Open post in a new page
-                            post_page = page.context.new_page()
-                            post_page.goto(post_url)
-                            time.sleep(3)
-                            
-                            # Check if it's really an image post (not a video, carousel with videos, or reel)
-                            is_video = False
-                            
-                            # Check for video elements
-                            video_elements = post_page.locator("video").count()
-                            if video_elements > 0:
-                                is_video = True
-                            
-                            # Also check for video indicators in the UI
-                            if not is_video:
-                                video_indicators = post_page.locator("span[aria-label*='Video'], span[class*='video']").count()
-                                if video_indicators > 0:
-                                    is_video = True
-                            
-                            # Check for special video player UI elements
-                            if not is_video:
-                                video_ui_elements = post_page.locator("div._abpo, div[aria-label*='Play'], div[aria-label*='Pause']").count()
-                                if video_ui_elements > 0:
-                                    is_video = True
-                            
-                            # If it's a video, try to get the thumbnail anyway if we're running low on posts
-                            force_use_video = False
-                            if is_video and (post_idx >= max_attempts - 12) and image_posts_count < 4:
-                                print(f"Running low on posts, using video thumbnail as fallback for post #{image_posts_count+1}")
-                                force_use_video = True
-                            
-                            if is_video and not force_use_video:
-                                # Close the post page and skip this post
-                                post_page.close()
-                                continue
-                            
-                            # Create post data
-                            post_data = {
-                                "url": post_url,
-                                "thumbnail_url": "",
-                                "timestamp": "",
-                                "caption": "",
-                                "likes": 0,
-                                "comments": [],
-                                "comments_count": 0
-                            }
-                            
-                            # Get high-resolution image
-                            try:
-                                # Try multiple selectors for finding the image
-                                selectors = [
-                                    "article div[role='button'] img",
-                                    "article img:not([alt*='profile picture'])",
-                                    "div[role='dialog'] article img",
-                                    "div[role='dialog'] img:not([alt*='profile picture'])",
-                                    "img[alt*='Photo by']",  # Common alt text format
-                                    "img[sizes*='px']",      # Images typically have sizes attribute
-                                    "img[src*='instagram']"  # Any Instagram-hosted image
-                                ]
-                                
-                                for selector in selectors:
-                                    try:
-                                        img_element = post_page.locator(selector).first
-                                        if img_element:
-                                            post_data["thumbnail_url"] = img_element.get_attribute("src")
-                                            print(f"Found high-res image for post {image_posts_count+1}")
-                                            break
-                                    except:
-                                        continue
-                                
-                                # If we couldn't find an image, try taking a screenshot as last resort
-                                if not post_data["thumbnail_url"] and image_posts_count < 5:
-                                    try:
-                                        print(f"No image found, taking screenshot for post {image_posts_count+1}")
-                                        screenshot_path = os.path.join(current_image_dir, f"{username}_post_{image_posts_count+1}_screenshot.jpg")
-                                        post_page.screenshot(path=screenshot_path)
-                                        post_data["thumbnail_url"] = f"file://{screenshot_path}"  # Local file URL
-                                        post_data["is_screenshot"] = True
-                                    except Exception as ss_error:
-                                        print(f"Error taking screenshot: {str(ss_error)}")
-                                
-                                if not post_data["thumbnail_url"]:
-                                    post_page.close()
-                                    continue
-                            except Exception as e:
-                                print(f"Error getting high-res image: {str(e)}")
-                                post_page.close()
-                                continue
-                            
-                            # Get post caption
-                            try:
-                                caption_selectors = [
-                                    "div.C7I1f, div._a9zr, div[role='menuitem'] span, div._a9zs",
-                                    "h1+span, div[role='dialog'] span:has-text(' ')",
-                                    "article div > span > div > span"
-                                ]
-                                
-                                for selector in caption_selectors:
-                                    caption_elements = post_page.locator(selector).all()
-                                    if caption_elements and len(caption_elements) > 0:
-                                        post_data["caption"] = caption_elements[0].text_content().strip()
-                                        break
-                                
-                                # Extract hashtags from caption
-                                if post_data["caption"]:
-                                    # Continue with existing code by adding the rest of the function
-                                    hashtags = []
-                                    words = post_data["caption"].split()
-                                    for word in words:
-                                        if word.startswith("#"):
-                                            hashtags.append(word)
-                                    
-                                    post_data["hashtags"] = hashtags
-                            except Exception as e:
-                                print(f"Error extracting caption: {str(e)}")
-                            
-                            # Get post timestamp
-                            try:
-                                time_selectors = [
-                                    "time[datetime]",
-                                    "div._aaqe, div._aaqf, div[class*='timestamp']"
-                                ]
-                                
-                                for selector in time_selectors:
-                                    time_elements = post_page.locator(selector).all()
-                                    if time_elements and len(time_elements) > 0:
-                                        timestamp = time_elements[0].get_attribute("datetime")
-                                        if timestamp:
-                                            post_data["timestamp"] = timestamp
-                                            break
-                                        
-                                        timestamp_text = time_elements[0].text_content().strip()
-                                        if timestamp_text:
-                                            post_data["timestamp"] = timestamp_text
-                                            break
-                            except Exception as e:
-                                print(f"Error extracting timestamp: {str(e)}")
-                            
-                            # Get post likes/views
-                            try:
-                                like_selectors = [
-                                    "section:has(span[aria-label*='like']), div._aacl:has-text('likes'), div[role='dialog'] span:has-text('likes')",
-                                    "span[class*='like'], span.zV_eT, span._aap9"
-                                ]
-                                
-                                for selector in like_selectors:
-                                    like_elements = post_page.locator(selector).all()
-                                    if like_elements and len(like_elements) > 0:
-                                        like_text = like_elements[0].text_content().strip()
-                                        
-                                        # Extract just the number from text like "123 likes"
-                                        like_text = ''.join(filter(lambda x: x.isdigit() or x in 'km,.', like_text.lower()))
-                                        post_data["likes"] = parse_count(like_text)
-                                        break
-                            except Exception as e:
-                                print(f"Error extracting likes: {str(e)}")
-                            
-                            # Get comments count
-                            try:
-                                comment_selectors = [
-                                    "div[role='dialog'] span:has-text('comments'), span:has-text('View all')",
-                                    "ul > li:has-text('comments'), span[class*='comment'], span._acbn"
-                                ]
-                                
-                                for selector in comment_selectors:
-                                    comment_elements = post_page.locator(selector).all()
-                                    if comment_elements and len(comment_elements) > 0:
-                                        comment_text = comment_elements[0].text_content().strip()
-                                        
-                                        # Extract just the number from text like "View all 123 comments"
-                                        if "comments" in comment_text.lower():
-                                            comment_text = comment_text.lower().replace("comments", "").replace("view all", "").strip()
-                                            post_data["comments_count"] = parse_count(comment_text)
-                                            break
-                            except Exception as e:
-                                print(f"Error extracting comments count: {str(e)}")
-                            
-                            # Download the image if we have a URL
-                            if post_data["thumbnail_url"]:
-                                try:
-                                    # Create a sanitized filename
-                                    date_part = ""
-                                    if post_data["timestamp"]:
-                                        try:
-                                            if "T" in post_data["timestamp"]:
-                                                # ISO format: YYYY-MM-DDTHH:MM:SS
-                                                dt = datetime.fromisoformat(post_data["timestamp"].replace("Z", "+00:00"))
-                                                date_part = dt.strftime("%Y%m%d_%H%M%S")
-                                            else:
-                                                # Just use timestamp as is
-                                                date_part = post_data["timestamp"].replace(" ", "_").replace(":", "").replace("/", "")
-                                        except:
-                                            date_part = f"post_{image_posts_count}"
-                                    else:
-                                        date_part = f"post_{image_posts_count}"
-                                    
-                                    # Generate filename
-                                    img_filename = f"{username}_{date_part}.jpg"
-                                    safe_filename = "".join([c for c in img_filename if c.isalpha() or c.isdigit() or c in "._- "]).strip()
-                                    img_path = os.path.join(current_image_dir, safe_filename)
-                                    
-                                    # Download the image
-                                    response = requests.get(post_data["thumbnail_url"], headers={"User-Agent": "Mozilla/5.0"})
-                                    if response.status_code == 200:
-                                        with open(img_path, "wb") as f:
-                                            f.write(response.content)
-                                        
-                                        # Update post data with local image path
-                                        post_data["local_image_path"] = img_path
-                                        print(f"Downloaded image for post {image_posts_count+1}")
-                                except Exception as e:
-                                    print(f"Error downloading image: {str(e)}")
-                            
-                            # Add the post data to our list
-                            profile_data["posts"].append(post_data)
-                            image_posts_count += 1
-                            
-                            # Close the post page
-                            post_page.close()
-                            
-                        except Exception as e:
-                            print(f"Error processing post {post_idx}: {str(e)}")
-                            try:
-                                post_page.close()
-                            except:
-                                pass
                 
                 print(f"Extracted {image_posts_count} image posts for {username}")
             except Exception as e:
                 print(f"Error extracting posts: {str(e)}")
             
+            capture.detach()
+            
             # Check if profile is private
             try:
-                private_indicators = page.locator("h2:has-text('This Account is Private')").count()
+                private_indicators = await page.locator("h2:has-text('This Account is Private')").count()
                 if private_indicators > 0:
                     profile_data["private"] = True
             except:
@@ -882,9 +1425,39 @@ def scrape_profile(page, username, image_dir_override=None):
     
     except Exception as e:
         print(f"Error scraping profile {username}: {str(e)}")
+        await downloads.join()
         return None
     
+    # Wait for queued image downloads so local_image_path is filled in
+    await downloads.join()
+    try:
+        await asyncio.to_thread(get_selector_registry().flush)
+    except Exception as e:
+        print(f"Could not save selector stats: {str(e)}")
+    if downloads.completed or downloads.failed:
+        print(f"Downloaded {downloads.completed} images for {username} ({downloads.failed} failed)")
+        store = downloads.downloader.store
+        if store:
+            stats = store.stats()
+            print(f"Media store: {stats['hits']} hits, {stats['misses']} misses, {stats['objects']} objects")
+    
+    emit("profile_scraped", username=username,
+         posts=sum(1 for post in profile_data["posts"] if not post.get("is_placeholder")),
+         images_downloaded=downloads.completed, images_failed=downloads.failed)
+    
+    if previous_profile:
+        profile_data["changes"] = summarize_changes(previous_profile, profile_data)
+        changes = profile_data["changes"]
+        print(f"Changes for {username}: {len(changes['new_posts'])} new posts, "
+              f"followers {changes['followers_change']:+d}")
+    
     # Save profile data to JSON
+    save_profile_data(username, profile_data)
+    
+    return profile_data
+
+def save_profile_data(username, profile_data):
+    """Writes a profile to output/product_data/<username>_profile.json"""
     try:
         output_path = os.path.join(output_dir, f"{username}_profile.json")
         with open(output_path, "w", encoding="utf-8") as f:
@@ -892,8 +1465,106 @@ def scrape_profile(page, username, image_dir_override=None):
         print(f"Saved profile data for {username} to {output_path}")
     except Exception as e:
         print(f"Error saving profile data: {str(e)}")
+
+def login_to_instagram_pooled(username=None, password=None, storage_state=None):
+    """
+    Synchronous wrapper around login_to_instagram_async on a pooled browser context.
     
-    return profile_data
+    Saves the session to STATE_PATH so every later pooled context starts logged in.
+    
+    Args:
+        username, password: Instagram credentials (default INSTAGRAM_USERNAME/PASSWORD)
+        storage_state: Optional session to start from instead of the saved one
+    
+    Returns:
+        True if the login succeeded
+    """
+    async def login_job(context):
+        page = await context.new_page()
+        if not await login_to_instagram_async(page, username, password):
+            return False
+        os.makedirs(os.path.dirname(STATE_PATH), exist_ok=True)
+        await context.storage_state(path=STATE_PATH)
+        return True
+    
+    overrides = {"storage_state": storage_state} if storage_state else {}
+    return get_browser_pool().run(login_job, **overrides)
+
+def scrape_profile_pooled(username, image_dir_override=None, post_concurrency=None, incremental=False,
+                          post_target=None, image_width=None, **context_options):
+    """
+    Synchronous wrapper around scrape_profile_async using a pooled browser context.
+    
+    Args:
+        username: Instagram username to scrape
+        image_dir_override: Optional custom directory for saving images
+        post_concurrency: Number of post tabs processed in parallel
+        incremental: Only fetch posts that are new since the last saved profile
+        post_target: Number of image posts to collect (default PROFILE_POST_TARGET)
+        image_width: Preferred image width (default IMAGE_TARGET_WIDTH; 0 for the largest)
+        **context_options: Keyword arguments for the browser context (viewport, user_agent, ...)
+    
+    Returns:
+        Dictionary with profile data or None if failed
+    """
+    async def scrape_job(context):
+        page = await context.new_page()
+        return await scrape_profile_async(page, username, image_dir_override=image_dir_override,
+                                          post_concurrency=post_concurrency, incremental=incremental,
+                                          post_target=post_target, image_width=image_width)
+    
+    return get_browser_pool().run(scrape_job, **context_options)
+
+def _page_context_options(page):
+    """Session, viewport and user agent of a sync Playwright page, as browser context options"""
+    options = {"storage_state": page.context.storage_state()}
+    if page.viewport_size:
+        options["viewport"] = page.viewport_size
+    try:
+        options["user_agent"] = page.evaluate("navigator.userAgent")
+    except Exception:
+        pass
+    return options
+
+def login_to_instagram(page):
+    """
+    Logs in to Instagram for a sync Playwright page (the original entry point)
+    
+    The async login runs on a pooled context started from the page's session; the
+    resulting session is saved to STATE_PATH and its cookies are added to the page's
+    context, so the page is logged in afterwards.
+    
+    Args:
+        page: The Playwright page object
+    
+    Returns:
+        True if the login succeeded
+    """
+    if not login_to_instagram_pooled(storage_state=page.context.storage_state()):
+        return False
+    with open(STATE_PATH, "r", encoding="utf-8") as f:
+        page.context.add_cookies(json.load(f).get("cookies", []))
+    return True
+
+def scrape_profile(page, username, image_dir_override=None, **kwargs):
+    """
+    Scrapes an Instagram profile (the original entry point)
+    
+    The sync page can't run the async scraper, so the scrape runs on a pooled
+    context carrying the page's session, viewport and user agent.
+    
+    Args:
+        page: The Playwright page object
+        username: Instagram username to scrape
+        image_dir_override: Optional custom directory for saving images
+        **kwargs: Further options of scrape_profile_pooled (incremental, post_target, ...)
+    
+    Returns:
+        Dictionary with profile data or None if failed
+    """
+    options = _page_context_options(page)
+    options.update(kwargs)
+    return scrape_profile_pooled(username, image_dir_override=image_dir_override, **options)
 
 # After the scrape_profile function, add this new function
 
@@ -913,58 +1584,39 @@ def prod_profile_scrape(product_name, username):
         product_image_dir = f"output/product_data/profile_images/{product_name}"
         os.makedirs(product_image_dir, exist_ok=True)
         
-        with sync_playwright() as playwright:
-            # Create browser instance
-            browser = playwright.chromium.launch(
-                headless=False,
-                slow_mo=100
-            )
-            
-            # Create a persistent context with the user data directory 
-            profile_directory = "playwright_profile"
-            profile_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), profile_directory)
-            
-            # Check if state.json exists (saved login)
-            login_state_exists = os.path.exists(os.path.join(profile_path, "state.json"))
+        # Check if state.json exists (saved login)
+        if not os.path.exists(STATE_PATH):
+            print("❌ Error: No saved login found. Please run the script first to login.")
+            return None
+        
+        async def scrape_job(context):
+            # Create a new page in the pooled context (saved login already loaded)
+            page = await context.new_page()
+            await page.goto("https://www.instagram.com/", wait_until="domcontentloaded")
             
-            if not login_state_exists:
-                print("❌ Error: No saved login found. Please run the script first to login.")
-                return None
-                
-            context = browser.new_context(
+            # Scrape profile for the product username with custom image directory
+            return await scrape_profile_async(page, username, image_dir_override=product_image_dir)
+        
+        try:
+            product_data = get_browser_pool().run(
+                scrape_job,
                 user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-                viewport={"width": 1280, "height": 720},
-                storage_state=os.path.join(profile_path, "state.json")
+                viewport={"width": 1280, "height": 720}
             )
-            
-            # Create a new page
-            page = context.new_page()
-            
-            try:
-                page.goto("https://www.instagram.com/")
-                time.sleep(3)
-                
-                # Scrape profile for the product username with custom image directory
-                product_data = scrape_profile(page, username, image_dir_override=product_image_dir)
-                
-                # Save profile data with product name
-                if product_data:
-                    output_path = os.path.join(output_dir, f"{product_name}.json")
-                    with open(output_path, "w", encoding="utf-8") as f:
-                        json.dump(product_data, f, indent=4, ensure_ascii=False)
-                    print(f"✅ Saved product profile data for {username} to {output_path}")
-                else:
-                    print(f"❌ Failed to scrape profile for {username}")
-                
-                # Close browser
-                browser.close()
-                
-                return product_data
-                
-            except Exception as e:
-                print(f"❌ Error scraping product profile: {str(e)}")
-                browser.close()
-                return None
+        except Exception as e:
+            print(f"❌ Error scraping product profile: {str(e)}")
+            return None
+        
+        # Save profile data with product name
+        if product_data:
+            output_path = os.path.join(output_dir, f"{product_name}.json")
+            with open(output_path, "w", encoding="utf-8") as f:
+                json.dump(product_data, f, indent=4, ensure_ascii=False)
+            print(f"✅ Saved product profile data for {username} to {output_path}")
+        else:
+            print(f"❌ Failed to scrape profile for {username}")
+        
+        return product_data
                 
     except Exception as e:
         print(f"❌ Error in prod_profile_scrape: {str(e)}")
@@ -980,10 +1632,13 @@ def main():
         # "natgeo"
     ]
     
-    # Get usernames from command line if provided
+    # Get usernames from command line if provided (--incremental only fetches new posts)
     import sys
-    if len(sys.argv) > 1:
-        users = sys.argv[1:]
+    args = sys.argv[1:]
+    incremental = "--incremental" in args
+    args = [arg for arg in args if arg != "--incremental"]
+    if args:
+        users = args
     
     # If no users specified, prompt for input
     if not users:
@@ -996,47 +1651,43 @@ def main():
     
     print(f"Will scrape profiles for: {', '.join(users)}")
     
-    # Run with Playwright
-    with sync_playwright() as p:
-        # Launch the browser
-        browser = p.chromium.launch(headless=False)  # Set headless=True for production
-        
-        # Create a context with viewport and user agent
-        context = browser.new_context(
-            viewport={"width": 1280, "height": 800},
-            user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
-        )
-        
-        # Create a new page
-        page = context.new_page()
-        
-        # Login to Instagram
-        if not login_to_instagram(page):
-            print("Failed to log in to Instagram. Exiting.")
-            browser.close()
-            return
+    # Login to Instagram once unless a saved session already exists
+    if not os.path.exists(STATE_PATH) and not login_to_instagram_pooled():
+        print("Failed to log in to Instagram. Exiting.")
+        close_browser_pool()
+        return
+    
+    # Scrape each profile
+    for username in users:
+        print(f"\n--- Scraping profile for {username} ---")
+        try:
+            profile_data = scrape_profile_pooled(
+                username,
+                incremental=incremental,
+                viewport={"width": 1280, "height": 800},
+                user_agent="Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+            )
+        except Exception as e:
+            print(f"Error scraping {username}: {str(e)}")
+            profile_data = None
         
-        # Scrape each profile
-        for username in users:
-            print(f"\n--- Scraping profile for {username} ---")
-            profile_data = scrape_profile(page, username)
-            
-            if profile_data:
-                print(f"Successfully scraped profile for {username}")
-                print(f"Followers: {profile_data['followers']}")
-                print(f"Following: {profile_data['following']}")
-                print(f"Posts: {profile_data['post_count']}")
-                print(f"Verified: {'Yes' if profile_data['verified'] else 'No'}")
-                print(f"Private: {'Yes' if profile_data['private'] else 'No'}")
-                print(f"Extracted {len(profile_data['posts'])} posts")
-            else:
-                print(f"Failed to scrape profile for {username}")
-            
-            # Wait a bit before scraping the next profile to avoid rate limiting
-            time.sleep(5)
+        if profile_data:
+            print(f"Successfully scraped profile for {username}")
+            print(f"Followers: {profile_data['followers']}")
+            print(f"Following: {profile_data['following']}")
+            print(f"Posts: {profile_data['post_count']}")
+            print(f"Verified: {'Yes' if profile_data['verified'] else 'No'}")
+            print(f"Private: {'Yes' if profile_data['private'] else 'No'}")
+            print(f"Extracted {len(profile_data['posts'])} posts")
+        else:
+            print(f"Failed to scrape profile for {username}")
         
-        # Close the browser
-        browser.close()
+        # Wait a bit before scraping the next profile to avoid rate limiting
+        time.sleep(5)
+    
+    # Close the shared browsers and downloader
+    close_browser_pool()
+    close_image_downloader()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,404 @@
+"""
+Durable job queue for scraping tasks.
+
+The FastAPI process only enqueues tasks and reads their state; worker
+processes (worker.py) claim them. A claimed job carries a lease that its
+worker keeps extending while the workflow runs. When a worker dies, its jobs
+are put back in the queue, either immediately by the worker pool supervisor
+or once the lease expires. Jobs are claimed by priority (higher first), then
+in creation order.
+
+Requests for a username that is already pending or running can be coalesced:
+the new task becomes a follower of the in-flight job (leader_task_id) and
+reports the leader's status, progress, queue_id and result instead of running
+the workflow a second time. Only jobs asking for the same scrape are joined:
+their force_refresh, max_competitors and competitor_concurrency must match
+(see coalesce_key), so e.g. a forced refresh never attaches to a cached run.
+
+Progress events emitted while a job runs (see scrape_events) are appended to
+the job's event log, so any API process can stream them to clients.
+
+SQLiteJobQueue is the local backend. Other backends (e.g. Redis) implement
+JobQueueBackend and are registered with register_backend(); JOB_QUEUE_BACKEND
+selects one.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+JOB_QUEUE_BACKEND = os.getenv("JOB_QUEUE_BACKEND", "sqlite")
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", "output/jobs.db")
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+
+class JobQueueBackend:
+    """Interface every job queue backend implements; jobs are plain dictionaries"""
+
+    def enqueue(self, task_id, username, payload=None, priority=0, status=STATUS_PENDING, progress=None, error=None,
+                coalesce=False):
+        """
+        Add a job; with coalesce=True it follows an in-flight job for the same username and
+        coalesce_key(payload) if there is one
+        """
+        raise NotImplementedError
+
+    def claim(self, worker_id, lease_seconds=JOB_LEASE_SECONDS):
+        """Lease the next pending job to worker_id; returns the job or None"""
+        raise NotImplementedError
+
+    def heartbeat(self, task_id, worker_id, lease_seconds=JOB_LEASE_SECONDS):
+        """Extend a job's lease; False if the worker no longer holds it"""
+        raise NotImplementedError
+
+    def update(self, task_id, **fields):
+        raise NotImplementedError
+
+    def complete(self, task_id, worker_id, result, queue_id=None, progress=None):
+        raise NotImplementedError
+
+    def fail(self, task_id, worker_id, error):
+        raise NotImplementedError
+
+    def requeue_expired(self):
+        """Return jobs with expired leases to the queue; returns how many were requeued"""
+        raise NotImplementedError
+
+    def requeue_worker(self, worker_id):
+        """Return every job held by a dead worker to the queue"""
+        raise NotImplementedError
+
+    def get(self, task_id):
+        raise NotImplementedError
+
+    def list(self, status=None, limit=None):
+        raise NotImplementedError
+
+    def delete(self, task_id):
+        raise NotImplementedError
+
+    def count(self, status=None):
+        raise NotImplementedError
+
+    def add_events(self, task_id, events):
+        """Append progress events (dictionaries with "type" and "time") to a job's event log"""
+        raise NotImplementedError
+
+    def events(self, task_id, after_id=0, limit=500):
+        """Events with an id above after_id, oldest first; followers read their leader's log"""
+        raise NotImplementedError
+
+
+_JSON_FIELDS = ("payload", "result")
+_COLUMNS = ("task_id", "queue_id", "username", "payload", "priority", "status", "progress", "result", "error",
+            "attempts", "worker_id", "lease_expires", "created_at", "started_at", "completed_at", "leader_task_id")
+# Fields a follower task reports from its leader
+_SHARED_FIELDS = ("queue_id", "status", "progress", "result", "error", "started_at", "completed_at")
+# Payload fields that change what a job scrapes, with their defaults; jobs coalesce only when all match
+_COALESCE_FIELDS = {"force_refresh": False, "max_competitors": None, "competitor_concurrency": None}
+
+
+def coalesce_key(payload):
+    """The payload values two jobs for the same username must share to be coalesced, as a string"""
+    payload = payload or {}
+    return json.dumps([payload.get(field, default) for field, default in _COALESCE_FIELDS.items()])
+
+
+def _now_iso():
+    return datetime.now().isoformat()
+
+
+class SQLiteJobQueue(JobQueueBackend):
+    def __init__(self, path=JOB_QUEUE_PATH, max_attempts=JOB_MAX_ATTEMPTS):
+        """
+        Args:
+            path: SQLite database file (env JOB_QUEUE_PATH, default output/jobs.db)
+            max_attempts: Claims per job before it is failed instead of requeued (env JOB_MAX_ATTEMPTS, default 3)
+        """
+        self.path = path
+        self.max_attempts = max_attempts
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " task_id TEXT PRIMARY KEY,"
+                " queue_id TEXT,"
+                " username TEXT NOT NULL,"
+                " payload TEXT,"
+                " priority INTEGER NOT NULL DEFAULT 0,"
+                " status TEXT NOT NULL,"
+                " progress TEXT,"
+                " result TEXT,"
+                " error TEXT,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " worker_id TEXT,"
+                " lease_expires REAL,"
+                " created_at TEXT NOT NULL,"
+                " started_at TEXT,"
+                " completed_at TEXT,"
+                " leader_task_id TEXT,"
+                " coalesce_key TEXT)"
+            )
+            columns = [row["name"] for row in conn.execute("PRAGMA table_info(jobs)").fetchall()]
+            if "leader_task_id" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN leader_task_id TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority DESC, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_coalesce ON jobs (lower(username), coalesce_key, status)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_leader ON jobs (leader_task_id)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_events ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " task_id TEXT NOT NULL,"
+                " type TEXT NOT NULL,"
+                " data TEXT,"
+                " created_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS job_events_task ON job_events (task_id, id)")
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per call: the queue is shared by the API and worker processes
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction that takes the database lock up front"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def _row_to_job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        for field in _JSON_FIELDS:
+            if job.get(field):
+                try:
+                    job[field] = json.loads(job[field])
+                except ValueError:
+                    pass
+        return job
+
+    def _resolve(self, conn, job):
+        """Fill a follower job with its leader's shared fields"""
+        if job is None or not job.get("leader_task_id"):
+            return job
+        leader = self._row_to_job(
+            conn.execute("SELECT * FROM jobs WHERE task_id = ?", (job["leader_task_id"],)).fetchone()
+        )
+        if leader is None:
+            job["status"] = STATUS_FAILED
+            job["error"] = f"Task {job['leader_task_id']} this task was attached to has been deleted"
+            return job
+        for field in _SHARED_FIELDS:
+            job[field] = leader.get(field)
+        return job
+
+    def enqueue(self, task_id, username, payload=None, priority=0, status=STATUS_PENDING, progress=None, error=None,
+                coalesce=False):
+        created_at = _now_iso()
+        completed_at = created_at if status in (STATUS_COMPLETED, STATUS_FAILED) else None
+        with self._transaction() as conn:
+            leader = None
+            if coalesce and status == STATUS_PENDING:
+                # Single flight: attach to the oldest in-flight job for this username asking for the same scrape
+                leader = conn.execute(
+                    "SELECT task_id, priority FROM jobs WHERE lower(username) = lower(?) AND coalesce_key = ?"
+                    " AND status IN (?, ?) AND leader_task_id IS NULL ORDER BY created_at LIMIT 1",
+                    (username, coalesce_key(payload), STATUS_PENDING, STATUS_RUNNING)
+                ).fetchone()
+            if leader is not None:
+                progress = f"Attached to in-flight task {leader['task_id']} for @{username}"
+                # A follower with a higher priority promotes the shared job
+                if priority > leader["priority"]:
+                    conn.execute("UPDATE jobs SET priority = ? WHERE task_id = ?", (priority, leader["task_id"]))
+            conn.execute(
+                "INSERT INTO jobs (task_id, username, payload, priority, status, progress, error, created_at,"
+                " completed_at, leader_task_id, coalesce_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (task_id, username, json.dumps(payload or {}), priority, status, progress, error,
+                 created_at, completed_at, leader["task_id"] if leader is not None else None, coalesce_key(payload))
+            )
+        return self.get(task_id)
+
+    def claim(self, worker_id, lease_seconds=JOB_LEASE_SECONDS):
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT task_id FROM jobs WHERE status = ? AND leader_task_id IS NULL"
+                " ORDER BY priority DESC, created_at LIMIT 1",
+                (STATUS_PENDING,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker_id = ?, lease_expires = ?, attempts = attempts + 1,"
+                " started_at = ?, progress = ? WHERE task_id = ?",
+                (STATUS_RUNNING, worker_id, time.time() + lease_seconds, _now_iso(),
+                 "Picked up by worker...", row["task_id"])
+            )
+            return self._row_to_job(conn.execute("SELECT * FROM jobs WHERE task_id = ?", (row["task_id"],)).fetchone())
+
+    def heartbeat(self, task_id, worker_id, lease_seconds=JOB_LEASE_SECONDS):
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE task_id = ? AND worker_id = ? AND status = ?",
+                (time.time() + lease_seconds, task_id, worker_id, STATUS_RUNNING)
+            )
+            return cursor.rowcount == 1
+
+    def update(self, task_id, **fields):
+        unknown = set(fields) - set(_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown job fields: {', '.join(sorted(unknown))}")
+        values = [json.dumps(value) if key in _JSON_FIELDS else value for key, value in fields.items()]
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self._transaction() as conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE task_id = ?", (*values, task_id))
+
+    def _finish(self, task_id, worker_id, **fields):
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        values = [json.dumps(value) if key in _JSON_FIELDS else value for key, value in fields.items()]
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET {assignments}, lease_expires = NULL, completed_at = ?"
+                " WHERE task_id = ? AND worker_id = ? AND status = ?",
+                (*values, _now_iso(), task_id, worker_id, STATUS_RUNNING)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, task_id, worker_id, result, queue_id=None, progress=None):
+        return self._finish(task_id, worker_id, status=STATUS_COMPLETED, result=result,
+                            queue_id=queue_id, progress=progress)
+
+    def fail(self, task_id, worker_id, error):
+        return self._finish(task_id, worker_id, status=STATUS_FAILED, error=error)
+
+    def _requeue(self, conn, where, params):
+        """Requeue running jobs matching where; jobs out of attempts are failed instead"""
+        conn.execute(
+            f"UPDATE jobs SET status = ?, error = ?, worker_id = NULL, lease_expires = NULL, completed_at = ?"
+            f" WHERE status = ? AND attempts >= ? AND {where}",
+            (STATUS_FAILED, "Worker died or stopped responding too many times", _now_iso(),
+             STATUS_RUNNING, self.max_attempts, *params)
+        )
+        cursor = conn.execute(
+            f"UPDATE jobs SET status = ?, worker_id = NULL, lease_expires = NULL, progress = ?"
+            f" WHERE status = ? AND {where}",
+            (STATUS_PENDING, "Requeued after worker loss, waiting to restart...", STATUS_RUNNING, *params)
+        )
+        return cursor.rowcount
+
+    def requeue_expired(self):
+        with self._transaction() as conn:
+            return self._requeue(conn, "lease_expires < ?", (time.time(),))
+
+    def requeue_worker(self, worker_id):
+        with self._transaction() as conn:
+            return self._requeue(conn, "worker_id = ?", (worker_id,))
+
+    def get(self, task_id):
+        with self._connect() as conn:
+            job = self._row_to_job(conn.execute("SELECT * FROM jobs WHERE task_id = ?", (task_id,)).fetchone())
+            return self._resolve(conn, job)
+
+    def list(self, status=None, limit=None):
+        limit = limit or -1  # SQLite: no limit
+        with self._connect() as conn:
+            if status:
+                # A follower reports its leader's status (failed once the leader is deleted)
+                rows = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? AND leader_task_id IS NULL"
+                    " UNION ALL"
+                    " SELECT jobs.* FROM jobs AS leader JOIN jobs ON jobs.leader_task_id = leader.task_id"
+                    " WHERE leader.status = ?"
+                    " UNION ALL"
+                    " SELECT * FROM jobs WHERE ? = ? AND leader_task_id IS NOT NULL"
+                    " AND leader_task_id NOT IN (SELECT task_id FROM jobs)"
+                    " ORDER BY created_at LIMIT ?",
+                    (status, status, status, STATUS_FAILED, limit)
+                ).fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM jobs ORDER BY created_at LIMIT ?", (limit,)).fetchall()
+            return [self._resolve(conn, self._row_to_job(row)) for row in rows]
+
+    def delete(self, task_id):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM job_events WHERE task_id = ?", (task_id,))
+            return conn.execute("DELETE FROM jobs WHERE task_id = ?", (task_id,)).rowcount == 1
+
+    def count(self, status=None):
+        """Count jobs that actually run (followers are not counted)"""
+        with self._connect() as conn:
+            if status:
+                return conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ? AND leader_task_id IS NULL",
+                                    (status,)).fetchone()[0]
+            return conn.execute("SELECT COUNT(*) FROM jobs WHERE leader_task_id IS NULL").fetchone()[0]
+
+    def add_events(self, task_id, events):
+        rows = []
+        for event in events:
+            data = {key: value for key, value in event.items() if key not in ("type", "time")}
+            rows.append((task_id, event["type"], json.dumps(data, default=str), event.get("time") or time.time()))
+        if not rows:
+            return
+        with self._transaction() as conn:
+            conn.executemany("INSERT INTO job_events (task_id, type, data, created_at) VALUES (?, ?, ?, ?)", rows)
+
+    def events(self, task_id, after_id=0, limit=500):
+        with self._connect() as conn:
+            row = conn.execute("SELECT leader_task_id FROM jobs WHERE task_id = ?", (task_id,)).fetchone()
+            source_id = row["leader_task_id"] if row is not None and row["leader_task_id"] else task_id
+            rows = conn.execute(
+                "SELECT id, type, data, created_at FROM job_events WHERE task_id = ? AND id > ? ORDER BY id LIMIT ?",
+                (source_id, after_id, limit)
+            ).fetchall()
+        events = []
+        for row in rows:
+            event = {"id": row["id"], "type": row["type"], "time": row["created_at"]}
+            event.update(json.loads(row["data"] or "{}"))
+            events.append(event)
+        return events
+
+
+_backends = {"sqlite": SQLiteJobQueue}
+
+
+def register_backend(name, factory):
+    """Make a JobQueueBackend factory selectable with JOB_QUEUE_BACKEND=<name>"""
+    _backends[name] = factory
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """Return the process-wide job queue for the configured backend"""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            if JOB_QUEUE_BACKEND not in _backends:
+                raise RuntimeError(f"Unknown JOB_QUEUE_BACKEND '{JOB_QUEUE_BACKEND}' "
+                                   f"(available: {', '.join(sorted(_backends))})")
+            _queue = _backends[JOB_QUEUE_BACKEND]()
+        return _queue
@@ -1,13 +1,63 @@
 import os
 import json
-import requests
+import asyncio
+import threading
 import uuid
 import time
 from datetime import datetime
-from insta_scraper_playwright import login_to_instagram, scrape_profile
+from insta_scraper_playwright import login_to_instagram_async, scrape_profile_async, save_post_image, save_profile_data
+from browser_pool import get_browser_pool, STATE_PATH
+from profile_cache import get_profile_cache, relink_images
+from pipeline import Pipeline
+from api_client import get_api_client, CircuitOpenError
+from s3_uploader import QueueUploader
+from scrape_events import current_observer, observe, emit
+from metrics import collect, current_task_metrics, task_metrics, timer
+from image_processing import IMAGE_PROCESSING, pillow_available, get_image_processor
 from playwright.sync_api import sync_playwright
 from dotenv import load_dotenv
 
+# Workers per workflow stage; each stage's capacity is tuned independently
+PIPELINE_STAGE_WORKERS = {
+    "scrape": int(os.getenv("PIPELINE_SCRAPE_WORKERS", "2")),
+    "llm": int(os.getenv("PIPELINE_LLM_WORKERS", "4")),
+    "search": int(os.getenv("PIPELINE_SEARCH_WORKERS", "4")),
+    "competitors": int(os.getenv("PIPELINE_COMPETITOR_WORKERS", "1")),
+    "images": int(os.getenv("PIPELINE_IMAGE_WORKERS", "1")),
+    "describe": int(os.getenv("PIPELINE_DESCRIBE_WORKERS", "4")),
+    "upload": int(os.getenv("PIPELINE_UPLOAD_WORKERS", "2")),
+}
+
+_pipelines = {}  # event loop -> workflow Pipeline
+
+
+def _stage(method_name):
+    """Stage handler that calls the given step on the job's own controller"""
+    async def handler(state):
+        return await getattr(state["controller"], method_name)(state)
+    return handler
+
+
+def get_workflow_pipeline():
+    """Return the workflow pipeline for the running event loop, creating it on first use"""
+    loop = asyncio.get_running_loop()
+    pipeline = _pipelines.get(loop)
+    if pipeline is None:
+        for stale_loop in [l for l in _pipelines if l.is_closed()]:
+            del _pipelines[stale_loop]
+        pipeline = Pipeline([
+            ("scrape", _stage("stage_scrape_product"), PIPELINE_STAGE_WORKERS["scrape"]),
+            ("llm", _stage("stage_llm_analysis"), PIPELINE_STAGE_WORKERS["llm"]),
+            ("search", _stage("stage_search_competitors"), PIPELINE_STAGE_WORKERS["search"]),
+            ("competitors", _stage("stage_scrape_competitors"), PIPELINE_STAGE_WORKERS["competitors"]),
+            ("images", _stage("stage_process_images"), PIPELINE_STAGE_WORKERS["images"]),
+            ("describe", _stage("stage_describe"), PIPELINE_STAGE_WORKERS["describe"]),
+            ("upload", _stage("stage_upload"), PIPELINE_STAGE_WORKERS["upload"]),
+        ])
+        _pipelines[loop] = pipeline
+    return pipeline
+
+
 class LocalWorkflowController:
     def __init__(self):
         # Load environment variables
@@ -15,20 +65,38 @@ class LocalWorkflowController:
         load_dotenv()
         
         self.api_base_url = os.getenv('API_BASE_URL', 'http://65.0.99.113:8000')
+        # Pooled client shared by every controller in the process (retries, circuit breaker, latency metrics)
+        self.api = get_api_client(self.api_base_url)
+        self.upload_timeout = float(os.getenv('API_UPLOAD_TIMEOUT', '300'))
         self.output_dir = "output"
         self.instagram_username = os.getenv('INSTAGRAM_USERNAME')
         self.instagram_password = os.getenv('INSTAGRAM_PASSWORD')
         
+        # Competitor fan-out for Step D
+        self.max_competitors = int(os.getenv('MAX_COMPETITORS', '5'))
+        self.competitor_concurrency = int(os.getenv('COMPETITOR_CONCURRENCY', '3'))
+        self.competitor_timeout = float(os.getenv('COMPETITOR_TIMEOUT', '300'))
+        
+        # Age in seconds of every profile served from the profile cache during a run (None = scraped fresh)
+        self.profile_cache_ages = {}
+        
         os.makedirs(self.output_dir, exist_ok=True)
 
-    def create_queue_directory(self, username):
-        """Create organized directory structure for queue processing"""
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        queue_id = str(uuid.uuid4())[:8]
-        queue_name = f"{username}_{timestamp}_{queue_id}"
+    def create_queue_directory(self, username, queue_id=None):
+        """
+        Create organized directory structure for queue processing
         
-        # Main queue directory
-        queue_dir = os.path.join(self.output_dir, queue_name)
+        With the queue_id of an earlier attempt of the same job, its directory is
+        reused, so the S3 upload resumes where that attempt stopped.
+        """
+        queue_dir = self.find_queue_directory(username, queue_id) if queue_id else None
+        if queue_dir is None:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            queue_id = queue_id or str(uuid.uuid4())[:8]
+            queue_name = f"{username}_{timestamp}_{queue_id}"
+            
+            # Main queue directory
+            queue_dir = os.path.join(self.output_dir, queue_name)
         
         # Subdirectories
         product_dir = os.path.join(queue_dir, "product")
@@ -44,22 +112,34 @@ class LocalWorkflowController:
         
         return queue_id, queue_dir, product_dir, competitor_dir, analysis_dir, product_images_dir, competitor_images_dir
 
+    def find_queue_directory(self, username, queue_id):
+        """Existing queue directory of username with queue_id, or None"""
+        suffix = f"_{queue_id}"
+        for name in os.listdir(self.output_dir):
+            path = os.path.join(self.output_dir, name)
+            if name.startswith(f"{username}_") and name.endswith(suffix) and os.path.isdir(path):
+                return path
+        return None
+
     def call_llm_analysis(self, profile_data, image_posts):
         """Call unified API for LLM analysis"""
         try:
-            response = requests.post(
-                f"{self.api_base_url}/api/llm/analyze-sector",
+            response = self.api.post(
+                "/api/llm/analyze-sector",
                 json={
                     "profile_data": profile_data,
                     "posts_data": image_posts  # Changed from "image_posts" to "posts_data"
                 },
-                timeout=60
+                idempotent=True  # Read-only analysis: sending it twice is harmless
             )
             if response.status_code == 200:
                 return response.json()
             else:
                 print(f"❌ LLM API error: {response.status_code}")
                 return None
+        except CircuitOpenError as e:
+            print(f"❌ LLM API unavailable: {str(e)}")
+            return None
         except Exception as e:
             print(f"❌ LLM API request failed: {str(e)}")
             return None
@@ -67,20 +147,23 @@ class LocalWorkflowController:
     def call_search_competitors(self, sector, keywords, exclude_username=None):
         """Call unified API for competitor search"""
         try:
-            response = requests.post(
-                f"{self.api_base_url}/api/search-competitors",  # Fixed: removed '/search/'
+            response = self.api.post(
+                "/api/search-competitors",  # Fixed: removed '/search/'
                 json={
                     "sector": sector,
                     "keywords": keywords,
                     "exclude_username": exclude_username or ""
                 },
-                timeout=60
+                idempotent=True
             )
             if response.status_code == 200:
                 return response.json()
             else:
                 print(f"❌ Search API error: {response.status_code}")
                 return None
+        except CircuitOpenError as e:
+            print(f"❌ Search API unavailable: {str(e)}")
+            return None
         except Exception as e:
             print(f"❌ Search API request failed: {str(e)}")
             return None
@@ -88,155 +171,334 @@ class LocalWorkflowController:
     def call_description_analysis(self, original_profile, competitor_profiles):
         """Call unified API for description analysis"""
         try:
-            response = requests.post(
-                f"{self.api_base_url}/api/description/analyze-descriptions",  # Changed from '/analyze' to '/analyze-descriptions'
+            response = self.api.post(
+                "/api/description/analyze-descriptions",  # Changed from '/analyze' to '/analyze-descriptions'
                 json={
                     "product_profile": original_profile,  # Changed from 'original_profile' to 'product_profile'
                     "competitor_profiles": competitor_profiles
                 },
-                timeout=60
+                idempotent=True
             )
             if response.status_code == 200:
                 return response.json()
             else:
                 print(f"❌ Description API error: {response.status_code}")
                 return None
+        except CircuitOpenError as e:
+            print(f"❌ Description API unavailable: {str(e)}")
+            return None
         except Exception as e:
             print(f"❌ Description API request failed: {str(e)}")
             return None
 
-    def upload_to_s3(self, queue_id, bucket_name, local_directory):
-        """Upload files to S3 via cloud service (no local AWS credentials needed)"""
+    def upload_to_s3(self, queue_id, bucket_name, local_directory, stop_event=None):
+        """Upload files to S3 via cloud service (no local AWS credentials needed), resuming earlier partial uploads"""
         try:
-            # Collect all files to upload
-            files_to_upload = []
-            for root, dirs, files in os.walk(local_directory):
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    # Preserve directory structure in filename
-                    relative_path = os.path.relpath(file_path, local_directory)
-                    files_to_upload.append((relative_path, file_path))
-            
-            # Prepare multipart form data
-            files = []
-            for relative_path, full_path in files_to_upload:
-                files.append(('files', (relative_path, open(full_path, 'rb'), 'application/octet-stream')))
-            
-            # Send files to cloud service
-            response = requests.post(
-                f"{self.api_base_url}/api/s3/upload-files",
-                files=files,
-                data={
-                    'queue_id': queue_id,
-                    'bucket_name': bucket_name
-                }
-            )
-            
-            # Close file handles
-            for _, (_, file_handle, _) in files:
-                file_handle.close()
-            
-            if response.status_code == 200:
-                return response.json()
-            else:
-                raise Exception(f"Upload failed: {response.status_code}: {response.text}")
-                
+            with timer("s3_upload_seconds", outcome="failed") as labels:
+                uploader = QueueUploader(self.api, queue_id, bucket_name, local_directory,
+                                         read_timeout=self.upload_timeout)
+                result = uploader.upload(stop_event=stop_event)
+                labels["outcome"] = "ok"
+                return result
         except Exception as e:
             raise Exception(f"S3 upload error: {str(e)}")
             
-    def scrape_instagram_profile(self, username, image_dir_override=None):
-        """Local Instagram scraping using Playwright with proper image directory"""
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=False)
-            context = browser.new_context(
-                storage_state="playwright_profile/state.json" if os.path.exists("playwright_profile/state.json") else None
-            )
-            page = context.new_page()
-            
-            try:
+    async def load_cached_profile(self, username, image_dir_override=None):
+        """Return a fresh cached profile with its images linked into image_dir_override, or None"""
+        try:
+            profile, age = await asyncio.to_thread(get_profile_cache().get, username)
+        except Exception as e:
+            print(f"⚠️  Profile cache lookup failed for @{username}: {str(e)}")
+            return None
+        if not profile:
+            return None
+        
+        if image_dir_override:
+            os.makedirs(image_dir_override, exist_ok=True)
+            await asyncio.to_thread(relink_images, profile, image_dir_override)
+            # Images that are gone from the earlier queue directory are fetched again (usually from the media store)
+            for post_idx, post in enumerate(profile.get("posts", [])):
+                if post.get("thumbnail_url") and not post.get("local_image_path") and not post.get("is_placeholder"):
+                    await save_post_image(post, post_idx, post_idx, username, image_dir_override)
+        
+        self.profile_cache_ages[username] = round(age)
+        emit("profile_cached", username=username, age_seconds=round(age))
+        print(f"♻️  Using cached profile for @{username} ({age / 60:.0f} min old)")
+        return profile
+
+    async def scrape_instagram_profile_async(self, username, image_dir_override=None, force_refresh=False):
+        """
+        Local Instagram scraping on a pooled async Playwright browser with proper image directory
+        
+        A fresh cached profile is returned as is. Otherwise the scrape is incremental
+        against the last saved profile (only new posts are opened), unless force_refresh.
+        """
+        if not force_refresh:
+            cached_profile = await self.load_cached_profile(username, image_dir_override)
+            if cached_profile:
+                return cached_profile
+        
+        observer = current_observer()
+        collector = current_task_metrics()
+        
+        async def scrape_job(context):
+            # The job runs on the browser pool's loop; carry the event observer and metrics collector across
+            with observe(observer), task_metrics(collector):
+                page = await context.new_page()
+                
                 # Check if login is needed
-                if not os.path.exists("playwright_profile/state.json"):
+                if not self.check_saved_session():
                     print("🔐 Logging into Instagram...")
-                    login_success = login_to_instagram(page, self.instagram_username, self.instagram_password)
+                    login_success = await login_to_instagram_async(page, self.instagram_username, self.instagram_password)
                     if login_success:
                         print("✅ Login successful")
+                        # Save the session so every other pooled context starts logged in
+                        os.makedirs("playwright_profile", exist_ok=True)
+                        await context.storage_state(path=STATE_PATH)
                     else:
                         print("❌ Login failed")
                         return None
                 
                 # Scrape profile with custom image directory
                 print(f"📊 Scraping profile: @{username}")
-                profile_data = scrape_profile(page, username, image_dir_override=image_dir_override)
-                
-                return profile_data
-                
+                return await scrape_profile_async(page, username, image_dir_override=image_dir_override,
+                                                  incremental=not force_refresh)
+        
+        try:
+            profile = await get_browser_pool().run_async(scrape_job)
+        except Exception as e:
+            print(f"❌ Scraping error: {str(e)}")
+            return None
+        
+        if profile:
+            self.profile_cache_ages[username] = None
+            try:
+                await asyncio.to_thread(get_profile_cache().put, username, profile)
             except Exception as e:
-                print(f"❌ Scraping error: {str(e)}")
-                return None
-            finally:
-                browser.close()
+                print(f"⚠️  Could not cache profile for @{username}: {str(e)}")
+        return profile
+
+    def scrape_instagram_profile(self, username, image_dir_override=None, force_refresh=False):
+        """Synchronous wrapper around scrape_instagram_profile_async"""
+        return get_browser_pool().run_coroutine(
+            self.scrape_instagram_profile_async(username, image_dir_override=image_dir_override,
+                                                force_refresh=force_refresh)
+        )
+
+    async def scrape_competitors_async(self, competitor_usernames, competitor_dir, competitor_images_dir, concurrency=None,
+                                       force_refresh=False):
+        """Scrape competitor profiles in parallel contexts, saving each profile as soon as it completes"""
+        semaphore = asyncio.Semaphore(max(1, concurrency or self.competitor_concurrency))
+        
+        async def scrape_competitor(competitor_username):
+            async with semaphore:
+                print(f"📊 Scraping competitor: @{competitor_username}")
+                try:
+                    competitor_profile = await asyncio.wait_for(
+                        self.scrape_instagram_profile_async(competitor_username, image_dir_override=competitor_images_dir,
+                                                            force_refresh=force_refresh),
+                        timeout=self.competitor_timeout
+                    )
+                except asyncio.TimeoutError:
+                    print(f"⏱️  Competitor @{competitor_username} timed out after {self.competitor_timeout:.0f}s")
+                    competitor_profile = None
+                except Exception as e:
+                    print(f"❌ Competitor @{competitor_username} error: {str(e)}")
+                    competitor_profile = None
+            
+            if competitor_profile:
+                # Save competitor profile
+                competitor_file = os.path.join(competitor_dir, f"{competitor_username}_profile.json")
+                with open(competitor_file, 'w', encoding='utf-8') as f:
+                    json.dump(competitor_profile, f, indent=2, ensure_ascii=False)
+                
+                print(f"✅ Competitor @{competitor_username} scraped successfully")
+            else:
+                print(f"❌ Failed to scrape competitor @{competitor_username}")
+            emit("competitor_scraped", username=competitor_username, ok=bool(competitor_profile))
+            return competitor_profile
+        
+        # Keep the search ranking order in the results
+        results = await asyncio.gather(*(scrape_competitor(u) for u in competitor_usernames))
+        return [profile for profile in results if profile]
+
+    def run_local_workflow(self, username, upload_to_s3=True, s3_bucket="smm-analysis-bucket",
+                           max_competitors=None, competitor_concurrency=None, force_refresh=False):
+        """Synchronous wrapper around run_local_workflow_async"""
+        return asyncio.run(self.run_local_workflow_async(
+            username, upload_to_s3=upload_to_s3, s3_bucket=s3_bucket,
+            max_competitors=max_competitors, competitor_concurrency=competitor_concurrency,
+            force_refresh=force_refresh
+        ))
 
-    def run_local_workflow(self, username, upload_to_s3=True, s3_bucket="smm-analysis-bucket"):
-        """Main workflow with description analysis and S3 upload"""
+    async def run_local_workflow_async(self, username, upload_to_s3=True, s3_bucket="smm-analysis-bucket",
+                                       max_competitors=None, competitor_concurrency=None, force_refresh=False,
+                                       queue_id=None):
+        """
+        Main workflow with description analysis and S3 upload (force_refresh bypasses the profile cache)
+        
+        queue_id, set when retrying a job that already created its queue, reuses that
+        queue's directory and S3 prefix instead of starting a new one.
+        
+        The steps run as stages of the process-wide workflow pipeline, so several
+        workflows started on the same event loop overlap: one can scrape while
+        another waits on a cloud call. Per-stage timings are returned in
+        final_result["stage_timings"], and the run's metrics (page loads,
+        downloads, API calls, fallbacks...) in final_result["metrics"].
+        """
         print(f"🚀 Starting analysis for @{username}")
+        self.profile_cache_ages = {}
+        state = {
+            "controller": self,
+            "username": username,
+            "upload_to_s3": upload_to_s3,
+            "s3_bucket": s3_bucket,
+            "max_competitors": max_competitors,
+            "competitor_concurrency": competitor_concurrency,
+            "force_refresh": force_refresh,
+            "resume_queue_id": queue_id
+        }
+        with collect() as run_metrics:
+            result, timings = await get_workflow_pipeline().run(state)
+        if not result:
+            return None
+        
+        # Record the stage timings and cloud API latencies in the local copy of the final analysis
+        final_result = result["final_result"]
+        final_result["stage_timings"] = timings
+        final_result["api_latency"] = self.api.latency_stats()
+        final_result["metrics"] = run_metrics.summary()
+        final_file = os.path.join(result["analysis_dir"], "final_analysis.json")
+        with open(final_file, 'w', encoding='utf-8') as f:
+            json.dump(final_result, f, indent=2, ensure_ascii=False)
+        
+        print(f"⏱️  Stage timings for @{username}: " + ", ".join(
+            f"{stage} {timing['run']:.1f}s (+{timing['queued']:.1f}s queued)" for stage, timing in timings.items()
+        ))
+        return final_result
+
+    async def stage_scrape_product(self, state):
+        """Stage A: create the queue directory and scrape the product profile"""
+        username = state["username"]
         
         # Create organized directory structure
-        queue_id, queue_dir, product_dir, competitor_dir, analysis_dir, product_images_dir, competitor_images_dir = self.create_queue_directory(username)
-        print(f"📁 Created queue directory: {queue_dir}")
+        (state["queue_id"], state["queue_dir"], state["product_dir"], state["competitor_dir"], state["analysis_dir"],
+         state["product_images_dir"], state["competitor_images_dir"]) = self.create_queue_directory(
+            username, queue_id=state.get("resume_queue_id"))
+        print(f"📁 Queue directory: {state['queue_dir']}")
+        emit("queue_created", queue_id=state["queue_id"])
         
         # Step A: Local scraping - PRODUCT (with proper image directory)
         print("📊 Step A: Scraping original profile (LOCAL)")
-        original_profile = self.scrape_instagram_profile(username, image_dir_override=product_images_dir)
+        original_profile = await self.scrape_instagram_profile_async(username, image_dir_override=state["product_images_dir"],
+                                                                     force_refresh=state["force_refresh"])
         if not original_profile:
-            return None
+            return False
         
         # Save product profile
-        product_file = os.path.join(product_dir, f"{username}_profile.json")
+        product_file = os.path.join(state["product_dir"], f"{username}_profile.json")
         with open(product_file, 'w', encoding='utf-8') as f:
             json.dump(original_profile, f, indent=2, ensure_ascii=False)
         
-        # Step B: Cloud LLM Analysis
+        state["original_profile"] = original_profile
+        return True
+
+    async def stage_llm_analysis(self, state):
+        """Stage B: cloud LLM sector analysis"""
         print("🤖 Step B: LLM sector analysis (CLOUD)")
-        llm_result = self.call_llm_analysis(original_profile, original_profile.get('image_posts', []))
-        if not llm_result:
-            return None
-        
-        # Step C: Cloud Google Search
+        original_profile = state["original_profile"]
+        state["llm_result"] = await asyncio.to_thread(self.call_llm_analysis, original_profile, original_profile.get('image_posts', []))
+        return bool(state["llm_result"])
+
+    async def stage_search_competitors(self, state):
+        """Stage C: cloud Google search for competitors"""
         print("🔍 Step C: Google search for competitors (CLOUD)")
-        search_results = self.call_search_competitors(
+        llm_result = state["llm_result"]
+        state["search_results"] = await asyncio.to_thread(
+            self.call_search_competitors,
             llm_result['sector'], 
             llm_result['keywords'], 
-            username  # Pass username as exclude parameter
+            state["username"]  # Pass username as exclude parameter
         )
-        if not search_results:
-            return None
-        
-        # Step D: Local scraping - COMPETITORS (with proper image directory)
+        return bool(state["search_results"])
+
+    async def stage_scrape_competitors(self, state):
+        """Stage D: scrape the competitor profiles found by the search"""
         print("📊 Step D: Scraping competitor profiles (LOCAL)")
-        scraped_competitors = []
+        username = state["username"]
+        competitor_usernames = []
+        for competitor_username in state["search_results"].get('instagram_usernames', []):
+            if competitor_username != username and competitor_username not in competitor_usernames:
+                competitor_usernames.append(competitor_username)
         
-        for competitor_username in search_results['instagram_usernames'][:1]:  # Only scrape 1
-            print(f"📊 Scraping competitor: @{competitor_username}")
-            competitor_profile = self.scrape_instagram_profile(competitor_username, image_dir_override=competitor_images_dir)
-            
-            if competitor_profile:
-                # Save competitor profile
-                competitor_file = os.path.join(competitor_dir, f"{competitor_username}_profile.json")
-                with open(competitor_file, 'w', encoding='utf-8') as f:
-                    json.dump(competitor_profile, f, indent=2, ensure_ascii=False)
-                
-                scraped_competitors.append(competitor_profile)
-                print(f"✅ Competitor @{competitor_username} scraped successfully")
-            else:
-                print(f"❌ Failed to scrape competitor @{competitor_username}")
+        # An explicit max_competitors=0 means no competitors, not the default
+        max_competitors = self.max_competitors if state["max_competitors"] is None else state["max_competitors"]
+        competitor_usernames = competitor_usernames[:max(0, max_competitors)]
+        emit("competitors_found", usernames=competitor_usernames)
+        state["scraped_competitors"] = await self.scrape_competitors_async(
+            competitor_usernames,
+            state["competitor_dir"],
+            state["competitor_images_dir"],
+            concurrency=state["competitor_concurrency"] or self.competitor_concurrency,
+            force_refresh=state["force_refresh"]
+        )
+        return True
+
+    async def stage_process_images(self, state):
+        """Stage D2: optional re-encoding, thumbnailing and dedupe of the run's images (see image_processing)"""
+        if not IMAGE_PROCESSING:
+            return True
+        if not pillow_available():
+            print("⚠️  IMAGE_PROCESSING is on but Pillow is not installed - skipping image processing")
+            return True
+        
+        print("🖼️  Step D2: Processing images (LOCAL)")
+        processor = get_image_processor()
+        profiles = [state["original_profile"]] + state["scraped_competitors"]
+        await processor.process_profiles(profiles)
+        
+        # Re-encoded files replace the originals: the cache and product_data must point at them
+        for profile in profiles:
+            try:
+                await asyncio.to_thread(get_profile_cache().update, profile["username"], profile)
+            except Exception as e:
+                print(f"⚠️  Could not update cached profile for @{profile['username']}: {str(e)}")
+            await asyncio.to_thread(save_profile_data, profile["username"], profile)
+        
+        # Dedupe compares this job's profiles only, so its results stay in the queue directory.
+        # Product first, so a competitor's copy of a product image is the one dropped
+        processor.dedupe_profiles(profiles)
+        totals = processor.summarize(profiles)
+        state["image_processing"] = totals
+        
+        # Save the profiles again with the processing results
+        product_file = os.path.join(state["product_dir"], f"{state['username']}_profile.json")
+        with open(product_file, 'w', encoding='utf-8') as f:
+            json.dump(state["original_profile"], f, indent=2, ensure_ascii=False)
+        for competitor_profile in state["scraped_competitors"]:
+            competitor_file = os.path.join(state["competitor_dir"], f"{competitor_profile['username']}_profile.json")
+            with open(competitor_file, 'w', encoding='utf-8') as f:
+                json.dump(competitor_profile, f, indent=2, ensure_ascii=False)
+        
+        emit("images_processed", **totals)
+        print(f"🖼️  Processed {totals['processed']} of {totals['images']} images, dropped {totals['duplicates']} "
+              f"duplicates ({totals['bytes_before'] / 1024:.0f} KB -> {totals['bytes_after'] / 1024:.0f} KB)")
+        return True
+
+    async def stage_describe(self, state):
+        """Stages E and F: cloud description analysis, then consolidate the results"""
+        username = state["username"]
+        queue_id = state["queue_id"]
+        llm_result = state["llm_result"]
+        scraped_competitors = state["scraped_competitors"]
         
         # Step E: Cloud Description Analysis
         print("📝 Step E: Description analysis (CLOUD)")
-        description_result = self.call_description_analysis(original_profile, scraped_competitors)  # Add scraped_competitors
+        description_result = await asyncio.to_thread(self.call_description_analysis, state["original_profile"], scraped_competitors)  # Add scraped_competitors
         
         # Save description analysis
         if description_result:
-            description_file = os.path.join(analysis_dir, "description_analysis.json")
+            description_file = os.path.join(state["analysis_dir"], "description_analysis.json")
             with open(description_file, 'w', encoding='utf-8') as f:
                 json.dump(description_result, f, indent=2, ensure_ascii=False)
         
@@ -247,14 +509,16 @@ class LocalWorkflowController:
             "queue_id": queue_id,
             "timestamp": datetime.now().isoformat(),
             "sector_analysis": llm_result,  # Fixed variable name
-            "search_results": search_results,
+            "search_results": state["search_results"],
             "competitors": [comp for comp in scraped_competitors],  # Fixed iteration
             "description_analysis": description_result,
+            "profile_cache_ages": dict(self.profile_cache_ages),  # seconds; None = scraped fresh
+            "image_processing": state.get("image_processing"),  # None unless IMAGE_PROCESSING is on
             "status": "completed"
         }
         
         # Save final analysis
-        final_file = os.path.join(analysis_dir, "final_analysis.json")
+        final_file = os.path.join(state["analysis_dir"], "final_analysis.json")
         with open(final_file, 'w', encoding='utf-8') as f:
             json.dump(final_result, f, indent=2, ensure_ascii=False)  # Fixed variable name
         
@@ -268,26 +532,37 @@ class LocalWorkflowController:
             "timestamp": datetime.now().isoformat()
         }
         
-        summary_file = os.path.join(queue_dir, "summary.json")
+        summary_file = os.path.join(state["queue_dir"], "summary.json")
         with open(summary_file, 'w', encoding='utf-8') as f:
             json.dump(summary, f, indent=2, ensure_ascii=False)
         
         print(f"\n✅ Analysis complete!")
         print(f"📁 Queue ID: {queue_id}")
-        print(f"📂 All data saved to: {queue_dir}")
+        print(f"📂 All data saved to: {state['queue_dir']}")
         print(f"📋 Summary: {summary_file}")
         
-        # Step G: S3 Upload and Worker Trigger
-        if upload_to_s3:
+        state["final_result"] = final_result
+        return True
+
+    async def stage_upload(self, state):
+        """Stage G: S3 upload and worker trigger"""
+        if state["upload_to_s3"]:
             print(f"\n☁️  Step G: Uploading to S3 and triggering worker analysis...")
-            upload_result = self.upload_to_s3(queue_id, s3_bucket, queue_dir)
+            stop_event = threading.Event()
+            try:
+                upload_result = await asyncio.to_thread(self.upload_to_s3, state["queue_id"], state["s3_bucket"],
+                                                        state["queue_dir"], stop_event=stop_event)
+            except asyncio.CancelledError:
+                # The upload thread can't be cancelled; stop it from sending further batches
+                stop_event.set()
+                raise
+            emit("upload_finished", ok=bool(upload_result))
             if upload_result:
                 print(f"✅ S3 upload successful - Worker analysis triggered!")
                 print(f"🔄 Worker will process: {upload_result.get('message', 'Processing...')}")
             else:
                 print(f"❌ S3 upload failed - Worker analysis not triggered")
-        
-        return final_result  # Fixed variable name
+        return True
 
     def login_and_save_session(self):
         """Option 1: Login to Instagram and save session"""
@@ -382,7 +657,7 @@ class LocalWorkflowController:
     
     def check_saved_session(self):
         """Check if saved login session exists"""
-        return os.path.exists("playwright_profile/state.json")
+        return os.path.exists(STATE_PATH)
     
     def scrape_with_saved_session(self, username):
         """Option 2: Use existing saved login session to start scraping"""
@@ -0,0 +1,235 @@
+"""
+Content-addressed store for downloaded post media.
+
+Every image is stored once under output/media_store/objects/<sha256 prefix>/,
+named by the hash of its content. An index maps media keys (the Instagram
+media ID when known, otherwise the CDN URL path without its signed query
+string) to content hashes, so a repeat scrape of the same profile or
+competitor links the stored file into the new queue directory instead of
+downloading it again. Files are hardlinked where the filesystem allows it
+and copied otherwise.
+
+The index lives in SQLite (index.db in the store directory), shared by every
+worker process using the store. The store is bounded: once it grows past
+MEDIA_STORE_MAX_MB, the least recently used objects are evicted. Files
+already linked into queue directories are unaffected by eviction.
+"""
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+MEDIA_STORE_DIR = os.getenv("MEDIA_STORE_DIR", "output/media_store")
+MEDIA_STORE_MAX_MB = int(os.getenv("MEDIA_STORE_MAX_MB", "2048"))
+
+
+def media_key(url, media_id=None, variant=None):
+    """
+    Key a media file by Instagram media ID, falling back to the URL path
+
+    Sizes of the same image share both (Instagram puts the size in the query
+    string), so a size variant other than the default gets its own key.
+    """
+    suffix = f"@{variant}" if variant else ""
+    if media_id:
+        return f"id:{media_id}{suffix}"
+    if not url:
+        return None
+    return f"path:{urlparse(url).path}{suffix}"
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def link_or_copy(src, dest):
+    """Hardlink src to dest (replacing dest), copying if hardlinks aren't possible"""
+    os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+    if os.path.exists(dest):
+        if os.path.samefile(src, dest):
+            return
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+    except OSError:
+        shutil.copy2(src, dest)
+
+
+class MediaStore:
+    def __init__(self, root=MEDIA_STORE_DIR, max_bytes=None):
+        """
+        Args:
+            root: Store directory (env MEDIA_STORE_DIR, default output/media_store)
+            max_bytes: Size limit before LRU eviction (env MEDIA_STORE_MAX_MB, default 2048 MB)
+        """
+        self.root = root
+        self.max_bytes = max_bytes or MEDIA_STORE_MAX_MB * 1024 * 1024
+        self.objects_dir = os.path.join(root, "objects")
+        self.index_path = os.path.join(root, "index.db")
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS media_keys ("
+                " key TEXT PRIMARY KEY,"
+                " content_hash TEXT NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS media_objects ("
+                " content_hash TEXT PRIMARY KEY,"
+                " size INTEGER NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS media_counters ("
+                " name TEXT PRIMARY KEY,"
+                " value INTEGER NOT NULL DEFAULT 0)"
+            )
+
+    # ----- index -----
+
+    @contextmanager
+    def _connect(self, write=False):
+        # One short-lived connection per call; the index is shared by every worker process.
+        # Writers take the database's write lock up front, so a lookup-then-update can't
+        # interleave with another process's.
+        conn = sqlite3.connect(self.index_path, timeout=30)
+        try:
+            with conn:
+                if write:
+                    conn.execute("BEGIN IMMEDIATE")
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _count(conn, name, amount=1):
+        conn.execute(
+            "INSERT INTO media_counters (name, value) VALUES (?, ?)"
+            " ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+            (name, amount)
+        )
+
+    def _object_path(self, content_hash):
+        return os.path.join(self.objects_dir, content_hash[:2], content_hash)
+
+    def total_bytes(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COALESCE(SUM(size), 0) FROM media_objects").fetchone()[0]
+
+    # ----- lookups -----
+
+    def fetch(self, key, dest):
+        """
+        Link the stored file for key to dest.
+
+        Returns:
+            True on a cache hit, False if the media has to be downloaded
+        """
+        if not key:
+            return False
+        with self._connect(write=True) as conn:
+            row = conn.execute("SELECT content_hash FROM media_keys WHERE key = ?", (key,)).fetchone()
+            content_hash = row[0] if row else None
+            path = self._object_path(content_hash) if content_hash else None
+            if not path or not os.path.exists(path):
+                if content_hash:
+                    # Object vanished from disk; forget it
+                    conn.execute("DELETE FROM media_keys WHERE content_hash = ?", (content_hash,))
+                    conn.execute("DELETE FROM media_objects WHERE content_hash = ?", (content_hash,))
+                self._count(conn, "misses")
+                return False
+            try:
+                link_or_copy(path, dest)
+            except OSError as e:
+                print(f"⚠️  Media store: could not link {key}: {str(e)}")
+                self._count(conn, "misses")
+                return False
+            conn.execute("UPDATE media_objects SET last_used = ? WHERE content_hash = ?", (time.time(), content_hash))
+            self._count(conn, "hits")
+            return True
+
+    def add(self, key, path):
+        """
+        Store a freshly downloaded file under key.
+
+        Identical content already in the store is shared, and path is relinked to
+        the stored copy. Returns the content hash.
+        """
+        content_hash = file_sha256(path)
+        with self._connect(write=True) as conn:
+            object_path = self._object_path(content_hash)
+            known = conn.execute("SELECT 1 FROM media_objects WHERE content_hash = ?", (content_hash,)).fetchone()
+            if known and os.path.exists(object_path):
+                link_or_copy(object_path, path)
+            else:
+                link_or_copy(path, object_path)
+            conn.execute(
+                "INSERT INTO media_objects (content_hash, size, last_used) VALUES (?, ?, ?)"
+                " ON CONFLICT (content_hash) DO UPDATE SET size = excluded.size, last_used = excluded.last_used",
+                (content_hash, os.path.getsize(object_path), time.time())
+            )
+            if key:
+                conn.execute(
+                    "INSERT INTO media_keys (key, content_hash) VALUES (?, ?)"
+                    " ON CONFLICT (key) DO UPDATE SET content_hash = excluded.content_hash",
+                    (key, content_hash)
+                )
+            self._evict(conn)
+        return content_hash
+
+    def _evict(self, conn):
+        """Drop least recently used objects until the whole store fits max_bytes"""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM media_objects").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for content_hash, size in conn.execute(
+            "SELECT content_hash, size FROM media_objects ORDER BY last_used"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(self._object_path(content_hash))
+            except OSError:
+                pass
+            conn.execute("DELETE FROM media_objects WHERE content_hash = ?", (content_hash,))
+            conn.execute("DELETE FROM media_keys WHERE content_hash = ?", (content_hash,))
+            total -= size
+            evicted += 1
+        self._count(conn, "evictions", evicted)
+
+    def stats(self):
+        """Store-wide counters and size, across every process using the store"""
+        with self._connect() as conn:
+            counters = dict(conn.execute("SELECT name, value FROM media_counters").fetchall())
+            objects, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM media_objects").fetchone()
+        return {
+            "hits": counters.get("hits", 0),
+            "misses": counters.get("misses", 0),
+            "evictions": counters.get("evictions", 0),
+            "objects": objects,
+            "bytes": total
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_media_store():
+    """Return the process-wide media store, creating it on first use"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = MediaStore()
+        return _store
@@ -0,0 +1,325 @@
+"""
+Histograms and counters for the scraper, exposed in the Prometheus text format.
+
+Code doing the work records into the process-wide registry:
+
+    with timer("page_goto_seconds", kind="post"):
+        await page.goto(url)
+    inc("videos_skipped_total", where="grid")
+
+Every value recorded while a task collector is installed (collect()) is also
+added to that collector, so a workflow run can attach its own numbers to its
+result. Like the event observer, the collector lives in a context variable:
+it follows asyncio tasks and asyncio.to_thread() calls, and work handed to
+another event loop or to a thread pool carries it across with
+current_task_metrics() and task_metrics(), or contextvars.copy_context().
+
+Worker processes write their registry to METRICS_DIR (one JSON file per
+process); render_prometheus() merges those files with the calling process's
+own registry, so /metrics on the web process covers every worker.
+"""
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_DIR = os.getenv("METRICS_DIR", os.path.join("output", "metrics"))
+# Seconds between writes of a worker's metrics file
+METRICS_EXPORT_INTERVAL = float(os.getenv("METRICS_EXPORT_INTERVAL", "10"))
+METRICS_PREFIX = "instagram_scraper_"
+
+# Upper bounds (seconds) of the histogram buckets; +Inf is implied
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+HISTOGRAMS = {
+    "browser_launch_seconds": "Time to launch a pooled browser",
+    "page_goto_seconds": "Time for page.goto() to reach domcontentloaded, by page kind",
+    "grid_discovery_seconds": "Time per round of finding post candidates in the profile grid, by method",
+    "post_extraction_seconds": "Time to extract one post from its page",
+    "image_download_seconds": "Time to fetch one image, by outcome",
+    "api_call_seconds": "Cloud API call latency including retries, by endpoint and outcome",
+    "s3_upload_seconds": "Time to upload a queue directory, by outcome",
+    "workflow_stage_seconds": "Run time of a workflow pipeline stage",
+    "image_processing_seconds": "Time to re-encode, thumbnail and hash one image, by outcome",
+}
+COUNTERS = {
+    "placeholder_posts_total": "Placeholder posts added to reach the post target, by reason",
+    "videos_skipped_total": "Video posts passed over while collecting image posts, by where they were recognised",
+    "selector_fallbacks_total": "Extractions that needed a fallback selector or path, by field",
+    "images_deduplicated_total": "Images dropped as near-duplicates of an image kept earlier in the run",
+}
+
+_collector = contextvars.ContextVar("task_metrics_collector", default=None)
+
+
+def _label_key(labels):
+    return tuple(sorted((str(name), str(value)) for name, value in labels.items()))
+
+
+class MetricsRegistry:
+    """Thread-safe histograms and counters, keyed by name and labels"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._histograms = {}  # (name, label key) -> {"buckets": [...], "sum", "count", "max"}
+        self._counters = {}  # (name, label key) -> value
+        self._lock = threading.Lock()
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0,
+                                                  "max": 0.0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][index] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+            series["max"] = max(series["max"], value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def snapshot(self):
+        """JSON-serialisable copy of every series (per-bucket, not cumulative, counts)"""
+        with self._lock:
+            return {
+                "buckets": list(self.buckets),
+                "histograms": [
+                    {"name": name, "labels": dict(labels), "buckets": list(series["buckets"]),
+                     "sum": series["sum"], "count": series["count"], "max": series["max"]}
+                    for (name, labels), series in self._histograms.items()
+                ],
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in self._counters.items()
+                ]
+            }
+
+    def summary(self):
+        """
+        Compact per-series totals for attaching to a task result
+
+        Returns:
+            {"histograms": {name: [{"labels", "count", "sum", "avg", "max"}]},
+             "counters": {name: [{"labels", "value"}]}}
+        """
+        snapshot = self.snapshot()
+        histograms, counters = {}, {}
+        for series in snapshot["histograms"]:
+            histograms.setdefault(series["name"], []).append({
+                "labels": series["labels"],
+                "count": series["count"],
+                "sum": round(series["sum"], 3),
+                "avg": round(series["sum"] / series["count"], 3) if series["count"] else None,
+                "max": round(series["max"], 3)
+            })
+        for series in snapshot["counters"]:
+            counters.setdefault(series["name"], []).append({"labels": series["labels"], "value": series["value"]})
+        return {"histograms": histograms, "counters": counters}
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_metrics():
+    """Return the process-wide metrics registry, creating it on first use"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry()
+        return _registry
+
+
+# ----- recording -----
+
+def observe(name, value, **labels):
+    """Record a histogram value (seconds for *_seconds metrics)"""
+    get_metrics().observe(name, value, **labels)
+    collector = _collector.get()
+    if collector is not None:
+        collector.observe(name, value, **labels)
+
+
+def inc(name, amount=1, **labels):
+    """Increment a counter"""
+    get_metrics().inc(name, amount, **labels)
+    collector = _collector.get()
+    if collector is not None:
+        collector.inc(name, amount, **labels)
+
+
+@contextmanager
+def timer(name, **labels):
+    """
+    Record the time spent in the block; labels may be changed on the yielded dict
+
+    Works around awaits as well, e.g. `with timer(...) as labels: await ...`.
+    """
+    labels = dict(labels)
+    started = time.monotonic()
+    try:
+        yield labels
+    finally:
+        observe(name, time.monotonic() - started, **labels)
+
+
+# ----- per-task collection -----
+
+def current_task_metrics():
+    """The collector installed for the current task, or None"""
+    return _collector.get()
+
+
+@contextmanager
+def task_metrics(collector):
+    """Also record values from inside the block (and tasks started in it) into collector"""
+    token = _collector.set(collector)
+    try:
+        yield collector
+    finally:
+        _collector.reset(token)
+
+
+@contextmanager
+def collect():
+    """Install a fresh collector for the block and yield it"""
+    with task_metrics(MetricsRegistry()) as collector:
+        yield collector
+
+
+# ----- multi-process export -----
+
+def _process_file(pid=None):
+    return os.path.join(METRICS_DIR, f"metrics_{pid or os.getpid()}.json")
+
+
+def write_process_metrics():
+    """Write this process's registry to its file in METRICS_DIR"""
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    path = _process_file()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(get_metrics().snapshot(), f)
+    os.replace(tmp_path, path)
+
+
+def clear_process_metrics():
+    """Remove every process's metrics file (done when a new worker pool starts)"""
+    if not os.path.isdir(METRICS_DIR):
+        return
+    for entry in os.listdir(METRICS_DIR):
+        if entry.startswith("metrics_") and entry.endswith(".json"):
+            try:
+                os.remove(os.path.join(METRICS_DIR, entry))
+            except OSError:
+                pass
+
+
+def _read_process_metrics():
+    """Snapshots written by other processes"""
+    snapshots = []
+    if not os.path.isdir(METRICS_DIR):
+        return snapshots
+    own = os.path.basename(_process_file())
+    for entry in os.listdir(METRICS_DIR):
+        if entry == own or not (entry.startswith("metrics_") and entry.endswith(".json")):
+            continue
+        try:
+            with open(os.path.join(METRICS_DIR, entry), "r", encoding="utf-8") as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _merge(snapshots):
+    histograms, counters = {}, {}
+    for snapshot in snapshots:
+        bounds = tuple(snapshot.get("buckets", DEFAULT_BUCKETS))
+        for series in snapshot.get("histograms", []):
+            key = (series["name"], _label_key(series["labels"]))
+            merged = histograms.setdefault(key, {"bounds": bounds, "buckets": [0] * len(bounds), "sum": 0.0,
+                                                 "count": 0})
+            if merged["bounds"] == bounds:
+                merged["buckets"] = [a + b for a, b in zip(merged["buckets"], series["buckets"])]
+            merged["sum"] += series["sum"]
+            merged["count"] += series["count"]
+        for series in snapshot.get("counters", []):
+            key = (series["name"], _label_key(series["labels"]))
+            counters[key] = counters.get(key, 0) + series["value"]
+    return histograms, counters
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, float) and math.isinf(value):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(gauges=None):
+    """
+    Every process's metrics in the Prometheus text exposition format
+
+    Args:
+        gauges: Optional {name: (help, [(labels dict, value), ...])} of point-in-time
+            values computed by the caller, e.g. task counts
+
+    Returns:
+        The exposition text
+    """
+    histograms, counters = _merge([get_metrics().snapshot()] + _read_process_metrics())
+    lines = []
+
+    for name in sorted({name for name, _ in histograms}):
+        metric = METRICS_PREFIX + name
+        lines.append(f"# HELP {metric} {HISTOGRAMS.get(name, name)}")
+        lines.append(f"# TYPE {metric} histogram")
+        for (series_name, labels), series in sorted(histograms.items()):
+            if series_name != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(series["bounds"], series["buckets"]):
+                cumulative += count
+                lines.append(f"{metric}_bucket{_format_labels(labels, [('le', _format_value(float(bound)))])} "
+                             f"{cumulative}")
+            lines.append(f"{metric}_bucket{_format_labels(labels, [('le', '+Inf')])} {series['count']}")
+            lines.append(f"{metric}_sum{_format_labels(labels)} {_format_value(float(series['sum']))}")
+            lines.append(f"{metric}_count{_format_labels(labels)} {series['count']}")
+
+    for name in sorted({name for name, _ in counters}):
+        metric = METRICS_PREFIX + name
+        lines.append(f"# HELP {metric} {COUNTERS.get(name, name)}")
+        lines.append(f"# TYPE {metric} counter")
+        for (series_name, labels), value in sorted(counters.items()):
+            if series_name == name:
+                lines.append(f"{metric}{_format_labels(labels)} {_format_value(value)}")
+
+    for name, (help_text, values) in sorted((gauges or {}).items()):
+        metric = METRICS_PREFIX + name
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} gauge")
+        for labels, value in values:
+            lines.append(f"{metric}{_format_labels(_label_key(labels))} {_format_value(value)}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,160 @@
+"""
+Staged asyncio pipeline.
+
+A Pipeline is a chain of stages, each with its own queue and its own pool of
+worker tasks. A job moves from stage to stage as each handler finishes, so
+several jobs are in flight at once: while one job waits on a cloud call,
+another can be scraping. Each stage's capacity is tuned independently.
+
+Handlers are coroutines that take the job's state dictionary, update it in
+place, and return a truthy value to pass the job to the next stage. A falsy
+return ends the job early with no result. Per-stage queue wait and run times
+are recorded for every job.
+
+Each handler runs as its own task. When the caller of run() is cancelled
+(e.g. a worker lost the job's lease), the running handler task is cancelled
+and the job is dropped from every later stage queue.
+
+Stage workers outlive the jobs they run, so each job carries the event
+observer and metrics collector of the caller that submitted it; handlers run
+under them, stage_started/stage_finished events are emitted around them and
+their run time is recorded as workflow_stage_seconds.
+"""
+import asyncio
+import time
+
+from scrape_events import current_observer, observe, emit
+from metrics import current_task_metrics, task_metrics, observe as observe_metric
+
+
+class PipelineJob:
+    def __init__(self, state):
+        self.state = state
+        self.timings = {}  # stage name -> {"queued": seconds, "run": seconds}
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = None
+        self.observer = current_observer()
+        self.metrics = current_task_metrics()
+        self.handler_task = None  # Task of the stage handler currently running the job
+
+    def cancel(self):
+        """Stop the job: cancel its running handler; stage workers skip it from now on"""
+        self.future.cancel()
+        if self.handler_task is not None:
+            self.handler_task.cancel()
+
+
+class Stage:
+    def __init__(self, name, handler, workers=1):
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue = asyncio.Queue()
+        self.busy = 0
+        self.completed = 0
+
+
+class Pipeline:
+    def __init__(self, stages):
+        """
+        Args:
+            stages: List of (name, handler, workers) tuples in execution order
+        """
+        self.stages = [Stage(name, handler, workers) for name, handler, workers in stages]
+        self._tasks = []
+
+    def _start(self):
+        if self._tasks:
+            return
+        for index, stage in enumerate(self.stages):
+            for _ in range(stage.workers):
+                self._tasks.append(asyncio.create_task(self._stage_worker(index)))
+
+    def _enqueue(self, index, job):
+        job.enqueued_at = time.monotonic()
+        self.stages[index].queue.put_nowait(job)
+
+    async def _stage_worker(self, index):
+        stage = self.stages[index]
+        while True:
+            job = await stage.queue.get()
+            if job.future.cancelled():
+                # The caller gave up on the job while it was queued
+                stage.queue.task_done()
+                continue
+            started = time.monotonic()
+            stage.busy += 1
+            with observe(job.observer), task_metrics(job.metrics):
+                emit("stage_started", stage=stage.name)
+                try:
+                    # A task of its own, so cancelling the job stops this handler but not the stage worker
+                    job.handler_task = asyncio.create_task(stage.handler(job.state))
+                    proceed = await job.handler_task
+                except asyncio.CancelledError:
+                    if asyncio.current_task().cancelling():
+                        raise  # The pipeline is closing
+                    continue
+                except Exception as e:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                    continue
+                finally:
+                    job.handler_task = None
+                    stage.busy -= 1
+                    stage.completed += 1
+                    job.timings[stage.name] = {
+                        "queued": round(started - job.enqueued_at, 3),
+                        "run": round(time.monotonic() - started, 3)
+                    }
+                    emit("stage_finished", stage=stage.name, **job.timings[stage.name])
+                    observe_metric("workflow_stage_seconds", job.timings[stage.name]["run"], stage=stage.name)
+                    stage.queue.task_done()
+
+            if job.future.done():
+                continue
+            if not proceed:
+                job.future.set_result(None)
+            elif index + 1 < len(self.stages):
+                self._enqueue(index + 1, job)
+            else:
+                job.future.set_result(job.state)
+
+    async def run(self, state):
+        """
+        Push a job through every stage.
+
+        Returns:
+            (state, timings) - state is None if a stage ended the job early
+        """
+        self._start()
+        job = PipelineJob(state)
+        self._enqueue(0, job)
+        try:
+            result = await job.future
+        except asyncio.CancelledError:
+            job.cancel()
+            state["stage_timings"] = job.timings
+            raise
+        except BaseException:
+            # Timings are still useful to the caller when a stage failed
+            state["stage_timings"] = job.timings
+            raise
+        return result, job.timings
+
+    def stats(self):
+        """Queue depth and busy workers per stage"""
+        return {
+            stage.name: {
+                "workers": stage.workers,
+                "busy": stage.busy,
+                "queued": stage.queue.qsize(),
+                "completed": stage.completed
+            }
+            for stage in self.stages
+        }
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,139 @@
+"""
+SQLite-backed cache of scraped profiles.
+
+The last successful scrape_profile result for each username is kept in
+output/profile_cache.db. Lookups younger than PROFILE_CACHE_TTL seconds are
+served from the cache, so a profile or competitor that was scraped recently
+doesn't need a browser at all. Cached profiles reference images from the
+queue directory of the scrape that produced them; relink_images() brings
+those images into the new queue directory.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from media_store import link_or_copy
+
+PROFILE_CACHE_PATH = os.getenv("PROFILE_CACHE_PATH", "output/profile_cache.db")
+PROFILE_CACHE_TTL = int(os.getenv("PROFILE_CACHE_TTL", "21600"))  # 6 hours
+
+
+class ProfileCache:
+    def __init__(self, path=PROFILE_CACHE_PATH, ttl=None):
+        """
+        Args:
+            path: SQLite database file (env PROFILE_CACHE_PATH, default output/profile_cache.db)
+            ttl: Seconds a cached profile stays fresh (env PROFILE_CACHE_TTL, default 21600)
+        """
+        self.path = path
+        self.ttl = PROFILE_CACHE_TTL if ttl is None else ttl
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS profiles ("
+                " username TEXT PRIMARY KEY,"
+                " profile TEXT NOT NULL,"
+                " scraped_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per call keeps the cache safe to use from any thread
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, username, max_age=None):
+        """
+        Look up a cached profile.
+
+        Args:
+            username: Instagram username
+            max_age: Maximum age in seconds (default: the cache TTL)
+
+        Returns:
+            (profile, age_seconds), or (None, None) on a miss or a stale entry
+        """
+        max_age = self.ttl if max_age is None else max_age
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT profile, scraped_at FROM profiles WHERE username = ?",
+                (username.lower(),)
+            ).fetchone()
+        if not row:
+            return None, None
+        age = time.time() - row[1]
+        if age > max_age:
+            return None, None
+        try:
+            return json.loads(row[0]), age
+        except ValueError:
+            return None, None
+
+    def put(self, username, profile):
+        """Store a freshly scraped profile"""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO profiles (username, profile, scraped_at) VALUES (?, ?, ?)",
+                (username.lower(), json.dumps(profile, ensure_ascii=False), time.time())
+            )
+
+    def update(self, username, profile):
+        """Replace a cached profile's data without renewing its age (e.g. after image processing)"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE profiles SET profile = ? WHERE username = ?",
+                (json.dumps(profile, ensure_ascii=False), username.lower())
+            )
+
+    def invalidate(self, username):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM profiles WHERE username = ?", (username.lower(),))
+
+    def purge_expired(self):
+        """Delete entries older than the TTL; returns how many were removed"""
+        with self._connect() as conn:
+            cursor = conn.execute("DELETE FROM profiles WHERE scraped_at < ?", (time.time() - self.ttl,))
+            return cursor.rowcount
+
+
+def relink_images(profile, image_dir):
+    """
+    Link a cached profile's images into image_dir and update local_image_path.
+
+    Returns:
+        Number of posts whose image is missing (and needs to be downloaded again)
+    """
+    missing = 0
+    for post in profile.get("posts", []):
+        src = post.get("local_image_path")
+        if not src:
+            continue
+        dest = os.path.join(image_dir, os.path.basename(src))
+        try:
+            link_or_copy(src, dest)
+            post["local_image_path"] = dest
+        except OSError:
+            post.pop("local_image_path", None)
+            missing += 1
+    return missing
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_profile_cache():
+    """Return the process-wide profile cache, creating it on first use"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ProfileCache()
+        return _cache
@@ -0,0 +1,174 @@
+"""
+Event-driven readiness helpers for Playwright pages.
+
+These replace fixed time.sleep() calls in the scraper: every wait is tied to a
+concrete condition (a selector appearing, the post grid growing, Instagram's
+GraphQL traffic going quiet) and returns as soon as that condition holds, with
+a per-step timeout as the upper bound. All helpers are coroutines for the
+async Playwright API.
+"""
+import asyncio
+import time
+
+# Instagram XHR endpoints that carry profile and timeline data
+GRAPHQL_URL_MARKERS = ("/graphql", "/api/v1/")
+
+
+class AdaptiveBackoff:
+    """Polling delay that starts short and grows while nothing changes"""
+
+    def __init__(self, initial=0.05, factor=1.6, max_delay=1.0):
+        self.initial = initial
+        self.factor = factor
+        self.max_delay = max_delay
+        self.delay = initial
+
+    def reset(self):
+        self.delay = self.initial
+
+    async def wait(self, remaining=None):
+        """Sleep for the current delay (capped by the remaining budget) and grow it"""
+        delay = self.delay if remaining is None else max(0, min(self.delay, remaining))
+        await asyncio.sleep(delay)
+        self.delay = min(self.delay * self.factor, self.max_delay)
+
+
+async def wait_until(condition, timeout=5.0, backoff=None):
+    """
+    Poll a condition with adaptive backoff until it returns a truthy value.
+
+    Args:
+        condition: Zero-argument callable (may return an awaitable)
+        timeout: Upper bound in seconds
+        backoff: Optional AdaptiveBackoff instance
+
+    Returns:
+        The condition's last value (falsy if the timeout expired)
+    """
+    backoff = backoff or AdaptiveBackoff()
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            value = condition()
+            if asyncio.iscoroutine(value):
+                value = await value
+        except Exception:
+            value = None
+        remaining = deadline - time.monotonic()
+        if value or remaining <= 0:
+            return value
+        await backoff.wait(remaining)
+
+
+async def wait_for_selector(page, selector, timeout=5000, state="attached"):
+    """Wait for a selector and return its element handle, or None on timeout"""
+    try:
+        return await page.wait_for_selector(selector, timeout=timeout, state=state)
+    except Exception:
+        return None
+
+
+async def wait_for_hidden(page, selector, timeout=3000):
+    """Wait for a selector to disappear (e.g. a dismissed popup); True if it did"""
+    try:
+        await page.wait_for_selector(selector, timeout=timeout, state="hidden")
+        return True
+    except Exception:
+        return False
+
+
+async def wait_for_count_above(page, selector, previous_count, timeout=2000):
+    """
+    Wait until more elements than previous_count match the selector.
+
+    Returns:
+        The new match count (unchanged if nothing new appeared before the timeout)
+    """
+    try:
+        await page.wait_for_function(
+            "([selector, count]) => document.querySelectorAll(selector).length > count",
+            arg=[selector, previous_count],
+            timeout=timeout
+        )
+    except Exception:
+        pass
+    try:
+        return await page.locator(selector).count()
+    except Exception:
+        return previous_count
+
+
+async def scroll_grid(page, selector, target_count, max_scrolls=5, step_timeout=2000,
+                      scroll_script="window.scrollTo(0, document.body.scrollHeight);", patience=1):
+    """
+    Scroll the page until the grid selector matches target_count elements.
+
+    Each scroll waits only as long as the grid needs to grow; after `patience`
+    consecutive scrolls without new elements the grid is considered exhausted.
+
+    Returns:
+        Number of matching elements after scrolling
+    """
+    try:
+        count = await page.locator(selector).count()
+    except Exception:
+        count = 0
+    stalled = 0
+    for _ in range(max_scrolls):
+        if count >= target_count:
+            break
+        try:
+            await page.evaluate(scroll_script)
+        except Exception:
+            break
+        new_count = await wait_for_count_above(page, selector, count, timeout=step_timeout)
+        if new_count <= count:
+            stalled += 1
+            if stalled >= patience:
+                break
+        else:
+            stalled = 0
+        count = new_count
+    return count
+
+
+class NetworkActivityTracker:
+    """Counts in-flight requests whose URL matches one of the given markers"""
+
+    def __init__(self, page, url_markers=GRAPHQL_URL_MARKERS):
+        self.page = page
+        self.url_markers = url_markers
+        self.in_flight = set()
+        self.last_activity = time.monotonic()
+        page.on("request", self._on_request)
+        page.on("requestfinished", self._on_done)
+        page.on("requestfailed", self._on_done)
+
+    def _matches(self, request):
+        return any(marker in request.url for marker in self.url_markers)
+
+    def _on_request(self, request):
+        if self._matches(request):
+            self.in_flight.add(request)
+            self.last_activity = time.monotonic()
+
+    def _on_done(self, request):
+        if request in self.in_flight:
+            self.in_flight.discard(request)
+            self.last_activity = time.monotonic()
+
+    async def wait_for_idle(self, idle_time=0.5, timeout=10.0):
+        """Wait until no tracked request has been in flight for idle_time seconds"""
+        return await wait_until(
+            lambda: not self.in_flight and time.monotonic() - self.last_activity >= idle_time,
+            timeout=timeout
+        )
+
+    def detach(self):
+        for event, handler in (("request", self._on_request),
+                               ("requestfinished", self._on_done),
+                               ("requestfailed", self._on_done)):
+            try:
+                self.page.remove_listener(event, handler)
+            except Exception:
+                pass
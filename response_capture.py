@@ -0,0 +1,222 @@
+"""
+Capture Instagram's own JSON responses while a profile page loads.
+
+The profile page fetches structured data over XHR (web_profile_info, the
+GraphQL timeline query, /api/v1/feed/user/...). Instead of reading counts and
+posts back out of the DOM, ProfileResponseCapture listens to the page's
+network responses and normalises those payloads into the same profile/post
+dictionaries scrape_profile_async produces.
+
+Both payload generations are understood: the older GraphQL shape
+(edge_followed_by, shortcode, display_url, ...) and the v1 API shape
+(follower_count, code, image_versions2, ...). Payloads are walked
+recursively, so changes to the envelope around user and media objects do
+not break extraction.
+"""
+import asyncio
+import re
+from datetime import datetime, timezone
+
+from image_variants import candidates_from_media, pick_image
+
+# URL fragments of responses worth parsing
+CAPTURE_URL_MARKERS = (
+    "/api/v1/users/web_profile_info",
+    "/api/v1/feed/user/",
+    "/graphql/query",
+    "/api/graphql",
+)
+
+MEDIA_TYPE_IMAGE = "image"
+MEDIA_TYPE_VIDEO = "video"
+MEDIA_TYPE_CAROUSEL = "carousel"
+
+_SHORTCODE_RE = re.compile(r"/(?:p|reel|tv)/([^/?#]+)")
+
+
+def shortcode_from_url(url):
+    """Extract the shortcode from a post/reel URL (None if it is not one)"""
+    match = _SHORTCODE_RE.search(url or "")
+    return match.group(1) if match else None
+
+
+def _count(value):
+    """Read a count that may be a plain int or a GraphQL {"count": n} edge"""
+    if isinstance(value, dict):
+        value = value.get("count")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _iso_timestamp(unix_ts):
+    try:
+        return datetime.fromtimestamp(int(unix_ts), tz=timezone.utc).isoformat().replace("+00:00", "Z")
+    except (TypeError, ValueError, OverflowError, OSError):
+        return ""
+
+
+def _caption_text(node):
+    caption = node.get("caption")
+    if isinstance(caption, dict):
+        return caption.get("text") or ""
+    if isinstance(caption, str):
+        return caption
+    edges = (node.get("edge_media_to_caption") or {}).get("edges") or []
+    if edges:
+        return (edges[0].get("node") or {}).get("text") or ""
+    return ""
+
+
+def media_type_of(node):
+    """Classify a media node as image, video or carousel"""
+    typename = node.get("__typename") or ""
+    media_type = node.get("media_type")
+    if node.get("product_type") in ("clips", "igtv") or node.get("is_video") or media_type == 2 \
+            or typename in ("GraphVideo", "XDTGraphVideo"):
+        return MEDIA_TYPE_VIDEO
+    if media_type == 8 or typename in ("GraphSidecar", "XDTGraphSidecar"):
+        children = node.get("carousel_media") or [
+            edge.get("node") or {} for edge in (node.get("edge_sidecar_to_children") or {}).get("edges") or []
+        ]
+        if any(media_type_of(child) == MEDIA_TYPE_VIDEO for child in children):
+            return MEDIA_TYPE_VIDEO
+        return MEDIA_TYPE_CAROUSEL
+    return MEDIA_TYPE_IMAGE
+
+
+def normalize_media(node):
+    """Convert a GraphQL or v1 media node into a scraper post dictionary"""
+    shortcode = node.get("shortcode") or node.get("code")
+    caption = _caption_text(node)
+    likes = _count(node.get("like_count"))
+    if likes is None:
+        likes = _count(node.get("edge_liked_by")) or _count(node.get("edge_media_preview_like")) or 0
+    comments = _count(node.get("comment_count"))
+    if comments is None:
+        comments = _count(node.get("edge_media_to_comment")) or 0
+    is_reel = node.get("product_type") == "clips"
+    # Every size Instagram offers is kept; the download picks one for the target width
+    candidates = candidates_from_media(node)
+    largest = pick_image(candidates, 0) or {"url": "", "width": None, "height": None}
+    post = {
+        "url": f"https://www.instagram.com/{'reel' if is_reel else 'p'}/{shortcode}/",
+        "shortcode": shortcode,
+        "media_id": str(node.get("pk") or node.get("id") or ""),
+        "media_type": media_type_of(node),
+        "thumbnail_url": largest["url"],
+        "image_width": largest["width"],
+        "image_height": largest["height"],
+        "image_candidates": candidates,
+        "timestamp": _iso_timestamp(node.get("taken_at_timestamp") or node.get("taken_at")),
+        "caption": caption,
+        "hashtags": [word for word in caption.split() if word.startswith("#")],
+        "likes": likes,
+        "comments": [],
+        "comments_count": comments,
+        "source": "network"
+    }
+    return post
+
+
+def _is_media_node(node):
+    return bool(node.get("shortcode") or node.get("code")) and (
+        "display_url" in node or "image_versions2" in node or "media_type" in node or "__typename" in node
+    )
+
+
+def _is_user_node(node, username):
+    return (node.get("username") or "").lower() == username.lower() and (
+        "edge_followed_by" in node or "follower_count" in node or "biography" in node
+    )
+
+
+class ProfileResponseCapture:
+    """Collects profile info and timeline media from a page's JSON responses"""
+
+    def __init__(self, page, username, url_markers=CAPTURE_URL_MARKERS):
+        self.page = page
+        self.username = username
+        self.url_markers = url_markers
+        self.user = None
+        self.media = {}  # shortcode -> normalised post, in discovery order
+        self._parse_tasks = set()
+        page.on("response", self._on_response)
+
+    def _on_response(self, response):
+        if not any(marker in response.url for marker in self.url_markers):
+            return
+        task = asyncio.ensure_future(self._parse(response))
+        self._parse_tasks.add(task)
+        task.add_done_callback(self._parse_tasks.discard)
+
+    async def _parse(self, response):
+        try:
+            if response.status != 200:
+                return
+            content_type = (await response.header_value("content-type")) or ""
+            if "json" not in content_type and "javascript" not in content_type:
+                return
+            payload = await response.json()
+        except Exception:
+            return
+        self._walk(payload)
+
+    def _walk(self, value):
+        if isinstance(value, dict):
+            if _is_user_node(value, self.username):
+                self._merge_user(value)
+            elif _is_media_node(value):
+                owner = (value.get("owner") or value.get("user") or {}).get("username")
+                if owner is None or owner.lower() == self.username.lower():
+                    post = normalize_media(value)
+                    if post["shortcode"] and post["shortcode"] not in self.media:
+                        self.media[post["shortcode"]] = post
+                return
+            for child in value.values():
+                self._walk(child)
+        elif isinstance(value, list):
+            for child in value:
+                self._walk(child)
+
+    def _merge_user(self, node):
+        user = self.user or {}
+        for key, value in (
+            ("verified", node.get("is_verified")),
+            ("private", node.get("is_private")),
+            ("real_name", node.get("full_name")),
+            ("bio", node.get("biography")),
+            ("website", node.get("external_url")),
+            ("followers", _count(node.get("edge_followed_by")) if "edge_followed_by" in node else _count(node.get("follower_count"))),
+            ("following", _count(node.get("edge_follow")) if "edge_follow" in node else _count(node.get("following_count"))),
+            ("post_count", _count(node.get("edge_owner_to_timeline_media")) if "edge_owner_to_timeline_media" in node else _count(node.get("media_count"))),
+        ):
+            if value is not None:
+                user[key] = value
+        self.user = user
+        # Timeline media embedded in the profile payload
+        self._walk(node.get("edge_owner_to_timeline_media") or {})
+
+    async def settle(self, timeout=5.0):
+        """Wait for responses that are still being parsed"""
+        if self._parse_tasks:
+            await asyncio.wait(list(self._parse_tasks), timeout=timeout)
+
+    def apply_profile(self, profile_data):
+        """Copy captured profile fields into profile_data; False if nothing was captured"""
+        if not self.user:
+            return False
+        for key, value in self.user.items():
+            profile_data[key] = value if value is not None else profile_data.get(key)
+        return True
+
+    def posts(self, media_types=(MEDIA_TYPE_IMAGE, MEDIA_TYPE_CAROUSEL)):
+        """Captured posts of the given media types, in grid order"""
+        return [post for post in self.media.values() if post["media_type"] in media_types]
+
+    def detach(self):
+        try:
+            self.page.remove_listener("response", self._on_response)
+        except Exception:
+            pass
@@ -0,0 +1,289 @@
+"""
+Batched, resumable upload of a queue directory to the cloud S3 endpoint.
+
+Files are sent to /api/s3/upload-files in batches bounded by
+UPLOAD_BATCH_FILES and UPLOAD_BATCH_BYTES, with up to UPLOAD_CONCURRENCY
+batches in flight. Each multipart body is streamed from disk as it is sent,
+never built in memory, and each request holds at most one file open.
+
+Every acknowledged file is recorded with its SHA-256 in
+.upload_state.json inside the queue directory. This is a local resume record:
+a rerun after a partial failure skips files this directory already uploaded
+with the same content, but the server is not asked what it has, so files it
+lost, or uploads made from another host or directory, are not detected. A
+retried job reuses its first attempt's queue directory and queue_id, and so
+its record. Once all files are up, an upload_manifest.json listing path, size
+and hash of every file is uploaded last.
+"""
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from scrape_events import emit
+
+UPLOAD_BATCH_FILES = int(os.getenv("UPLOAD_BATCH_FILES", "20"))
+UPLOAD_BATCH_BYTES = int(os.getenv("UPLOAD_BATCH_MB", "20")) * 1024 * 1024
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "3"))
+
+UPLOAD_ENDPOINT = "/api/s3/upload-files"
+STATE_FILE = ".upload_state.json"
+MANIFEST_FILE = "upload_manifest.json"
+CHUNK_SIZE = 64 * 1024
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class MultipartStream:
+    """
+    File-like multipart/form-data body that reads file parts from disk on demand
+
+    The total length is known up front, so requests sends a Content-Length
+    header; seek(0) lets a retry send the body again.
+    """
+
+    def __init__(self, fields, files):
+        """
+        Args:
+            fields: Dict of form fields
+            files: List of (field name, filename, path) tuples
+        """
+        self.boundary = uuid.uuid4().hex
+        self.content_type = f"multipart/form-data; boundary={self.boundary}"
+        self._parts = []  # bytes or file paths, in order
+        for name, value in fields.items():
+            self._parts.append(
+                f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode("utf-8")
+            )
+        for name, filename, path in files:
+            self._parts.append(
+                (f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                 f'Content-Type: application/octet-stream\r\n\r\n').encode("utf-8")
+            )
+            self._parts.append(path)
+            self._parts.append(b"\r\n")
+        self._parts.append(f"--{self.boundary}--\r\n".encode("utf-8"))
+        self._length = sum(len(part) if isinstance(part, bytes) else os.path.getsize(part) for part in self._parts)
+        self.seek(0)
+
+    def __len__(self):
+        return self._length
+
+    def seek(self, offset, whence=0):
+        if offset != 0 or whence != 0:
+            raise ValueError("MultipartStream can only be rewound to the start")
+        self.close()
+        self._index = 0
+        self._buffer = b""
+        self._handle = None
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._length
+        out = []
+        remaining = size
+        while remaining > 0 and self._index < len(self._parts):
+            part = self._parts[self._index]
+            if isinstance(part, bytes):
+                if not self._buffer:
+                    self._buffer = part
+                chunk, self._buffer = self._buffer[:remaining], self._buffer[remaining:]
+                if not self._buffer:
+                    self._index += 1
+            else:
+                if self._handle is None:
+                    self._handle = open(part, "rb")
+                chunk = self._handle.read(min(remaining, CHUNK_SIZE))
+                if not chunk:
+                    self._handle.close()
+                    self._handle = None
+                    self._index += 1
+                    continue
+            out.append(chunk)
+            remaining -= len(chunk)
+        return b"".join(out)
+
+    def close(self):
+        handle = getattr(self, "_handle", None)
+        if handle is not None:
+            handle.close()
+            self._handle = None
+
+
+class QueueUploader:
+    def __init__(self, api, queue_id, bucket_name, local_directory, batch_files=None, batch_bytes=None,
+                 concurrency=None, read_timeout=None):
+        """
+        Args:
+            api: ApiClient for the cloud service
+            queue_id: Queue the files belong to
+            bucket_name: Target S3 bucket
+            local_directory: Queue directory to upload
+            batch_files: Files per request (env UPLOAD_BATCH_FILES, default 20)
+            batch_bytes: Bytes per request (env UPLOAD_BATCH_MB, default 20 MB)
+            concurrency: Requests in flight (env UPLOAD_CONCURRENCY, default 3)
+            read_timeout: Read timeout per request
+        """
+        self.api = api
+        self.queue_id = queue_id
+        self.bucket_name = bucket_name
+        self.local_directory = local_directory
+        self.batch_files = batch_files or UPLOAD_BATCH_FILES
+        self.batch_bytes = batch_bytes or UPLOAD_BATCH_BYTES
+        self.concurrency = concurrency or UPLOAD_CONCURRENCY
+        self.read_timeout = read_timeout
+        self.state_path = os.path.join(local_directory, STATE_FILE)
+        self._state_lock = threading.Lock()
+        self._state = self._load_state()
+
+    # ----- resume state -----
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            if state.get("queue_id") == self.queue_id and state.get("bucket_name") == self.bucket_name:
+                return state
+        except (OSError, ValueError):
+            pass
+        return {"queue_id": self.queue_id, "bucket_name": self.bucket_name, "uploaded": {}}
+
+    def _mark_uploaded(self, entries):
+        with self._state_lock:
+            for entry in entries:
+                self._state["uploaded"][entry["path"]] = entry["sha256"]
+            tmp_path = f"{self.state_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._state, f, indent=2)
+            os.replace(tmp_path, self.state_path)
+
+    # ----- batching -----
+
+    def collect_files(self):
+        """Manifest entries (path, full_path, size, sha256) for every file in the queue directory"""
+        entries = []
+        for root, dirs, files in os.walk(self.local_directory):
+            for file in sorted(files):
+                full_path = os.path.join(root, file)
+                # Preserve directory structure in filename
+                relative_path = os.path.relpath(full_path, self.local_directory).replace(os.sep, "/")
+                if relative_path in (STATE_FILE, f"{STATE_FILE}.tmp", MANIFEST_FILE):
+                    continue
+                entries.append({
+                    "path": relative_path,
+                    "full_path": full_path,
+                    "size": os.path.getsize(full_path),
+                    "sha256": file_sha256(full_path)
+                })
+        return entries
+
+    def _batches(self, entries):
+        batch, batch_size = [], 0
+        for entry in entries:
+            if batch and (len(batch) >= self.batch_files or batch_size + entry["size"] > self.batch_bytes):
+                yield batch
+                batch, batch_size = [], 0
+            batch.append(entry)
+            batch_size += entry["size"]
+        if batch:
+            yield batch
+
+    def _send(self, entries):
+        body = MultipartStream(
+            {"queue_id": self.queue_id, "bucket_name": self.bucket_name},
+            [("files", entry["path"], entry["full_path"]) for entry in entries]
+        )
+        try:
+            response = self.api.post(
+                UPLOAD_ENDPOINT,
+                data=body,
+                headers={"Content-Type": body.content_type},
+                read_timeout=self.read_timeout,
+                idempotent=True  # Re-uploading a batch overwrites the same S3 keys
+            )
+        finally:
+            body.close()
+        if response.status_code != 200:
+            raise Exception(f"Upload failed: {response.status_code}: {response.text}")
+        return response.json()
+
+    # ----- upload -----
+
+    def _send_unless_stopped(self, entries, stop_event):
+        if stop_event is not None and stop_event.is_set():
+            raise Exception("Upload cancelled")
+        return self._send(entries)
+
+    def upload(self, stop_event=None):
+        """
+        Upload every new or changed file, then the manifest.
+
+        Args:
+            stop_event: Optional threading.Event; once set, batches not yet sent are
+                dropped and the manifest is not uploaded
+
+        Returns:
+            The manifest upload's response, extended with upload counts
+
+        Raises:
+            Exception: Some batches failed; acknowledged files are kept in the resume state
+        """
+        entries = self.collect_files()
+        uploaded = self._state["uploaded"]
+        pending = [entry for entry in entries if uploaded.get(entry["path"]) != entry["sha256"]]
+        skipped = len(entries) - len(pending)
+        if skipped:
+            print(f"⏭️  Skipping {skipped} files already uploaded from this directory for queue {self.queue_id}")
+
+        batches = list(self._batches(pending))
+        errors = []
+        files_sent, bytes_sent = 0, 0
+        bytes_total = sum(entry["size"] for entry in pending)
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="s3-upload") as executor:
+            # Each batch runs in a copy of the caller's context, so its API call metrics reach the task's collector
+            futures = {
+                executor.submit(contextvars.copy_context().run, self._send_unless_stopped, batch, stop_event): batch
+                for batch in batches
+            }
+            for future in as_completed(futures):
+                batch = futures[future]
+                try:
+                    future.result()
+                    self._mark_uploaded(batch)
+                    batch_bytes = sum(e['size'] for e in batch)
+                    files_sent += len(batch)
+                    bytes_sent += batch_bytes
+                    print(f"📤 Uploaded batch of {len(batch)} files ({batch_bytes / 1024:.0f} KB)")
+                    emit("upload_progress", queue_id=self.queue_id, files_sent=files_sent, files_total=len(pending),
+                         bytes_sent=bytes_sent, bytes_total=bytes_total)
+                except Exception as e:
+                    errors.append(str(e))
+        if errors:
+            raise Exception(f"{len(errors)} of {len(batches)} upload batches failed "
+                            f"(rerun to resume): {errors[0]}")
+
+        # The manifest goes last, so its presence in S3 marks a complete upload
+        manifest = {
+            "queue_id": self.queue_id,
+            "files": [{key: entry[key] for key in ("path", "size", "sha256")} for entry in entries]
+        }
+        manifest_path = os.path.join(self.local_directory, MANIFEST_FILE)
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        result = self._send([{"path": MANIFEST_FILE, "full_path": manifest_path}])
+        result = result if isinstance(result, dict) else {"response": result}
+        result.update({
+            "uploaded_files": len(pending),
+            "skipped_files": skipped,
+            "batches": len(batches) + 1
+        })
+        return result
@@ -0,0 +1,49 @@
+"""
+Structured progress events for scrapes and workflow runs.
+
+Code doing the work calls emit("post_extracted", index=3, ...). The event is
+handed to the observer installed with observe() for the current task, if any;
+without an observer emit() does nothing, so the scraper works the same when
+run from the command line.
+
+Events are dictionaries {"type", "time", ...data}. Observers are callables
+taking an event and may be called from any thread.
+
+The observer lives in a context variable, so it follows asyncio tasks and
+asyncio.to_thread() calls started under it. Work handed to another event loop
+(the browser pool) carries it across with current_observer() and observe().
+"""
+import contextvars
+import time
+from contextlib import contextmanager
+
+_observer = contextvars.ContextVar("scrape_event_observer", default=None)
+
+
+def current_observer():
+    """The observer installed for the current task, or None"""
+    return _observer.get()
+
+
+@contextmanager
+def observe(observer):
+    """Send events emitted inside the block (and tasks started in it) to observer"""
+    token = _observer.set(observer)
+    try:
+        yield observer
+    finally:
+        _observer.reset(token)
+
+
+def emit(event_type, **data):
+    """Report an event to the current observer"""
+    observer = _observer.get()
+    if observer is None:
+        return
+    event = {"type": event_type, "time": time.time()}
+    event.update(data)
+    try:
+        observer(event)
+    except Exception as e:
+        # Progress reporting must never break a scrape
+        print(f"⚠️  Event observer failed on {event_type}: {str(e)}")
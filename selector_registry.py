@@ -0,0 +1,266 @@
+"""
+Adaptive ordering of fallback selectors, learned from earlier scrapes.
+
+Extractions walk a list of candidate selectors per field ("post.caption",
+"profile.bio", ...) until one matches, and every miss costs a locator round
+trip or a wait timeout. The registry records hits and misses per field and
+selector, and order() returns the candidates best-first:
+
+- selectors with a proven hit rate (SELECTOR_MIN_SAMPLES tries or more) are
+  ranked by it, untried ones keep their place in the default order
+- a selector that missed SELECTOR_DEAD_AFTER times in a row is dead: it is
+  left out, except as a last resort on every SELECTOR_PROBE_EVERY-th lookup
+  so it comes back if Instagram's markup changes back
+- a fixed tail of generic last-resort selectors is never promoted, since a
+  broad selector "hits" wherever it is tried but may match the wrong element
+
+Stats live in memory for the current process and are flushed to SQLite
+(output/selector_stats.db) after each profile scrape; the flush also picks up
+what other worker processes recorded. Counts are halved once a selector has
+SELECTOR_STATS_WINDOW tries, so recent behaviour outweighs old.
+"""
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+SELECTOR_STATS_PATH = os.getenv("SELECTOR_STATS_PATH", "output/selector_stats.db")
+SELECTOR_MIN_SAMPLES = int(os.getenv("SELECTOR_MIN_SAMPLES", "5"))
+SELECTOR_DEAD_AFTER = int(os.getenv("SELECTOR_DEAD_AFTER", "10"))
+SELECTOR_PROBE_EVERY = int(os.getenv("SELECTOR_PROBE_EVERY", "20"))
+SELECTOR_STATS_WINDOW = int(os.getenv("SELECTOR_STATS_WINDOW", "500"))
+
+# Hit rate assumed for selectors without enough tries to judge
+UNPROVEN_HIT_RATE = 0.5
+
+
+def _hit_rate(stats):
+    # Laplace smoothing keeps a couple of lucky tries from dominating
+    return (stats["hits"] + 1) / (stats["attempts"] + 2)
+
+
+class SelectorRegistry:
+    def __init__(self, path=SELECTOR_STATS_PATH):
+        """
+        Args:
+            path: SQLite database file (env SELECTOR_STATS_PATH, default output/selector_stats.db)
+        """
+        self.path = path
+        self._stats = {}  # (field, selector) -> {"hits", "attempts", "streak", "last_hit_at"}
+        self._pending = {}  # (field, selector) -> unflushed {"hits", "misses", "streak", "hit", "last_hit_at"}
+        self._lookups = {}  # field -> order() calls, for probing dead selectors
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS selector_stats ("
+                " field TEXT NOT NULL,"
+                " selector TEXT NOT NULL,"
+                " hits REAL NOT NULL DEFAULT 0,"
+                " attempts REAL NOT NULL DEFAULT 0,"
+                " streak INTEGER NOT NULL DEFAULT 0,"  # misses since the last hit
+                " last_hit_at REAL,"
+                " updated_at REAL NOT NULL,"
+                " PRIMARY KEY (field, selector))"
+            )
+        self._load()
+
+    @contextmanager
+    def _connect(self):
+        # One short-lived connection per call keeps the registry safe to use from any thread
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _load(self):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT field, selector, hits, attempts, streak, last_hit_at FROM selector_stats"
+            ).fetchall()
+        stats = {
+            (field, selector): {"hits": hits, "attempts": attempts, "streak": streak, "last_hit_at": last_hit_at}
+            for field, selector, hits, attempts, streak, last_hit_at in rows
+        }
+        with self._lock:
+            # Keep this process's unflushed tries on top of what the database knows
+            for key, delta in self._pending.items():
+                entry = stats.setdefault(key, {"hits": 0, "attempts": 0, "streak": 0, "last_hit_at": None})
+                entry["hits"] += delta["hits"]
+                entry["attempts"] += delta["hits"] + delta["misses"]
+                entry["streak"] = delta["streak"] if delta["hit"] else entry["streak"] + delta["misses"]
+                entry["last_hit_at"] = delta["last_hit_at"] or entry["last_hit_at"]
+            self._stats = stats
+
+    # ----- lookups -----
+
+    def is_dead(self, field, selector):
+        stats = self._stats.get((field, selector))
+        return bool(stats) and stats["streak"] >= SELECTOR_DEAD_AFTER
+
+    def order(self, field, candidates, fixed_tail=0):
+        """
+        Candidates of a field in the order they should be tried
+
+        Args:
+            field: Field name, e.g. "post.caption"
+            candidates: Selectors in their default order
+            fixed_tail: Number of generic selectors at the end that keep their place
+
+        Returns:
+            List of selectors; dead ones are only included (last) when probing
+        """
+        candidates = list(candidates)
+        split = len(candidates) - max(0, min(fixed_tail, len(candidates)))
+        with self._lock:
+            self._lookups[field] = self._lookups.get(field, 0) + 1
+            probe = self._lookups[field] % SELECTOR_PROBE_EVERY == 0
+
+            def rank(item):
+                index, selector = item
+                stats = self._stats.get((field, selector))
+                proven = stats is not None and stats["attempts"] >= SELECTOR_MIN_SAMPLES
+                return (-(_hit_rate(stats) if proven else UNPROVEN_HIT_RATE), index)
+
+            live = [(i, s) for i, s in enumerate(candidates) if not self.is_dead(field, s)]
+            dead = [s for s in candidates if self.is_dead(field, s)]
+            ordered = [s for _, s in sorted((item for item in live if item[0] < split), key=rank)]
+            ordered += [s for i, s in live if i >= split]
+        if not ordered or probe:
+            # Never leave a field without selectors, and give dead ones the occasional retry
+            ordered += dead
+        return ordered
+
+    # ----- recording -----
+
+    def _record(self, field, selector, hit):
+        key = (field, selector)
+        now = time.time()
+        with self._lock:
+            stats = self._stats.setdefault(key, {"hits": 0, "attempts": 0, "streak": 0, "last_hit_at": None})
+            delta = self._pending.setdefault(key, {"hits": 0, "misses": 0, "streak": 0, "hit": False,
+                                                   "last_hit_at": None})
+            stats["attempts"] += 1
+            if hit:
+                stats["hits"] += 1
+                stats["streak"] = 0
+                stats["last_hit_at"] = now
+                delta["hits"] += 1
+                delta["streak"] = 0
+                delta["hit"] = True
+                delta["last_hit_at"] = now
+            else:
+                stats["streak"] += 1
+                delta["misses"] += 1
+                delta["streak"] += 1
+
+    def hit(self, field, selector):
+        """Record that selector matched for field"""
+        self._record(field, selector, True)
+
+    def miss(self, field, selector):
+        """Record that selector found nothing (or timed out) for field"""
+        self._record(field, selector, False)
+
+    def flush(self):
+        """Write this process's tries to the database and reload the combined stats"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        now = time.time()
+        try:
+            with self._connect() as conn:
+                for (field, selector), delta in pending.items():
+                    conn.execute(
+                        "INSERT INTO selector_stats (field, selector, hits, attempts, streak, last_hit_at, updated_at)"
+                        " VALUES (?, ?, ?, ?, ?, ?, ?)"
+                        " ON CONFLICT (field, selector) DO UPDATE SET"
+                        "  hits = hits + excluded.hits,"
+                        "  attempts = attempts + excluded.attempts,"
+                        "  streak = CASE WHEN ? THEN excluded.streak ELSE streak + excluded.streak END,"
+                        "  last_hit_at = COALESCE(excluded.last_hit_at, last_hit_at),"
+                        "  updated_at = excluded.updated_at",
+                        (field, selector, delta["hits"], delta["hits"] + delta["misses"], delta["streak"],
+                         delta["last_hit_at"], now, delta["hit"])
+                    )
+                conn.execute(
+                    "UPDATE selector_stats SET hits = hits / 2.0, attempts = attempts / 2.0 WHERE attempts >= ?",
+                    (SELECTOR_STATS_WINDOW,)
+                )
+        except Exception:
+            # Keep the tries for the next flush, ahead of any recorded meanwhile
+            with self._lock:
+                for key, newer in self._pending.items():
+                    older = pending.setdefault(key, {"hits": 0, "misses": 0, "streak": 0, "hit": False,
+                                                     "last_hit_at": None})
+                    older["streak"] = newer["streak"] if newer["hit"] else older["streak"] + newer["misses"]
+                    older["hits"] += newer["hits"]
+                    older["misses"] += newer["misses"]
+                    older["hit"] = older["hit"] or newer["hit"]
+                    older["last_hit_at"] = newer["last_hit_at"] or older["last_hit_at"]
+                self._pending = pending
+            raise
+        self._load()
+
+    # ----- inspection -----
+
+    def stats(self, field=None):
+        """
+        Stored stats per field, best selectors first
+
+        Args:
+            field: Only this field (default all)
+
+        Returns:
+            {field: [{"selector", "hits", "attempts", "hit_rate", "miss_streak", "dead", "last_hit_at", "updated_at"}]}
+        """
+        query = "SELECT field, selector, hits, attempts, streak, last_hit_at, updated_at FROM selector_stats"
+        params = ()
+        if field:
+            query += " WHERE field = ?"
+            params = (field,)
+        with self._connect() as conn:
+            rows = conn.execute(query, params).fetchall()
+        fields = {}
+        for name, selector, hits, attempts, streak, last_hit_at, updated_at in rows:
+            fields.setdefault(name, []).append({
+                "selector": selector,
+                "hits": round(hits, 1),
+                "attempts": round(attempts, 1),
+                "hit_rate": round(hits / attempts, 3) if attempts else None,
+                "miss_streak": streak,
+                "dead": streak >= SELECTOR_DEAD_AFTER,
+                "last_hit_at": last_hit_at,
+                "updated_at": updated_at
+            })
+        for entries in fields.values():
+            entries.sort(key=lambda entry: (entry["dead"], -(entry["hit_rate"] or 0)))
+        return fields
+
+    def reset(self, field=None):
+        """Forget the stats of one field (default all); returns how many selectors were reset"""
+        with self._connect() as conn:
+            if field:
+                cursor = conn.execute("DELETE FROM selector_stats WHERE field = ?", (field,))
+            else:
+                cursor = conn.execute("DELETE FROM selector_stats")
+        with self._lock:
+            self._pending = {key: delta for key, delta in self._pending.items() if field and key[0] != field}
+            self._stats = {key: stats for key, stats in self._stats.items() if field and key[0] != field}
+        return cursor.rowcount
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_selector_registry():
+    """Return the process-wide selector registry, creating it on first use"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = SelectorRegistry()
+        return _registry
@@ -0,0 +1,73 @@
+from image_variants import parse_srcset, candidates_from_media, pick_image, apply_image_choice
+
+
+def candidate(url, width, height=None):
+    return {"url": url, "width": width, "height": height}
+
+
+def test_parse_srcset_width_descriptors_with_derived_heights():
+    srcset = "https://cdn/a_640.jpg 640w, https://cdn/a_1080.jpg 1080w,https://cdn/a_320.jpg 320w"
+    assert parse_srcset(srcset, natural_width=1080, natural_height=1350) == [
+        candidate("https://cdn/a_640.jpg", 640, 800),
+        candidate("https://cdn/a_1080.jpg", 1080, 1350),
+        candidate("https://cdn/a_320.jpg", 320, 400),
+    ]
+
+
+def test_parse_srcset_density_descriptors_need_the_natural_width():
+    assert parse_srcset("https://cdn/a.jpg 1x, https://cdn/b.jpg 2x", natural_width=540) == [
+        candidate("https://cdn/a.jpg", 540),
+        candidate("https://cdn/b.jpg", 1080),
+    ]
+    assert parse_srcset("https://cdn/a.jpg 2x") == [candidate("https://cdn/a.jpg", None)]
+
+
+def test_parse_srcset_ignores_empty_and_malformed_input():
+    assert parse_srcset(None) == []
+    assert parse_srcset("") == []
+    assert parse_srcset("https://cdn/a.jpg") == []
+
+
+def test_candidates_from_graphql_and_v1_media():
+    graphql = {
+        "display_resources": [{"src": "s640", "config_width": 640, "config_height": 640}],
+        "display_url": "full",
+        "dimensions": {"width": 1080, "height": 1080},
+    }
+    assert candidates_from_media(graphql) == [candidate("s640", 640, 640), candidate("full", 1080, 1080)]
+
+    v1 = {"image_versions2": {"candidates": [{"url": "v1080", "width": 1080, "height": 1350}]}}
+    assert candidates_from_media(v1) == [candidate("v1080", 1080, 1350)]
+
+
+def test_candidates_from_carousel_use_the_first_slide():
+    node = {"carousel_media": [{"image_versions2": {"candidates": [{"url": "first", "width": 640}]}},
+                               {"image_versions2": {"candidates": [{"url": "second", "width": 640}]}}]}
+    assert candidates_from_media(node) == [candidate("first", 640)]
+
+
+def test_pick_image_smallest_wide_enough_else_largest():
+    candidates = [candidate("c1080", 1080), candidate("c320", 320), candidate("c640", 640)]
+    assert pick_image(candidates, 400)["url"] == "c640"
+    assert pick_image(candidates, 640)["url"] == "c640"
+    assert pick_image(candidates, 2000)["url"] == "c1080"
+    assert pick_image(candidates, 0)["url"] == "c1080"
+
+
+def test_pick_image_without_widths_or_candidates():
+    assert pick_image([candidate("a", None), candidate("b", None)], 320)["url"] == "a"
+    assert pick_image([], 320) is None
+
+
+def test_apply_image_choice_records_the_chosen_size():
+    post = {"thumbnail_url": "old", "image_candidates": [candidate("c320", 320, 400), candidate("c1080", 1080, 1350)]}
+    chosen = apply_image_choice(post, 300)
+
+    assert chosen["url"] == "c320"
+    assert post == {"thumbnail_url": "c320", "image_width": 320, "image_height": 400}
+
+
+def test_apply_image_choice_leaves_posts_without_candidates_alone():
+    post = {"thumbnail_url": "old", "image_width": 640}
+    assert apply_image_choice(post, 320) is None
+    assert post == {"thumbnail_url": "old", "image_width": 640}
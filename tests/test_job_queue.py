@@ -0,0 +1,108 @@
+import os
+
+import pytest
+
+from job_queue import SQLiteJobQueue, coalesce_key, STATUS_COMPLETED, STATUS_FAILED, STATUS_PENDING, STATUS_RUNNING
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SQLiteJobQueue(path=os.path.join(tmp_path, "jobs.db"), max_attempts=2)
+
+
+def test_claim_takes_highest_priority_then_oldest(queue):
+    queue.enqueue("low", "alice")
+    queue.enqueue("high", "bob", priority=5)
+    queue.enqueue("low-2", "carol")
+
+    assert queue.claim("w1")["task_id"] == "high"
+    assert queue.claim("w1")["task_id"] == "low"
+    assert queue.claim("w1")["task_id"] == "low-2"
+    assert queue.claim("w1") is None
+
+
+def test_claim_leases_the_job(queue):
+    queue.enqueue("t1", "alice")
+    job = queue.claim("w1", lease_seconds=60)
+
+    assert job["status"] == STATUS_RUNNING
+    assert job["worker_id"] == "w1"
+    assert job["attempts"] == 1
+    assert queue.heartbeat("t1", "w1")
+    assert not queue.heartbeat("t1", "w2")
+
+
+def test_expired_lease_is_lost_and_the_job_requeued(queue):
+    queue.enqueue("t1", "alice")
+    queue.claim("w1", lease_seconds=-1)
+
+    assert queue.requeue_expired() == 1
+    assert queue.get("t1")["status"] == STATUS_PENDING
+    # The old worker can neither renew nor finish the job any more
+    assert not queue.heartbeat("t1", "w1")
+    assert not queue.complete("t1", "w1", {"ok": True})
+
+    job = queue.claim("w2")
+    assert job["attempts"] == 2
+    assert queue.complete("t1", "w2", {"ok": True}, queue_id="q1")
+    assert queue.get("t1")["status"] == STATUS_COMPLETED
+
+
+def test_job_out_of_attempts_is_failed_instead_of_requeued(queue):
+    queue.enqueue("t1", "alice")
+    for worker_id in ("w1", "w2"):
+        queue.claim(worker_id)
+        queue.requeue_worker(worker_id)
+
+    assert queue.get("t1")["status"] == STATUS_FAILED
+    assert queue.claim("w3") is None
+
+
+def test_coalesce_key_uses_defaults_for_missing_fields():
+    assert coalesce_key(None) == coalesce_key({}) == coalesce_key({"force_refresh": False, "max_competitors": None})
+    assert coalesce_key({"force_refresh": True}) != coalesce_key({})
+    assert coalesce_key({"max_competitors": 3}) != coalesce_key({"max_competitors": 5})
+    # Fields that don't change what is scraped don't matter
+    assert coalesce_key({"note": "x"}) == coalesce_key({})
+
+
+def test_coalesce_attaches_only_to_the_same_scrape(queue):
+    leader = queue.enqueue("a", "Alice", payload={"force_refresh": False}, coalesce=True)
+    same = queue.enqueue("b", "alice", payload={}, coalesce=True)
+    forced = queue.enqueue("c", "alice", payload={"force_refresh": True}, coalesce=True)
+    fewer = queue.enqueue("d", "alice", payload={"max_competitors": 1}, coalesce=True)
+    uncoalesced = queue.enqueue("e", "alice", payload={})
+
+    assert leader["leader_task_id"] is None
+    assert same["leader_task_id"] == "a"
+    assert forced["leader_task_id"] is None
+    assert fewer["leader_task_id"] is None
+    assert uncoalesced["leader_task_id"] is None
+
+
+def test_follower_reports_its_leader(queue):
+    queue.enqueue("a", "alice", coalesce=True)
+    queue.enqueue("b", "alice", coalesce=True, priority=3)
+    job = queue.claim("w1")
+    assert job["task_id"] == "a"
+    assert job["priority"] == 3  # Promoted by the follower
+
+    assert queue.get("b")["status"] == STATUS_RUNNING
+    assert [j["task_id"] for j in queue.list(STATUS_RUNNING)] == ["a", "b"]
+    assert queue.list(STATUS_PENDING) == []
+
+    queue.complete("a", "w1", {"ok": True}, queue_id="q1")
+    follower = queue.get("b")
+    assert follower["status"] == STATUS_COMPLETED
+    assert follower["queue_id"] == "q1"
+
+
+def test_list_filters_by_status_and_limits(queue):
+    for task_id in ("t1", "t2", "t3"):
+        queue.enqueue(task_id, task_id)
+    queue.claim("w1")
+
+    assert [j["task_id"] for j in queue.list()] == ["t1", "t2", "t3"]
+    assert [j["task_id"] for j in queue.list(STATUS_PENDING)] == ["t2", "t3"]
+    assert [j["task_id"] for j in queue.list(STATUS_PENDING, limit=1)] == ["t2"]
+    assert [j["task_id"] for j in queue.list(STATUS_RUNNING)] == ["t1"]
@@ -0,0 +1,138 @@
+import asyncio
+
+import pytest
+
+from pipeline import Pipeline
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_job_passes_through_every_stage_in_order():
+    async def main():
+        async def first(state):
+            state["seen"].append("first")
+            return True
+
+        async def second(state):
+            state["seen"].append("second")
+            return True
+
+        pipeline = Pipeline([("first", first, 1), ("second", second, 1)])
+        try:
+            state, timings = await pipeline.run({"seen": []})
+        finally:
+            await pipeline.close()
+        return state, timings
+
+    state, timings = run(main())
+    assert state["seen"] == ["first", "second"]
+    assert set(timings) == {"first", "second"}
+
+
+def test_falsy_handler_result_ends_the_job_early():
+    async def main():
+        ran = []
+
+        async def stop(state):
+            return False
+
+        async def never(state):
+            ran.append(True)
+            return True
+
+        pipeline = Pipeline([("stop", stop, 1), ("never", never, 1)])
+        try:
+            result, _ = await pipeline.run({})
+        finally:
+            await pipeline.close()
+        return result, ran
+
+    assert run(main()) == (None, [])
+
+
+def test_handler_exception_reaches_the_caller():
+    async def main():
+        async def broken(state):
+            raise ValueError("stage failed")
+
+        pipeline = Pipeline([("broken", broken, 1)])
+        try:
+            await pipeline.run({})
+        finally:
+            await pipeline.close()
+
+    with pytest.raises(ValueError, match="stage failed"):
+        run(main())
+
+
+def test_cancelling_the_caller_cancels_the_running_stage_and_skips_the_rest():
+    async def main():
+        log = []
+        started = asyncio.Event()
+
+        async def slow(state):
+            log.append(("slow", state["job"], "started"))
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                log.append(("slow", state["job"], "cancelled"))
+                raise
+            return True
+
+        async def quick(state):
+            log.append(("quick", state["job"], "ran"))
+            return True
+
+        async def next_stage(state):
+            log.append(("next", state["job"], "ran"))
+            return True
+
+        pipeline = Pipeline([("slow", slow, 1), ("next", next_stage, 1)])
+        try:
+            caller = asyncio.create_task(pipeline.run({"job": 1}))
+            await started.wait()
+            caller.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await caller
+            await asyncio.sleep(0.05)
+
+            # The stage worker survives and runs the next job
+            pipeline.stages[0].handler = quick
+            state, _ = await asyncio.wait_for(pipeline.run({"job": 2}), timeout=5)
+        finally:
+            await pipeline.close()
+        return log, state
+
+    log, state = run(main())
+    assert log == [("slow", 1, "started"), ("slow", 1, "cancelled"), ("quick", 2, "ran"), ("next", 2, "ran")]
+    assert state["job"] == 2
+
+
+def test_cancelled_job_waiting_in_a_queue_is_dropped():
+    async def main():
+        ran = []
+        release = asyncio.Event()
+
+        async def blocking(state):
+            ran.append(state["job"])
+            await release.wait()
+            return True
+
+        pipeline = Pipeline([("blocking", blocking, 1)])
+        try:
+            first = asyncio.create_task(pipeline.run({"job": 1}))
+            queued = asyncio.create_task(pipeline.run({"job": 2}))
+            await asyncio.sleep(0.05)
+            queued.cancel()
+            await asyncio.gather(queued, return_exceptions=True)
+            release.set()
+            await first
+            await asyncio.sleep(0.05)
+        finally:
+            await pipeline.close()
+        return ran
+
+    assert run(main()) == [1]
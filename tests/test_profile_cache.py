@@ -0,0 +1,58 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+from profile_cache import ProfileCache, relink_images
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ProfileCache(path=os.path.join(tmp_path, "profiles.db"), ttl=60)
+
+
+def age_entry(cache, username, seconds):
+    with sqlite3.connect(cache.path) as conn:
+        conn.execute("UPDATE profiles SET scraped_at = ? WHERE username = ?", (time.time() - seconds, username))
+
+
+def test_fresh_entry_is_served_case_insensitively(cache):
+    cache.put("Alice", {"username": "Alice"})
+    profile, age = cache.get("alice")
+    assert profile == {"username": "Alice"}
+    assert 0 <= age < 5
+
+
+def test_entry_older_than_the_ttl_is_a_miss(cache):
+    cache.put("alice", {"username": "alice"})
+    age_entry(cache, "alice", 120)
+
+    assert cache.get("alice") == (None, None)
+    assert cache.get("alice", max_age=float("inf"))[0] == {"username": "alice"}
+    assert cache.purge_expired() == 1
+    assert cache.get("alice", max_age=float("inf")) == (None, None)
+
+
+def test_update_replaces_the_profile_but_keeps_its_age(cache):
+    cache.put("alice", {"posts": 1})
+    age_entry(cache, "alice", 30)
+    cache.update("alice", {"posts": 2})
+
+    profile, age = cache.get("alice")
+    assert profile == {"posts": 2}
+    assert age >= 30
+
+
+def test_relink_images_links_existing_files_and_drops_missing_ones(tmp_path):
+    old_dir, new_dir = tmp_path / "old", tmp_path / "new"
+    old_dir.mkdir()
+    (old_dir / "a.jpg").write_bytes(b"a")
+    profile = {"posts": [{"local_image_path": str(old_dir / "a.jpg")},
+                         {"local_image_path": str(old_dir / "gone.jpg")},
+                         {"shortcode": "no-image"}]}
+
+    assert relink_images(profile, str(new_dir)) == 1
+    assert profile["posts"][0]["local_image_path"] == str(new_dir / "a.jpg")
+    assert (new_dir / "a.jpg").read_bytes() == b"a"
+    assert "local_image_path" not in profile["posts"][1]
@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+
+import pytest
+
+from s3_uploader import QueueUploader, MultipartStream, STATE_FILE, MANIFEST_FILE
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, body=None):
+        self.status_code = status_code
+        self._body = body if body is not None else {"ok": True}
+        self.text = json.dumps(self._body)
+
+    def json(self):
+        return self._body
+
+
+class FakeApi:
+    """Records the filenames of every upload request; fails requests containing a filename in fail_on"""
+
+    def __init__(self, fail_on=()):
+        self.fail_on = set(fail_on)
+        self.uploads = []
+        self._lock = threading.Lock()
+
+    def post(self, path, data=None, headers=None, read_timeout=None, idempotent=False):
+        body = data.read().decode("utf-8", "replace")
+        names = [part.split('"', 1)[0] for part in body.split('filename="')[1:]]
+        with self._lock:
+            self.uploads.append(names)
+        if self.fail_on & set(names):
+            return FakeResponse(500, {"error": "boom"})
+        return FakeResponse()
+
+
+@pytest.fixture
+def queue_dir(tmp_path):
+    for name, content in (("product/a.json", "a"), ("product/images/b.jpg", "bb"), ("analysis/c.json", "ccc")):
+        path = tmp_path / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content)
+    return str(tmp_path)
+
+
+def uploaded_files(api):
+    return sorted(name for names in api.uploads for name in names if name != MANIFEST_FILE)
+
+
+def test_multipart_stream_length_matches_body_and_rewinds(queue_dir):
+    stream = MultipartStream({"queue_id": "q1"}, [("files", "a.json", os.path.join(queue_dir, "product/a.json"))])
+    first = stream.read(7) + stream.read()
+    assert len(first) == len(stream)
+    stream.seek(0)
+    assert stream.read() == first
+    stream.close()
+
+
+def test_upload_sends_every_file_then_the_manifest(queue_dir):
+    api = FakeApi()
+    result = QueueUploader(api, "q1", "bucket", queue_dir, batch_files=2, concurrency=1).upload()
+
+    assert uploaded_files(api) == ["analysis/c.json", "product/a.json", "product/images/b.jpg"]
+    assert api.uploads[-1] == [MANIFEST_FILE]
+    assert result["uploaded_files"] == 3
+    assert result["skipped_files"] == 0
+    assert result["batches"] == 3
+
+
+def test_rerun_resumes_after_a_failed_batch(queue_dir):
+    failing = FakeApi(fail_on={"product/images/b.jpg"})
+    with pytest.raises(Exception, match="1 of 3 upload batches failed"):
+        QueueUploader(failing, "q1", "bucket", queue_dir, batch_files=1, concurrency=1).upload()
+    assert MANIFEST_FILE not in [name for names in failing.uploads for name in names]
+
+    api = FakeApi()
+    result = QueueUploader(api, "q1", "bucket", queue_dir, batch_files=1, concurrency=1).upload()
+    assert uploaded_files(api) == ["product/images/b.jpg"]
+    assert result["skipped_files"] == 2
+
+
+def test_changed_file_is_uploaded_again(queue_dir):
+    QueueUploader(FakeApi(), "q1", "bucket", queue_dir).upload()
+    with open(os.path.join(queue_dir, "product/a.json"), "w") as f:
+        f.write("changed")
+
+    api = FakeApi()
+    QueueUploader(api, "q1", "bucket", queue_dir).upload()
+    assert uploaded_files(api) == ["product/a.json"]
+
+
+def test_resume_state_is_per_queue_and_bucket(queue_dir):
+    QueueUploader(FakeApi(), "q1", "bucket", queue_dir).upload()
+    assert os.path.exists(os.path.join(queue_dir, STATE_FILE))
+
+    for queue_id, bucket in (("q2", "bucket"), ("q1", "other-bucket")):
+        api = FakeApi()
+        QueueUploader(api, queue_id, bucket, queue_dir).upload()
+        assert len(uploaded_files(api)) == 3
+
+
+def test_stopped_upload_sends_no_batches_or_manifest(queue_dir):
+    stop_event = threading.Event()
+    stop_event.set()
+    api = FakeApi()
+    with pytest.raises(Exception, match="Upload cancelled"):
+        QueueUploader(api, "q1", "bucket", queue_dir).upload(stop_event=stop_event)
+    assert api.uploads == []
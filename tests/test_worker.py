@@ -0,0 +1,56 @@
+import asyncio
+
+import local_workflow
+import worker
+
+
+class FakeQueue:
+    """Job queue that refuses every lease renewal and records what the worker writes"""
+
+    def __init__(self):
+        self.events = []
+        self.outcomes = []
+
+    def heartbeat(self, task_id, worker_id, lease_seconds=None):
+        return False
+
+    def update(self, task_id, **fields):
+        pass
+
+    def add_events(self, task_id, events):
+        self.events.extend(event["type"] for event in events)
+
+    def complete(self, task_id, worker_id, result, queue_id=None, progress=None):
+        self.outcomes.append("completed")
+
+    def fail(self, task_id, worker_id, error):
+        self.outcomes.append("failed")
+
+
+class SlowController:
+    finished = False
+
+    def check_saved_session(self):
+        return True
+
+    async def run_local_workflow_async(self, username, **kwargs):
+        await asyncio.sleep(10)
+        SlowController.finished = True
+        return {"queue_id": "q1"}
+
+
+def test_lost_lease_cancels_the_job(monkeypatch):
+    monkeypatch.setattr(worker, "JOB_LEASE_SECONDS", 1)
+    monkeypatch.setattr(worker, "_export_metrics", lambda: asyncio.sleep(0))
+    monkeypatch.setattr(local_workflow, "LocalWorkflowController", SlowController)
+    queue = FakeQueue()
+
+    async def main():
+        job = asyncio.create_task(worker.run_job(queue, {"task_id": "t1", "username": "alice"}, "w1"))
+        await asyncio.wait_for(job, timeout=5)
+
+    asyncio.run(main())
+    assert not SlowController.finished
+    # The job belongs to whoever holds the lease now: this worker must not finish it
+    assert queue.outcomes == []
+    assert queue.events == ["job_started", "error"]
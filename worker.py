@@ -0,0 +1,338 @@
+"""
+Worker processes that run queued scraping tasks.
+
+Each worker process claims jobs from the durable job queue and runs the local
+workflow for them, up to WORKER_CONCURRENCY at a time on its own browser pool.
+Admitted jobs share the process's workflow pipeline, so their scrape and cloud
+stages overlap. While a job runs, its lease is renewed in the background and
+its progress events are written to the queue's event log in small batches.
+A job whose lease is lost (it expired and was requeued) is cancelled.
+Each worker writes its metrics to METRICS_DIR every METRICS_EXPORT_INTERVAL
+and after every job, where the web process's /metrics endpoint reads them.
+
+WorkerPool starts WORKER_PROCESSES workers and watches them: when one dies,
+its jobs are put back in the queue and a replacement is started.
+
+Run standalone with `python worker.py`, or let app.py start the pool
+(START_WORKERS=true, the default).
+"""
+import asyncio
+import atexit
+import multiprocessing
+import os
+import socket
+import threading
+import time
+
+from job_queue import get_job_queue, JOB_LEASE_SECONDS
+from scrape_events import observe, emit
+from metrics import write_process_metrics, clear_process_metrics, METRICS_EXPORT_INTERVAL
+
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "2"))
+# Jobs admitted per worker; the workflow pipeline's per-stage workers bound what runs at once
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "4"))
+WORKER_POLL_INTERVAL = float(os.getenv("WORKER_POLL_INTERVAL", "1.0"))
+# Seconds between writes of buffered progress events to the queue
+EVENT_FLUSH_INTERVAL = float(os.getenv("EVENT_FLUSH_INTERVAL", "0.5"))
+
+
+class JobEventRecorder:
+    """Event observer that buffers a job's events and writes them to the job queue in batches"""
+
+    def __init__(self, queue, task_id, interval=None):
+        self.queue = queue
+        self.task_id = task_id
+        self.interval = interval or EVENT_FLUSH_INTERVAL
+        self._buffer = []
+        self._lock = threading.Lock()  # events arrive from the browser pool and upload threads too
+
+    def __call__(self, event):
+        with self._lock:
+            self._buffer.append(event)
+
+    async def flush(self):
+        with self._lock:
+            events, self._buffer = self._buffer, []
+        if not events:
+            return
+        try:
+            await asyncio.to_thread(self.queue.add_events, self.task_id, events)
+        except Exception as e:
+            print(f"⚠️  Could not record {len(events)} events for task {self.task_id}: {str(e)}")
+        # Keep the coarse progress string useful for clients that still poll
+        fields = {}
+        stages = [event["stage"] for event in events if event["type"] == "stage_started"]
+        if stages:
+            fields["progress"] = f"Running {stages[-1]}..."
+        # Record the queue as soon as it exists, so a retried attempt can reuse its directory
+        queue_ids = [event["queue_id"] for event in events if event["type"] == "queue_created"]
+        if queue_ids:
+            fields["queue_id"] = queue_ids[-1]
+        if fields:
+            try:
+                await asyncio.to_thread(self.queue.update, self.task_id, **fields)
+            except Exception:
+                pass
+
+    async def run(self):
+        """Flush buffered events every interval until cancelled"""
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+
+async def _keep_lease(queue, task_id, worker_id, job_task):
+    """
+    Renew a job's lease until cancelled
+
+    When the lease is lost (it expired and the job was requeued to another worker),
+    job_task is cancelled so the job doesn't run twice. Returns True in that case.
+    """
+    interval = max(1.0, JOB_LEASE_SECONDS / 3)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if not await asyncio.to_thread(queue.heartbeat, task_id, worker_id):
+                print(f"⚠️  Worker {worker_id}: lost the lease on task {task_id}, cancelling it")
+                job_task.cancel()
+                return True
+        except Exception as e:
+            print(f"⚠️  Worker {worker_id}: heartbeat failed for task {task_id}: {str(e)}")
+
+
+async def _export_metrics():
+    """Write this process's metrics file now; returns quietly on failure"""
+    try:
+        await asyncio.to_thread(write_process_metrics)
+    except Exception as e:
+        print(f"⚠️  Could not write metrics: {str(e)}")
+
+
+async def _keep_exporting_metrics():
+    """Write this process's metrics file every METRICS_EXPORT_INTERVAL until cancelled"""
+    while True:
+        await asyncio.sleep(METRICS_EXPORT_INTERVAL)
+        await _export_metrics()
+
+
+async def run_job(queue, job, worker_id):
+    """Run the local workflow for a claimed job and record the outcome"""
+    from local_workflow import LocalWorkflowController
+
+    task_id = job["task_id"]
+    username = job["username"]
+    payload = job.get("payload") or {}
+    lease = asyncio.create_task(_keep_lease(queue, task_id, worker_id, asyncio.current_task()))
+    recorder = JobEventRecorder(queue, task_id)
+    flusher = asyncio.create_task(recorder.run())
+
+    async def finish(status, outcome, *args, **kwargs):
+        # Every event is in the log before the job is marked finished
+        emit("job_finished", status=status)
+        flusher.cancel()
+        await recorder.flush()
+        await asyncio.to_thread(outcome, task_id, worker_id, *args, **kwargs)
+
+    try:
+        with observe(recorder):
+            emit("job_started", username=username, worker_id=worker_id, attempt=job.get("attempts"))
+            controller = LocalWorkflowController()
+
+            # Check if saved session exists
+            if not controller.check_saved_session():
+                await finish("failed", queue.fail, "No saved login session found. Please login first.")
+                return
+
+            await asyncio.to_thread(queue.update, task_id, progress="Using saved session to scrape profile...")
+            result = await controller.run_local_workflow_async(
+                username,
+                max_competitors=payload.get("max_competitors"),
+                competitor_concurrency=payload.get("competitor_concurrency"),
+                force_refresh=payload.get("force_refresh", False),
+                # Set when an earlier attempt of this job got as far as creating its queue
+                queue_id=job.get("queue_id")
+            )
+
+            if result:
+                # Extract queue_id from the result
+                queue_id = result.get('queue_id', None)
+                await finish(
+                    "completed", queue.complete,
+                    {
+                        "username": username,
+                        "queue_id": queue_id,
+                        "analysis_complete": True,
+                        "sector": result.get('sector_analysis', {}).get('sector', 'Unknown'),
+                        "competitors_found": len(result.get('competitors', [])),
+                        "cache_age_seconds": result.get('profile_cache_ages', {}).get(username),
+                        "profile_cache_ages": result.get('profile_cache_ages', {}),
+                        "stage_timings": result.get('stage_timings', {}),
+                        "metrics": result.get('metrics', {}),
+                        "timestamp": result.get('timestamp')
+                    },
+                    queue_id=queue_id,
+                    progress=f"Scraping completed successfully - Queue ID: {queue_id}"
+                )
+            else:
+                await finish("failed", queue.fail, "Scraping failed - check logs for details")
+    except asyncio.CancelledError:
+        if not (lease.done() and not lease.cancelled() and lease.result()):
+            raise
+        # The job belongs to another worker now; only record why this run stopped
+        with observe(recorder):
+            emit("error", message=f"Worker {worker_id} lost the job's lease; run cancelled")
+        flusher.cancel()
+        await recorder.flush()
+    except Exception as e:
+        with observe(recorder):
+            emit("error", message=str(e))
+        flusher.cancel()
+        await recorder.flush()
+        await asyncio.to_thread(queue.fail, task_id, worker_id, str(e))
+    finally:
+        lease.cancel()
+        flusher.cancel()
+        await _export_metrics()
+
+
+async def worker_loop(worker_id, concurrency=None, stop_event=None):
+    """Claim and run jobs until stop_event is set"""
+    queue = get_job_queue()
+    slots = asyncio.Semaphore(max(1, concurrency or WORKER_CONCURRENCY))
+    running = set()
+    exporter = asyncio.create_task(_keep_exporting_metrics())
+    print(f"👷 Worker {worker_id} started (pid {os.getpid()})")
+
+    while not (stop_event and stop_event.is_set()):
+        await slots.acquire()
+        try:
+            job = await asyncio.to_thread(queue.claim, worker_id)
+        except Exception as e:
+            print(f"⚠️  Worker {worker_id}: could not claim a job: {str(e)}")
+            job = None
+        if job is None:
+            slots.release()
+            await asyncio.sleep(WORKER_POLL_INTERVAL)
+            continue
+
+        print(f"🚀 Worker {worker_id}: running task {job['task_id']} (@{job['username']})")
+        task = asyncio.create_task(run_job(queue, job, worker_id))
+        running.add(task)
+        task.add_done_callback(running.discard)
+        task.add_done_callback(lambda _: slots.release())
+
+    if running:
+        await asyncio.gather(*running, return_exceptions=True)
+    exporter.cancel()
+    await _export_metrics()
+
+
+def worker_id_for(slot):
+    return f"{socket.gethostname()}-{slot}-{os.getpid()}"
+
+
+def run_worker(slot, stop_event=None):
+    """Entry point of a worker process"""
+    from browser_pool import close_browser_pool
+    from image_downloader import close_image_downloader
+    from image_processing import close_image_processor
+
+    try:
+        asyncio.run(worker_loop(worker_id_for(slot), stop_event=stop_event))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close_browser_pool()
+        close_image_downloader()
+        close_image_processor()
+
+
+class WorkerPool:
+    def __init__(self, size=None, check_interval=5.0):
+        """
+        Args:
+            size: Number of worker processes (env WORKER_PROCESSES, default 2)
+            check_interval: Seconds between liveness checks of the workers
+        """
+        self.size = size or WORKER_PROCESSES
+        self.check_interval = check_interval
+        # Spawn rather than fork: the parent may already run threads (uvicorn, browser pool)
+        self._mp = multiprocessing.get_context("spawn")
+        self._stop_event = self._mp.Event()
+        self._processes = {}  # slot -> Process
+        self._monitor = None
+        self._stopping = threading.Event()
+
+    def _spawn(self, slot):
+        # Not daemonic: a daemonic process can't start children, and workers run image processing in a
+        # process pool. stop() (also run at exit) joins them and terminates stragglers instead.
+        process = self._mp.Process(target=run_worker, args=(slot, self._stop_event),
+                                   name=f"scrape-worker-{slot}", daemon=False)
+        process.start()
+        self._processes[slot] = process
+
+    def start(self):
+        queue = get_job_queue()
+        requeued = queue.requeue_expired()
+        if requeued:
+            print(f"♻️  Requeued {requeued} jobs whose worker lease expired")
+        # Counters start from zero with a new pool rather than summing files of long-gone workers
+        clear_process_metrics()
+        for slot in range(self.size):
+            self._spawn(slot)
+        # Otherwise an interpreter exit without stop() would wait on the non-daemonic workers forever
+        atexit.register(self.stop)
+        self._monitor = threading.Thread(target=self._watch, name="worker-pool-monitor", daemon=True)
+        self._monitor.start()
+
+    def _watch(self):
+        queue = get_job_queue()
+        while not self._stopping.wait(self.check_interval):
+            for slot, process in list(self._processes.items()):
+                if process.is_alive():
+                    continue
+                dead_worker_id = f"{socket.gethostname()}-{slot}-{process.pid}"
+                try:
+                    requeued = queue.requeue_worker(dead_worker_id)
+                except Exception as e:
+                    print(f"⚠️  Could not requeue jobs of worker {dead_worker_id}: {str(e)}")
+                    requeued = 0
+                print(f"💀 Worker {dead_worker_id} exited ({process.exitcode}); requeued {requeued} jobs, restarting")
+                self._spawn(slot)
+            try:
+                queue.requeue_expired()
+            except Exception as e:
+                print(f"⚠️  Lease check failed: {str(e)}")
+
+    def stop(self, timeout=30):
+        """Let workers finish their current jobs, then stop them"""
+        self._stopping.set()
+        self._stop_event.set()
+        for process in self._processes.values():
+            process.join(timeout=timeout)
+            if process.is_alive():
+                process.terminate()
+        self._processes = {}
+
+    def alive(self):
+        return sum(1 for process in self._processes.values() if process.is_alive())
+
+
+def main():
+    from dotenv import load_dotenv
+    load_dotenv()
+
+    pool = WorkerPool()
+    pool.start()
+    print(f"👷 Worker pool running {pool.size} workers (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping workers...")
+    finally:
+        pool.stop()
+
+
+if __name__ == "__main__":
+    main()